@@ -45,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include the other middleware
+    "coursework.metrics.MetricsMiddleware",
+    "coursework.profiling.SlowRequestProfiler",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -58,7 +61,8 @@ ROOT_URLCONF = "SEA.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django templates, timed for the request metrics
+        "BACKEND": "coursework.metrics.TimedDjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -67,6 +71,8 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "coursework.context_processors.joined_courseworks",
+                "coursework.context_processors.request_count_stream",
             ],
         },
     },
@@ -74,6 +80,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "SEA.wsgi.application"
 
+ASGI_APPLICATION = "SEA.asgi.application"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
@@ -82,8 +90,46 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Wait up to 20 seconds for the write lock instead of failing with "database is locked"
+            "timeout": 20,
+            # Take the write lock when the transaction starts, a read lock can't be upgraded once another writer holds it
+            "transaction_mode": "IMMEDIATE",
+            # Run on every new connection:
+            # WAL lets readers go on while the upload writer commits,
+            # NORMAL only syncs at checkpoints, which is still safe with WAL,
+            # 256 MiB of the file memory-mapped and 64 MiB of page cache
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA cache_size=-65536;"
+            ),
+        },
+        # On disk rather than in memory, so concurrent requests wait for the write lock as in production
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    }
+}
+
+
+# Cache
+# Holds the joined courseworks of each user & the per-TA coursework request
+# counters. Local memory is per process, set CACHE_REDIS_URL (and install
+# redis) to share one cache between processes & nodes
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     }
 }
+if os.environ.get("CACHE_REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["CACHE_REDIS_URL"],
+    }
+
+# Seconds a cached membership or request counter is trusted, how long other processes may miss a change
+MEMBERSHIP_CACHE_TIMEOUT = 60
+REQUEST_COUNT_CACHE_TIMEOUT = 60
 
 
 # Password validation
@@ -124,6 +170,10 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_FROM_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 EMAIL_USE_TLS = True
 EMAIL_PORT = 587
+# Threads sending queued emails, each reusing its SMTP connection
+EMAIL_DISPATCHER_WORKERS = 2
+# Seconds during which activation emails to the same user are coalesced
+EMAIL_ACTIVATION_COOLDOWN = 300
 
 
 # Static files (CSS, JavaScript, Images)
@@ -140,3 +190,71 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # MEDIA
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
+
+# Let the front proxy send media files: None, "X-Accel-Redirect" (nginx) or "X-Sendfile" (Apache)
+MEDIA_ACCEL_HEADER = None
+# Internal nginx location aliased to MEDIA_ROOT, used with X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = "/protected-media/"
+
+
+# SUBMISSION STORAGE
+# Uploads, previews & result archives: local disk by default, an S3-compatible
+# bucket when SUBMISSION_STORAGE_BUCKET is set, required to run more than one node
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "submissions": {
+        "BACKEND": "coursework.storage.LocalStorage",
+    },
+}
+if os.environ.get("SUBMISSION_STORAGE_BUCKET"):
+    STORAGES["submissions"] = {
+        "BACKEND": "coursework.storage.S3Storage",
+        "OPTIONS": {
+            "endpoint_url": os.environ["SUBMISSION_STORAGE_ENDPOINT"],
+            "bucket": os.environ["SUBMISSION_STORAGE_BUCKET"],
+            "access_key": os.environ["SUBMISSION_STORAGE_ACCESS_KEY"],
+            "secret_key": os.environ["SUBMISSION_STORAGE_SECRET_KEY"],
+            "region": os.environ.get("SUBMISSION_STORAGE_REGION", "us-east-1"),
+        },
+    }
+
+
+# RESULT ARCHIVE
+# Threads compressing large members, None means one per CPU
+RESULT_ARCHIVE_WORKERS = None
+
+
+# METRICS
+# Addresses allowed to scrape /metrics without logging in as staff
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+
+# SLOW REQUEST PROFILER
+# Profile a share of the requests & keep a report of those slower than the threshold (seconds)
+SLOW_REQUEST_PROFILING = os.environ.get("SLOW_REQUEST_PROFILING") == "1"
+SLOW_REQUEST_SAMPLE_RATE = 0.1
+SLOW_REQUEST_THRESHOLD = 1.0
+# Reports, browsable from the admin, the oldest go beyond SLOW_REQUEST_KEEP
+SLOW_REQUEST_DIR = os.path.join(BASE_DIR, "profiles")
+SLOW_REQUEST_KEEP = 200
+
+
+# ACCOUNT PROVISIONING
+# Seconds the emailed link to set the password of a bulk created account stays valid
+PASSWORD_RESET_TIMEOUT = 7 * 24 * 60 * 60
+
+
+# CHUNKED UPLOAD
+# Partially uploaded files, keep on the same disk as MEDIA_ROOT
+UPLOAD_STAGING_DIR = os.path.join(BASE_DIR, "staging")
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+# Largest file accepted & unfinished uploads a student may keep per assignment
+UPLOAD_MAX_SIZE = 1024 * 1024 * 1024
+UPLOAD_SESSION_LIMIT = 10
+# Seconds after which an unfinished upload expires, removed by `manage.py expire_upload_sessions`
+UPLOAD_SESSION_EXPIRES = 24 * 60 * 60
@@ -13,10 +13,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from coursework.admin import slow_requests
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
+    path('admin/slow-requests/', admin.site.admin_view(slow_requests), name="slow_requests"),
+    path('admin/slow-requests/<name>', admin.site.admin_view(slow_requests), name="slow_request"),
     path('admin/', admin.site.urls),
     path("", include("coursework.urls"))
 ]
@@ -1,5 +1,38 @@
 from .models import Assignment, AssignmentStatus, Course, Coursework, JoinCourseworkRequest, StudentList, UploadFile, User
-from django.contrib import admin
+from django.contrib.sites.shortcuts import get_current_site
+from .provisioning import BATCH_SIZE, provision_accounts
+from django.template.response import TemplateResponse
+from django.http import Http404, HttpResponseRedirect
+from .uploads import delete_statuses, delete_uploads
+from django.core.exceptions import PermissionDenied
+from .profiling import list_reports, load_report
+from .roster import RosterError, import_roster
+from django.contrib import admin, messages
+from django.urls import path, reverse
+import codecs
+
+
+class CourseworkFilter(admin.SimpleListFilter):
+    """Filter on coursework, all of them listed with a single query."""
+
+    title = "coursework"
+    parameter_name = "coursework"
+
+    # Lookup from the listed model to its coursework
+    field_path = "coursework"
+
+    def lookups(self, request, model_admin):
+        return [
+            (coursework.id, str(coursework))
+            for coursework in Coursework.objects.select_related("course")]
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(**{self.field_path: self.value()})
+
+
+def coursework_filter(field_path):
+    return type("CourseworkFilter", (CourseworkFilter,), {"field_path": field_path})
 
 
 class UserDisplay(admin.ModelAdmin):
@@ -11,31 +44,175 @@ class UserDisplay(admin.ModelAdmin):
         "status",
         "is_staff",
         "is_email_verified")
+    list_filter = ("status", "is_staff", "is_email_verified")
+    search_fields = ("username", "email", "last_name", "first_name")
+
+
+class CourseAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
+
+
+class CourseworkAdmin(admin.ModelAdmin):
+    search_fields = ("course__name",)
+    autocomplete_fields = ("course", "taken_person")
+
+    def get_queryset(self, request):
+        # Named after their course, also in autocomplete results
+        return super().get_queryset(request).select_related("course")
 
 
 class StudentListAdmin(admin.ModelAdmin):
     display = ("student_id", "last_name", "first_name")
     list_display = display
     search_fields = display
+    actions = ["create_accounts"]
+
+    @admin.action(description="Create accounts for selected students")
+    def create_accounts(self, request, queryset):
+        counts = provision_accounts(
+            queryset.iterator(chunk_size=BATCH_SIZE),
+            get_current_site(request).domain)
+        messages.success(
+            request,
+            "Created: {created}, already registered: {skipped}".format(**counts))
+
+    def get_urls(self):
+        return [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="coursework_studentlist_import")
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+
+        if request.method == "POST" and "roster" in request.FILES:
+            # Decoded line by line, the upload is never read whole
+            lines = codecs.iterdecode(request.FILES["roster"], "utf-8-sig")
+            try:
+                counts = import_roster(lines)
+
+            except (UnicodeDecodeError, RosterError) as error:
+                messages.error(request, f"Nothing imported: {error}")
+
+            else:
+                messages.success(
+                    request,
+                    "Inserted: {inserted}, updated: {updated}, unchanged: {unchanged}".format(**counts))
+                return HttpResponseRedirect(reverse("admin:coursework_studentlist_changelist"))
+
+        return TemplateResponse(request, "admin/coursework/studentlist/import.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import CSV"})
 
 
 class AssignmentAdmin(admin.ModelAdmin):
     list_display = ("title", "coursework", "created_on", "deadline")
+    list_select_related = ("coursework__course",)
+    list_filter = (coursework_filter("coursework"), "deadline")
+    search_fields = ("title", "coursework__course__name")
+    autocomplete_fields = ("coursework",)
 
 
 class AssignmentStatusAdmin(admin.ModelAdmin):
     list_display = ("assignment", "student", "memo")
+    list_filter = (coursework_filter("assignment__coursework"), "assignment__deadline")
+    search_fields = ("student__username", "assignment__title")
+    autocomplete_fields = ("assignment", "student")
+    actions = ["delete_submissions"]
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Named after their student & assignment, also in autocomplete results
+        return super().get_queryset(request).select_related("assignment", "student")
+
+    def get_actions(self, request):
+        # Deleting the rows alone would leave blobs referenced & files behind
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description="Delete selected submissions and their files", permissions=["delete"])
+    def delete_submissions(self, request, queryset):
+        count = queryset.count()
+        uploads = delete_statuses(queryset)
+        messages.success(request, f"Deleted {count} submissions and {uploads} files.")
+
+
+class UploadFileAdmin(admin.ModelAdmin):
+    list_display = ("display_name", "student", "assignment_title", "coursework", "size", "created_on")
+    list_select_related = ("assignment__student", "assignment__assignment__coursework__course")
+    list_filter = (coursework_filter("assignment__assignment__coursework"), "created_on")
+    search_fields = ("display_name", "assignment__student__username", "checksum")
+    autocomplete_fields = ("assignment",)
+    raw_id_fields = ("blob",)
+    actions = ["delete_submissions"]
+    ordering = ("-created_on",)
+    show_full_result_count = False
+
+    @admin.display(ordering="assignment__student__username")
+    def student(self, upload):
+        return upload.assignment.student
+
+    @admin.display(description="assignment", ordering="assignment__assignment__title")
+    def assignment_title(self, upload):
+        return upload.assignment.assignment
+
+    @admin.display(ordering="assignment__assignment__coursework__course__name")
+    def coursework(self, upload):
+        return upload.assignment.assignment.coursework
+
+    def get_actions(self, request):
+        # Deleting the rows alone would leave blobs referenced & files behind
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description="Delete selected submissions and their files", permissions=["delete"])
+    def delete_submissions(self, request, queryset):
+        messages.success(request, f"Deleted {delete_uploads(queryset)} files.")
 
 
 class JoinCourseworkRequestAdmin(admin.ModelAdmin):
-    list_display = ("student", "coursework")
+    list_display = ("student", "coursework", "created_on")
+    list_select_related = ("student", "coursework__course")
+    list_filter = (coursework_filter("coursework"), "created_on")
+    search_fields = ("student__username",)
+    autocomplete_fields = ("student", "coursework")
+    ordering = ("-created_on",)
+
+
+def slow_requests(request, name=None):
+    """Reports of the slow request profiler, which may show anyone's data."""
+    if not request.user.is_superuser:
+        raise PermissionDenied
+
+    context = {**admin.site.each_context(request), "title": "Slow requests"}
+
+    if name is None:
+        return TemplateResponse(request, "admin/slow_requests.html", {
+            **context,
+            "reports": [{"name": name, **load_report(name)} for name in list_reports()]})
+
+    try:
+        report = load_report(name)
+    except (FileNotFoundError, ValueError):
+        raise Http404("Report not found.")
+
+    return TemplateResponse(request, "admin/slow_request.html", {
+        **context,
+        "report": report,
+        "subtitle": f"{report['method']} {report['path']}"})
 
 
 admin.site.register(Assignment, AssignmentAdmin)
 admin.site.register(AssignmentStatus, AssignmentStatusAdmin)
-admin.site.register(Course)
-admin.site.register(Coursework)
+admin.site.register(Course, CourseAdmin)
+admin.site.register(Coursework, CourseworkAdmin)
 admin.site.register(JoinCourseworkRequest, JoinCourseworkRequestAdmin)
 admin.site.register(StudentList, StudentListAdmin)
-admin.site.register(UploadFile)
+admin.site.register(UploadFile, UploadFileAdmin)
 admin.site.register(User, UserDisplay)
@@ -0,0 +1,350 @@
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.base import ContentFile
+from .models import Assignment, UploadFile
+from .compression import compress_file
+from .metrics import archive_duration
+from contextlib import contextmanager
+from django.core.files import File
+from django.conf import settings
+from django.db.models import Q
+from collections import deque
+import tempfile
+import shutil
+import fcntl
+import time
+import uuid
+import io
+import os
+
+
+# Size of the pieces read from storage & handed to the response
+CHUNK_SIZE = 64 * 1024
+
+# Formats that are already compressed and only get stored
+STORED_EXTENSIONS = {
+    ".7z", ".aac", ".bz2", ".docx", ".flac", ".gif", ".gz", ".jpeg", ".jpg",
+    ".m4a", ".mkv", ".mov", ".mp3", ".mp4", ".ogg", ".png", ".pptx", ".rar",
+    ".webm", ".webp", ".xlsx", ".xz", ".zip"}
+
+# End of central directory record of an archive without member
+EMPTY_ZIP = b"PK\x05\x06" + bytes(18)
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file object collecting what ZipFile writes."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def archive_name(upload, used):
+    """Name of an uploaded file inside the archive, unique within `used`."""
+    name = os.path.basename(upload.display_name or upload.file.name)
+    root, ext = os.path.splitext(name)
+    counter = 1
+    while name in used:
+        name = f"{root}_{counter}{ext}"
+        counter += 1
+    used.add(name)
+    return name
+
+
+def assignment_files(assignment):
+    """Every uploaded file of an assignment, fetched without caching rows."""
+    return (
+        UploadFile.objects
+        .filter(assignment__assignment=assignment)
+        .exclude(file="")
+        .only("id", "file", "display_name", "created_on")
+        .order_by("display_name")
+        .iterator())
+
+
+def _compress_type(upload):
+    # Compression of an upload's member, going by its extension
+    extension = os.path.splitext(upload.display_name or upload.file.name)[1].lower()
+    return ZIP_STORED if extension in STORED_EXTENSIONS else ZIP_DEFLATED
+
+
+def stream_zip(files):
+    """Yield a ZIP archive of `files` piece by piece.
+
+    The archive is written to an unseekable buffer (ZipFile then uses data
+    descriptors), so nothing touches the disk and memory stays bounded by
+    CHUNK_SIZE whatever the number or size of the members. Formats that
+    are already compressed are stored as they are.
+    """
+    buffer = _StreamBuffer()
+    used = set()
+    start = time.perf_counter()
+
+    with ZipFile(buffer, "w") as zip_file:
+        for upload in files:
+            zip_info = ZipInfo(
+                archive_name(upload, used),
+                time.localtime(upload.created_on.timestamp())[:6])
+            zip_info.compress_type = _compress_type(upload)
+            zip_info.external_attr = 0o644 << 16
+
+            with upload.file.open("rb") as source, \
+                    zip_file.open(zip_info, "w", force_zip64=True) as member:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    member.write(chunk)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+
+    # Central directory
+    yield from buffer.drain()
+    archive_duration.observe("stream", time.perf_counter() - start)
+
+
+def _write_raw(zip_file, zip_info, source):
+    """Append a member whose data in `source` is already in its final form."""
+    zip_info.header_offset = zip_file.start_dir
+    zip_file.fp.seek(zip_file.start_dir)
+    zip_file.fp.write(zip_info.FileHeader())
+    shutil.copyfileobj(source, zip_file.fp, CHUNK_SIZE)
+
+    # Register the member so it lands in the central directory on close
+    zip_file.filelist.append(zip_info)
+    zip_file.NameToInfo[zip_info.filename] = zip_info
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file._didModify = True
+
+
+def _copy_members(old_zip, new_zip, members):
+    """Copy `members` of `old_zip` into `new_zip` byte for byte.
+
+    Nothing gets recompressed, only the header offsets change.
+    """
+    copied = {info.filename for info in members}
+
+    # Every member spans from its header to the next header
+    ordered = sorted(old_zip.infolist(), key=lambda info: info.header_offset)
+    ends = [info.header_offset for info in ordered[1:]] + [old_zip.start_dir]
+
+    for info, end in zip(ordered, ends):
+        if info.filename not in copied:
+            continue
+
+        old_zip.fp.seek(info.header_offset)
+        info.header_offset = new_zip.start_dir
+        new_zip.fp.seek(new_zip.start_dir)
+        remaining = end - old_zip.fp.tell()
+        while remaining:
+            chunk = old_zip.fp.read(min(CHUNK_SIZE, remaining))
+            new_zip.fp.write(chunk)
+            remaining -= len(chunk)
+
+        new_zip.filelist.append(info)
+        new_zip.NameToInfo[info.filename] = info
+        new_zip.start_dir = new_zip.fp.tell()
+        new_zip._didModify = True
+
+
+def _prepare_member(upload):
+    """Read an upload from storage into a temporary file, as member data.
+
+    Returns the compression used, the temporary file & the
+    (CRC-32, compressed size, file size) of the member.
+    """
+    compress_type = _compress_type(upload)
+    data = tempfile.TemporaryFile()
+
+    try:
+        with upload.file.storage.open(upload.file.name, "rb") as source:
+            return compress_type, data, compress_file(source, compress_type, data)
+
+    except BaseException:
+        data.close()
+        raise
+
+
+def _write_member(zip_file, upload, job, used):
+    compress_type, data, (crc, compress_size, file_size) = job.result()
+
+    # Describe the member, the upload it comes from goes in the comment
+    zip_info = ZipInfo(
+        archive_name(upload, used),
+        time.localtime(upload.created_on.timestamp())[:6])
+    zip_info.compress_type = compress_type
+    zip_info.CRC = crc
+    zip_info.compress_size = compress_size
+    zip_info.file_size = file_size
+    zip_info.external_attr = 0o644 << 16
+    zip_info.comment = str(upload.pk).encode()
+
+    with data:
+        data.seek(0)
+        _write_raw(zip_file, zip_info, data)
+
+
+def _append_members(zip_file, added, used):
+    """Compress the `added` uploads & append them to `zip_file`.
+
+    Members are fetched & compressed concurrently by a thread pool, formats
+    that are already compressed are stored as they are. At most two members
+    per worker wait in temporary files to be written.
+    """
+    workers = settings.RESULT_ARCHIVE_WORKERS or os.cpu_count() or 1
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for upload in added:
+            pending.append((upload, pool.submit(_prepare_member, upload)))
+            if len(pending) >= 2 * workers:
+                _write_member(zip_file, *pending.popleft(), used)
+
+        while pending:
+            _write_member(zip_file, *pending.popleft(), used)
+
+
+def _swap_archive(assignment, old_name, new_name):
+    """Point the assignment to the new archive unless another sync did first."""
+    current = Assignment.objects.filter(pk=assignment.pk)
+    if old_name:
+        current = current.filter(result_zip_file=old_name)
+    else:
+        current = current.filter(Q(result_zip_file__isnull=True) | Q(result_zip_file=""))
+
+    storage = assignment.result_zip_file.storage
+    if current.update(result_zip_file=new_name):
+        if old_name:
+            storage.delete(old_name)
+        assignment.result_zip_file.name = new_name
+
+    else:
+        storage.delete(new_name)
+        assignment.refresh_from_db(fields=["result_zip_file"])
+
+
+def _is_local(storage):
+    # Only storages with paths on disk let files be changed where they lie
+    try:
+        storage.path("")
+    except NotImplementedError:
+        return False
+    return True
+
+
+@contextmanager
+def _archive_lock(assignment):
+    """Hold the lock of the assignment's archive, one sync at a time across processes."""
+    directory = assignment.result_zip_file.storage.path(assignment.storage_prefix)
+    os.makedirs(directory, exist_ok=True)
+
+    # Released when the lock file is closed
+    with open(os.path.join(directory, "result.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _sync_local(assignment, uploads):
+    """Write the updated archive into a copy which then replaces the old one.
+
+    Without removals the old archive is copied as is & the added members
+    appended to the copy. Requests still sending the old archive keep
+    reading it until they are done.
+    """
+    storage = assignment.result_zip_file.storage
+
+    # Start from an empty archive the first time
+    if not assignment.result_zip_file:
+        _swap_archive(assignment, None, storage.save(
+            os.path.join(assignment.storage_prefix, "result.zip"),
+            ContentFile(EMPTY_ZIP)))
+
+    # Members are matched to uploads through their comment
+    path = assignment.result_zip_file.path
+    with ZipFile(path) as zip_file:
+        members = zip_file.infolist()
+
+    kept = {info.comment.decode(): info for info in members if info.comment.decode() in uploads}
+    added = [upload for source, upload in uploads.items() if source not in kept]
+    if not added and len(kept) == len(members):
+        return
+
+    fd, temp_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(path))
+    os.close(fd)
+
+    try:
+        used = {info.filename for info in kept.values()}
+        if len(kept) == len(members):
+            shutil.copyfile(path, temp_path)
+            with ZipFile(temp_path, "a") as new_zip:
+                _append_members(new_zip, added, used)
+        else:
+            with ZipFile(path) as old_zip, ZipFile(temp_path, "w") as new_zip:
+                _copy_members(old_zip, new_zip, kept.values())
+                _append_members(new_zip, added, used)
+
+        os.chmod(temp_path, storage.file_permissions_mode or 0o644)
+        os.replace(temp_path, path)
+
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _sync_stored(assignment, uploads):
+    """Write the updated archive next to the old one, objects can't be appended to."""
+    old_name = assignment.result_zip_file.name or None
+
+    # Start from an empty archive the first time
+    if old_name:
+        old_file = assignment.result_zip_file.storage.open(old_name, "rb")
+    else:
+        old_file = io.BytesIO(EMPTY_ZIP)
+
+    with old_file, ZipFile(old_file) as old_zip, tempfile.TemporaryFile() as archive:
+        # Members are matched to uploads through their comment
+        members = old_zip.infolist()
+        kept = {info.comment.decode(): info for info in members if info.comment.decode() in uploads}
+        added = [upload for source, upload in uploads.items() if source not in kept]
+
+        if old_name and not added and len(kept) == len(members):
+            return
+
+        with ZipFile(archive, "w") as new_zip:
+            _copy_members(old_zip, new_zip, kept.values())
+            _append_members(new_zip, added, {info.filename for info in kept.values()})
+
+        new_name = assignment.result_zip_file.storage.save(
+            os.path.join(assignment.storage_prefix, f"result-{uuid.uuid4().hex[:12]}.zip"),
+            File(archive))
+
+    _swap_archive(assignment, old_name, new_name)
+
+
+def sync_result_archive(assignment):
+    """Bring the result archive of an assignment in line with its uploads.
+
+    Only the members whose upload was added or deleted since the last sync
+    are compressed or dropped, the others are copied as they are. On local
+    disk syncs take turns & the updated copy replaces the archive at once.
+    On object stores the new archive is written next to the old one, so
+    any node can sync while others still serve the previous version.
+    """
+    start = time.perf_counter()
+
+    if _is_local(assignment.result_zip_file.storage):
+        # Uploads are listed once the lock is held, a sync that waited sees what the other did
+        with _archive_lock(assignment):
+            assignment.refresh_from_db(fields=["result_zip_file"])
+            _sync_local(assignment, {str(upload.pk): upload for upload in assignment_files(assignment)})
+    else:
+        _sync_stored(assignment, {str(upload.pk): upload for upload in assignment_files(assignment)})
+
+    archive_duration.observe("sync", time.perf_counter() - start)
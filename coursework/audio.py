@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.core.files import File
+from .models import UploadFile
+import numpy as np
+import tempfile
+import struct
+import wave
+import math
+
+
+# Number of bars of the waveform drawn on the result page
+PEAK_COUNT = 800
+
+# Sample rate of the mono previews
+PREVIEW_RATE = 8000
+
+# Frames decoded at once, bounds the memory used per analysis
+BLOCK_FRAMES = 256 * 1024
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Analyses run in the background, a few at a time
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="wav-analysis")
+
+
+def read_wav_header(file):
+    """Walk the RIFF chunks up to the audio data without reading it.
+
+    Returns the format description with the data size, leaving `file`
+    positioned at the first sample. Raises ValueError for anything
+    that isn't a PCM or float WAV.
+    """
+    riff, _, wave_id = struct.unpack("<4sI4s", file.read(12))
+    if riff != b"RIFF" or wave_id != b"WAVE":
+        raise ValueError("Not a WAV file.")
+
+    header = None
+    while True:
+        chunk = file.read(8)
+        if len(chunk) < 8:
+            raise ValueError("No audio data.")
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+
+        if chunk_id == b"fmt ":
+            fmt = file.read(chunk_size + chunk_size % 2)
+            audio_format, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                audio_format = struct.unpack("<H", fmt[24:26])[0]
+            header = {
+                "format": audio_format,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "block_align": block_align,
+                "bits": bits}
+
+        elif chunk_id == b"data":
+            if header is None:
+                raise ValueError("No format description.")
+            if header["format"] not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) or not header["block_align"]:
+                raise ValueError("Unsupported WAV encoding.")
+            header["data_size"] = chunk_size
+            header["frames"] = chunk_size // header["block_align"]
+            return header
+
+        else:
+            file.seek(chunk_size + chunk_size % 2, 1)
+
+
+def decode(data, header):
+    """Turn raw frames into a (frames, channels) float array in [-1, 1]."""
+    bits = header["bits"]
+    channels = header["channels"]
+    data = data[:len(data) - len(data) % header["block_align"]]
+
+    if header["format"] == WAVE_FORMAT_IEEE_FLOAT:
+        samples = np.frombuffer(data, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif bits == 8:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif bits == 24:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8
+        samples = samples.astype(np.float32) / 2 ** 23
+    else:
+        samples = np.frombuffer(data, dtype=f"<i{bits // 8}").astype(np.float32) / 2 ** (bits - 1)
+
+    return samples.reshape(-1, channels)
+
+
+def analyze_wav(source, preview):
+    """Compute the waveform peaks of `source` & write its preview to `preview`.
+
+    Both files are read and written block by block, the preview being a
+    16-bit mono file downsampled to about PREVIEW_RATE.
+    """
+    header = read_wav_header(source)
+    frames = header["frames"]
+    frames_per_peak = max(math.ceil(frames / PEAK_COUNT), 1)
+    factor = max(header["sample_rate"] // PREVIEW_RATE, 1)
+
+    # Whole peaks & whole preview samples fit in every block
+    block_frames = max(BLOCK_FRAMES // (frames_per_peak * factor), 1) * frames_per_peak * factor
+
+    peaks = []
+    with wave.open(preview, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(header["sample_rate"] // factor)
+
+        remaining = frames
+        while remaining:
+            data = source.read(min(block_frames, remaining) * header["block_align"])
+            samples = decode(data, header)
+            if not len(samples):
+                break
+            remaining -= len(samples)
+
+            # Loudest sample of each bar, over all channels
+            loudness = np.abs(samples).max(axis=1)
+            padded = np.pad(loudness, (0, -len(loudness) % frames_per_peak))
+            peaks.extend(padded.reshape(-1, frames_per_peak).max(axis=1).astype(float).round(3).tolist())
+
+            # Mono mix averaged over `factor` frames
+            mono = samples.mean(axis=1)
+            mono = np.pad(mono, (0, -len(mono) % factor), mode="edge").reshape(-1, factor).mean(axis=1)
+            writer.writeframes((np.clip(mono, -1, 1) * 32767).astype("<i2").tobytes())
+
+    return {
+        "duration": frames / header["sample_rate"],
+        "sample_rate": header["sample_rate"],
+        "channels": header["channels"],
+        "peaks": [min(peak, 1.0) for peak in peaks]}
+
+
+def analyze_upload(upload_id):
+    """Store the WAV metadata, peaks & preview of an upload."""
+    try:
+        upload = UploadFile.objects.get(pk=upload_id)
+
+        # Identical content was analyzed already, share its results
+        # Looked up by blob, indexed unlike the checksum, legacy uploads have none
+        analyzed = upload.blob_id and UploadFile.objects.filter(
+            blob_id=upload.blob_id,
+            duration__isnull=False).first()
+
+        if analyzed:
+            upload.duration = analyzed.duration
+            upload.sample_rate = analyzed.sample_rate
+            upload.channels = analyzed.channels
+            upload.peaks = analyzed.peaks
+            upload.preview = analyzed.preview.name
+
+        else:
+            with upload.file.open("rb") as source, tempfile.TemporaryFile() as preview:
+                try:
+                    metadata = analyze_wav(source, preview)
+                except (ValueError, struct.error, EOFError):
+                    return
+
+                for field, value in metadata.items():
+                    setattr(upload, field, value)
+                preview.seek(0)
+                upload.preview.save(
+                    upload.checksum or f"upload-{upload.pk}", File(preview), save=False)
+
+        # Upload may have been deleted meanwhile
+        updated = UploadFile.objects.filter(pk=upload.pk).update(
+            duration=upload.duration,
+            sample_rate=upload.sample_rate,
+            channels=upload.channels,
+            peaks=upload.peaks,
+            preview=upload.preview.name)
+        if not updated and not analyzed:
+            upload.preview.delete(save=False)
+
+    except UploadFile.DoesNotExist:
+        pass
+
+    # Worker threads keep no connection open between analyses
+    finally:
+        connection.close()
+
+
+def schedule_analysis(upload):
+    """Queue the analysis of an uploaded WAV file."""
+    if upload.display_name.lower().endswith(".wav"):
+        executor.submit(analyze_upload, upload.pk)
@@ -0,0 +1,30 @@
+from zipfile import ZIP_DEFLATED
+import zlib
+
+
+# Size of the pieces read from the source file
+CHUNK_SIZE = 1024 * 1024
+
+
+def compress_file(source, compress_type, target):
+    """Write the data of a ZIP member read from `source` into `target`.
+
+    Deflated members become a raw deflate stream as expected inside a ZIP,
+    stored members are copied as they are. zlib releases the GIL, so files
+    are compressed in parallel by threads. Returns a tuple of
+    (CRC-32, compressed size, file size).
+    """
+    crc = 0
+    file_size = 0
+    start = target.tell()
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS) if compress_type == ZIP_DEFLATED else None
+
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        target.write(compressor.compress(chunk) if compressor else chunk)
+    if compressor:
+        target.write(compressor.flush())
+
+    return crc, target.tell() - start, file_size
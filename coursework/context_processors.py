@@ -0,0 +1,19 @@
+from django.core.handlers.asgi import ASGIRequest
+from .membership import user_coursework_ids
+from .models import Coursework
+
+
+def joined_courseworks(request):
+    """Courseworks of the navbar dropdown, with their course in one query."""
+    if not request.user.is_authenticated:
+        return {}
+
+    return {
+        "joined_courseworks": Coursework.objects
+        .filter(pk__in=user_coursework_ids(request.user))
+        .select_related("course")}
+
+
+def request_count_stream(request):
+    """Whether pages hold the request count stream open, only under ASGI where it costs no thread."""
+    return {"request_count_stream": isinstance(request, ASGIRequest)}
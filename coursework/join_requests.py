@@ -0,0 +1,73 @@
+from .notifications import adjust_request_counts, adjusting_batch, forget_request_count
+from .membership import forget_memberships, user_coursework_ids
+from .models import Coursework, JoinCourseworkRequest
+from django.db import transaction
+from collections import Counter
+
+
+# Requests shown per page of the queue
+PAGE_SIZE = 50
+
+
+def pending_requests(user, after=None, page_size=PAGE_SIZE):
+    """A page of the requests to join the courseworks user teaches or assists.
+
+    Pages are keyed on the id of the last request shown, so any page costs
+    the same however deep into the queue. Returns the page & the id to
+    continue after, None on the last page.
+    """
+    requests = (
+        JoinCourseworkRequest.objects
+        .filter(coursework__in=user_coursework_ids(user))
+        .select_related("student", "coursework__course")
+        .order_by("id"))
+    if after is not None:
+        requests = requests.filter(id__gt=after)
+
+    page = list(requests[:page_size + 1])
+    if len(page) > page_size:
+        return page[:page_size], page[page_size - 1].id
+    return page, None
+
+
+def resolve_requests(user, request_ids, accept):
+    """Accept or decline the selected requests of user's courseworks, all or nothing.
+
+    Accepted students are added with a single insert into the membership
+    table. The cached memberships & request counters are updated here in
+    one go, not by the signals for each request. Returns the requests resolved.
+    """
+    with transaction.atomic():
+        requests = list(
+            JoinCourseworkRequest.objects
+            .filter(pk__in=request_ids, coursework__in=user_coursework_ids(user))
+            .select_related("student", "coursework__course")
+            .order_by("id"))
+        if not requests:
+            return requests
+
+        if accept:
+            Membership = Coursework.taken_person.through
+            Membership.objects.bulk_create([
+                Membership(coursework_id=request.coursework_id, user_id=request.student_id)
+                for request in requests],
+                ignore_conflicts=True)
+
+        # The counters get adjusted per coursework once committed, not per request
+        token = adjusting_batch.set(True)
+        try:
+            JoinCourseworkRequest.objects.filter(pk__in=[request.pk for request in requests]).delete()
+        finally:
+            adjusting_batch.reset(token)
+
+        def update_caches():
+            if accept:
+                student_ids = {request.student_id for request in requests}
+                forget_memberships(student_ids)
+                forget_request_count(student_ids)
+            resolved = Counter(request.coursework_id for request in requests)
+            adjust_request_counts({coursework_id: -count for coursework_id, count in resolved.items()})
+
+        transaction.on_commit(update_caches)
+
+    return requests
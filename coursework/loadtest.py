@@ -0,0 +1,270 @@
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from .models import Assignment, Course, Coursework, UploadFile, User
+from django.db.backends.signals import connection_created
+from django.contrib.auth.hashers import make_password
+from concurrent.futures import ThreadPoolExecutor
+from django.core.wsgi import get_wsgi_application
+from django.db.utils import OperationalError
+from django.utils import timezone
+from datetime import timedelta
+import urllib.request
+import http.cookiejar
+import urllib.parse
+import urllib.error
+import statistics
+import threading
+import secrets
+import time
+import json
+import zlib
+import re
+
+
+PREFIX = "loadtest"
+
+PASSWORD = "loadtest-password"
+
+
+class Stats:
+    """Latencies & errors of every step, shared by the client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.lock_waits = []
+        self.locked = 0
+
+    def record(self, step, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(step, []).append(seconds)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+
+    def record_lock(self, seconds=None):
+        with self.lock:
+            if seconds is None:
+                self.locked += 1
+            else:
+                self.lock_waits.append(seconds)
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    """Serve the project from a thread on a free local port, returns (server, URL)."""
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def watch_locks(stats):
+    """Time write lock waits on the connections the server opens.
+
+    With IMMEDIATE transactions, BEGIN blocks until the write lock is free,
+    so its duration is the time spent waiting for other writers.
+    """
+    def lock_probe(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+
+        except OperationalError as error:
+            if "locked" in str(error):
+                stats.record_lock()
+            raise
+
+        finally:
+            if sql.startswith("BEGIN"):
+                stats.record_lock(time.perf_counter() - start)
+
+    def install(sender, connection, **kwargs):
+        if lock_probe not in connection.execute_wrappers:
+            connection.execute_wrappers.append(lock_probe)
+
+    connection_created.connect(install, weak=False)
+    return lambda: connection_created.disconnect(install)
+
+
+def seed(students):
+    """Coursework with an open assignment & `students` verified members."""
+    coursework = Coursework.objects.create(
+        course=Course.objects.create(name=f"{PREFIX}-{secrets.token_hex(4)}"))
+    assignment = Assignment.objects.create(
+        coursework=coursework,
+        title="Deadline rush",
+        deadline=timezone.now() + timedelta(days=1))
+
+    # Same hash for everyone, hashing N passwords isn't what is measured
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(
+            username=f"{PREFIX}-{coursework.id}-{i}",
+            password=password,
+            is_email_verified=True)
+        for i in range(students)])
+    users = list(User.objects.filter(username__startswith=f"{PREFIX}-{coursework.id}-"))
+    coursework.taken_person.add(*users)
+
+    return assignment, [user.username for user in users]
+
+
+def cleanup(assignment):
+    coursework = assignment.coursework
+
+    # One by one, so blobs & files on disk are released
+    for upload in UploadFile.objects.filter(assignment__assignment=assignment).select_related("blob"):
+        upload.delete()
+
+    assignment.status.all().delete()
+    users = list(coursework.taken_person.all())
+    assignment.delete()
+    coursework.delete()
+    coursework.course.delete()
+    User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+
+class Browser:
+    """One student replaying the requests script.js makes."""
+
+    def __init__(self, base_url, stats):
+        self.base_url = base_url
+        self.stats = stats
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def request(self, step, method, path, data=None, headers=None):
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers=headers or {})
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request) as response:
+                body, ok = response.read(), True
+
+        except urllib.error.HTTPError as error:
+            body, ok = error.read(), False
+
+        except OSError:
+            body, ok = b"", False
+
+        self.stats.record(step, time.perf_counter() - start, ok)
+        return ok, body
+
+    def cookie(self, name):
+        return next((cookie.value for cookie in self.cookies if cookie.name == name), "")
+
+    def login(self, username):
+        self.request("login page", "GET", "/login")
+        ok, _ = self.request("login", "POST", "/login", urllib.parse.urlencode({
+            "csrfmiddlewaretoken": self.cookie("csrftoken"),
+            "student-id": username,
+            "password": PASSWORD}).encode())
+        return ok and self.cookie("sessionid") != ""
+
+    def submit(self, assignment, file_size, chunk_size):
+        # Opening the page creates the assignment status
+        ok, page = self.request(
+            "submit page", "GET",
+            f"/coursework/{assignment.coursework_id}/assignment/{assignment.id}/submit")
+        match = re.search(rb"editMemo\('(\d+)'\)", page)
+        if not ok or not match:
+            return False
+
+        content = secrets.token_bytes(file_size)
+        ok, body = self.request("upload session", "POST", "/upload/session", json.dumps({
+            "assignmentId": assignment.id,
+            "fileName": "submission.txt",
+            "fileSize": file_size,
+            "chunkSize": chunk_size}).encode())
+        if not ok:
+            return False
+        session = json.loads(body)
+
+        offset = session["offset"]
+        while offset < file_size:
+            chunk = content[offset:offset + session["chunk_size"]]
+            ok, body = self.request(
+                "upload chunk", "PUT",
+                f"/upload/session/{session['session_id']}/chunk/{offset // session['chunk_size']}",
+                chunk,
+                {"X-Chunk-Checksum": f"{zlib.crc32(chunk):08x}"})
+            if not ok:
+                return False
+            offset = json.loads(body)["offset"]
+
+        ok, _ = self.request("finalize", "POST", f"/upload/session/{session['session_id']}/finalize")
+        if not ok:
+            return False
+
+        ok, _ = self.request("edit memo", "POST", "/edit/memo", json.dumps({
+            "assignmentStatusId": match.group(1).decode(),
+            "newMemo": "Submitted during the rush"}).encode())
+        return ok
+
+
+def run(students=50, concurrency=10, file_size=256 * 1024, chunk_size=64 * 1024, base_url=None, keep=False):
+    """Seed a coursework and have every student log in, upload & write a memo.
+
+    Without `base_url` the project is served from a thread of this process,
+    which also lets write lock waits be measured. Returns the report as a dict.
+    """
+    stats = Stats()
+    assignment, usernames = seed(students)
+
+    server = stop_watching = None
+    if base_url is None:
+        stop_watching = watch_locks(stats)
+        server, base_url = start_server()
+
+    def flow(username):
+        browser = Browser(base_url, stats)
+        return browser.login(username) and browser.submit(assignment, file_size, chunk_size)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            completed = sum(executor.map(flow, usernames))
+        elapsed = time.perf_counter() - start
+
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            stop_watching()
+        if not keep:
+            cleanup(assignment)
+
+    requests = sum(len(latencies) for latencies in stats.latencies.values())
+    return {
+        "students": students,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "completed": completed,
+        "flows_per_second": completed / elapsed,
+        "requests_per_second": requests / elapsed,
+        "bytes_per_second": completed * file_size / elapsed,
+        "steps": {
+            step: {
+                "requests": len(latencies),
+                "errors": stats.errors.get(step, 0),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99)}
+            for step, latencies in stats.latencies.items()},
+        "lock_waits": None if stop_watching is None else {
+            "transactions": len(stats.lock_waits),
+            "total": sum(stats.lock_waits),
+            "p99": percentile(sorted(stats.lock_waits), 99),
+            "max": max(stats.lock_waits, default=0.0),
+            "locked_errors": stats.locked}}
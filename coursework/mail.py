@@ -0,0 +1,185 @@
+from django.core.mail import get_connection
+from django.conf import settings
+import threading
+import queue
+import time
+
+
+class EmailDispatcher:
+    """Bounded pool of threads sending queued emails in batches.
+
+    Each worker keeps its SMTP connection open while there is mail to send,
+    so a burst of messages costs one handshake per worker instead of one per
+    message. Messages queued with a key are coalesced: the same key is only
+    queued once per `cooldown` seconds. A failed batch is retried once on a
+    fresh connection, messages that still fail have their key released.
+    """
+
+    def __init__(self, workers=2, max_queue=1000, batch_size=50, cooldown=300,
+                 idle_timeout=10, connection_factory=get_connection):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cooldown = cooldown
+        self.idle_timeout = idle_timeout
+        self.connection_factory = connection_factory
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.recent = {}
+
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(
+                    target=self.run,
+                    name=f"email-dispatcher-{len(self.threads)}",
+                    daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def claim(self, key, now):
+        """Whether a message with key may be queued, call with the lock held."""
+        if key is None:
+            return True
+
+        # Same email queued a moment ago
+        if now - self.recent.get(key, -self.cooldown) < self.cooldown:
+            self.coalesced += 1
+            return False
+
+        # Forget keys whose cooldown is over
+        self.recent = {
+            queued_key: queued_on for queued_key, queued_on in self.recent.items()
+            if now - queued_on < self.cooldown}
+        self.recent[key] = now
+        return True
+
+    def send(self, message, key=None):
+        """Queue a message, returns False if it was coalesced or dropped."""
+        now = time.monotonic()
+
+        with self.lock:
+            if not self.claim(key, now):
+                return False
+
+        try:
+            self.queue.put_nowait((message, key, now))
+
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                self.recent.pop(key, None)
+            return False
+
+        self.start()
+        return True
+
+    def send_many(self, messages):
+        """Queue (message, key) pairs at once, waiting for room rather than dropping.
+
+        Returns the number of messages queued.
+        """
+        now = time.monotonic()
+        with self.lock:
+            messages = [(message, key) for message, key in messages if self.claim(key, now)]
+
+        # Workers must be draining before the queue can fill up
+        if messages:
+            self.start()
+        for message, key in messages:
+            self.queue.put((message, key, time.monotonic()))
+        return len(messages)
+
+    def next_batch(self, timeout):
+        """Wait for a message then take whatever else is already queued."""
+        batch = [self.queue.get(timeout=timeout)]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        connection = None
+
+        while True:
+            # Close the connection once the queue has been idle for a while
+            try:
+                batch = self.next_batch(self.idle_timeout if connection else None)
+
+            except queue.Empty:
+                connection.close()
+                connection = None
+                continue
+
+            # What's left is retried once on a fresh connection
+            unsent = batch
+            for _ in range(2):
+                try:
+                    if connection is None:
+                        connection = self.connection_factory(fail_silently=False)
+                        connection.open()
+
+                    # One message at a time, so none is sent twice on retry
+                    while unsent:
+                        connection.send_messages([unsent[0][0]])
+                        self.record(unsent[:1], sent=True)
+                        unsent = unsent[1:]
+                    break
+
+                except Exception:
+                    if connection is not None:
+                        try:
+                            connection.close()
+                        except Exception:
+                            pass
+                    connection = None
+
+            self.record(unsent, sent=False)
+            for _ in batch:
+                self.queue.task_done()
+
+    def record(self, messages, sent):
+        now = time.monotonic()
+
+        with self.lock:
+            # Failed messages may be queued again right away
+            if not sent:
+                self.failed += len(messages)
+                for _, key, _ in messages:
+                    self.recent.pop(key, None)
+                return
+
+            self.sent += len(messages)
+            for _, _, queued_on in messages:
+                self.latency_total += now - queued_on
+                self.latency_max = max(self.latency_max, now - queued_on)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "sent": self.sent,
+                "failed": self.failed,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "send_latency_avg": self.latency_total / self.sent if self.sent else 0.0,
+                "send_latency_max": self.latency_max}
+
+    def join(self):
+        """Block until every queued message has been handled."""
+        self.queue.join()
+
+
+dispatcher = EmailDispatcher(
+    workers=settings.EMAIL_DISPATCHER_WORKERS,
+    cooldown=settings.EMAIL_ACTIVATION_COOLDOWN)
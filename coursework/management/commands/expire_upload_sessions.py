@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from ...uploads import expire_upload_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete the upload sessions older than UPLOAD_SESSION_EXPIRES & their staged files, run it periodically"
+
+    def handle(self, *args, **options):
+        deleted = expire_upload_sessions()
+        self.stdout.write(self.style.SUCCESS(f"Expired sessions: {deleted}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...roster import BATCH_SIZE, RosterError, import_roster
+import sys
+
+
+class Command(BaseCommand):
+    help = "Insert or update StudentList from the registrar's CSV (student_id, last_name, first_name)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file, - to read from stdin")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--encoding", default="utf-8-sig")
+
+    def handle(self, *args, **options):
+        try:
+            if options["path"] == "-":
+                sys.stdin.reconfigure(encoding=options["encoding"], newline="")
+                counts = import_roster(sys.stdin, options["batch_size"])
+
+            else:
+                with open(options["path"], encoding=options["encoding"], newline="") as file:
+                    counts = import_roster(file, options["batch_size"])
+
+        except (OSError, UnicodeDecodeError, RosterError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Inserted: {inserted}, updated: {updated}, unchanged: {unchanged}".format(**counts)))
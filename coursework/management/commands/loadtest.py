@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from ...loadtest import run
+import json
+
+
+class Command(BaseCommand):
+    help = "Replay the deadline rush: N students log in, upload a file chunk by chunk and save a memo"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=10, help="Students submitting at the same time")
+        parser.add_argument("--file-size", type=int, default=256 * 1024, help="Bytes uploaded by each student")
+        parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+        parser.add_argument("--url", help="Running server to test, by default the project is served in-process")
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded coursework, students & files")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON, to compare runs")
+
+    def handle(self, *args, **options):
+        report = run(
+            students=options["students"],
+            concurrency=options["concurrency"],
+            file_size=options["file_size"],
+            chunk_size=options["chunk_size"],
+            base_url=options["url"],
+            keep=options["keep"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{report['completed']}/{report['students']} submissions in {report['elapsed']:.2f}s "
+            f"at concurrency {report['concurrency']}: "
+            f"{report['flows_per_second']:.1f} submissions/s, "
+            f"{report['requests_per_second']:.1f} requests/s, "
+            f"{report['bytes_per_second'] / 1024 / 1024:.2f} MiB/s uploaded\n")
+
+        self.stdout.write(f"{'step':<16}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for step, stats in report["steps"].items():
+            self.stdout.write(
+                f"{step:<16}{stats['requests']:>10}{stats['errors']:>8}"
+                f"{stats['p50'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}")
+
+        lock_waits = report["lock_waits"]
+        if lock_waits is not None:
+            self.stdout.write(
+                f"\nWrite lock waits: {lock_waits['transactions']} transactions, "
+                f"{lock_waits['total']:.2f}s in total, p99 {lock_waits['p99'] * 1000:.1f}ms, "
+                f"max {lock_waits['max'] * 1000:.1f}ms, {lock_waits['locked_errors']} 'database is locked' errors")
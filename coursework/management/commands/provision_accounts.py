@@ -0,0 +1,23 @@
+from ...provisioning import BATCH_SIZE, provision_accounts
+from django.core.management.base import BaseCommand
+from ...models import StudentList
+from ...mail import dispatcher
+
+
+class Command(BaseCommand):
+    help = "Create the accounts of every student in StudentList who hasn't registered, emailing a link to set their password"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--domain", required=True, help="Host used in the activation links")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        counts = provision_accounts(
+            StudentList.objects.iterator(chunk_size=options["batch_size"]),
+            options["domain"],
+            options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(
+            "Created: {created}, already registered: {skipped}".format(**counts)))
+        self.stdout.write("Activation emails queued, waiting for them to be sent...")
+        dispatcher.join()
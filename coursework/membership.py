@@ -0,0 +1,33 @@
+from django.core.cache import cache
+from django.conf import settings
+from .models import Coursework
+
+
+def coursework_ids_key(user_id):
+    return f"coursework-ids-{user_id}"
+
+
+def user_coursework_ids(user):
+    """IDs of the courseworks user has joined, cached until membership changes.
+
+    Changes are forgotten by the process making them only, entries expire
+    after MEMBERSHIP_CACHE_TIMEOUT so other processes with their own cache
+    catch up.
+    """
+    coursework_ids = cache.get(coursework_ids_key(user.id))
+    if coursework_ids is None:
+        coursework_ids = frozenset(
+            Coursework.taken_person.through.objects
+            .filter(user_id=user.id)
+            .values_list("coursework_id", flat=True))
+        cache.set(coursework_ids_key(user.id), coursework_ids, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return coursework_ids
+
+
+def is_member(user, coursework_id):
+    """Whether user has joined the coursework."""
+    return int(coursework_id) in user_coursework_ids(user)
+
+
+def forget_memberships(user_ids):
+    cache.delete_many([coursework_ids_key(user_id) for user_id in user_ids])
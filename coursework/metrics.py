@@ -0,0 +1,226 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.template.backends.django import DjangoTemplates
+from contextvars import ContextVar
+from .mail import dispatcher
+import threading
+import time
+
+
+# Durations in seconds
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+RATE_BUCKETS = tuple(64 * 1024 * 2 ** i for i in range(12))
+
+# Views whose request body is an uploaded file or chunk
+UPLOAD_VIEWS = {"upload_file", "upload_chunk"}
+
+# Queries & template time of the request being handled
+current = ContextVar("request_metrics", default=None)
+
+
+class Histogram:
+    """Cumulative histogram per label value, in the Prometheus text format."""
+
+    def __init__(self, name, help, label, buckets):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, label_value, value):
+        with self.lock:
+            series = self.series.setdefault(label_value, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        with self.lock:
+            for label_value, (counts, total, count) in sorted(self.series.items()):
+                labels = f'{self.label}="{label_value}"'
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total}")
+                lines.append(f"{self.name}_count{{{labels}}} {count}")
+
+        return lines
+
+
+request_duration = Histogram(
+    "sea_request_duration_seconds", "Time to produce the response.", "view", TIME_BUCKETS)
+request_queries = Histogram(
+    "sea_request_queries", "SQL queries run for the response.", "view", COUNT_BUCKETS)
+request_query_duration = Histogram(
+    "sea_request_query_duration_seconds", "Time spent in SQL for the response.", "view", TIME_BUCKETS)
+template_duration = Histogram(
+    "sea_template_render_seconds", "Time spent rendering templates for the response.", "view", TIME_BUCKETS)
+response_size = Histogram(
+    "sea_response_size_bytes", "Size of the response body.", "view", SIZE_BUCKETS)
+upload_rate = Histogram(
+    "sea_upload_bytes_per_second", "Throughput of uploaded files & chunks.", "view", RATE_BUCKETS)
+archive_duration = Histogram(
+    "sea_archive_build_seconds", "Time to build a ZIP of submissions.", "kind", TIME_BUCKETS)
+
+HISTOGRAMS = (
+    request_duration, request_queries, request_query_duration, template_duration,
+    response_size, upload_rate, archive_duration)
+
+
+class TimedTemplate:
+    """Template of the Django backend adding its render time to the request metrics."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = current.get()
+            if metrics is not None:
+                metrics["template_time"] += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics = current.get()
+        if metrics is not None:
+            metrics["queries"] += 1
+            metrics["query_time"] += time.perf_counter() - start
+
+
+def install_query_recorder(connection):
+    # Async views query from whichever thread the ORM runs in,
+    # so every connection records into the metrics of its request
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def counted(content, view):
+    # Streamed responses are measured once fully sent
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    response_size.observe(view, size)
+
+
+async def acounted(content, view):
+    size = 0
+    async for chunk in content:
+        size += len(chunk)
+        yield chunk
+    response_size.observe(view, size)
+
+
+class MetricsMiddleware:
+    """Time every request of a named URL, report it in Server-Timing & /metrics.
+
+    Histograms are kept per process, each worker serves its own.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        metrics, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def start(self):
+        metrics = {"queries": 0, "query_time": 0.0, "template_time": 0.0}
+        return metrics, current.set(metrics), time.perf_counter()
+
+    def finish(self, request, response, metrics, duration):
+        response["Server-Timing"] = ", ".join([
+            f"app;dur={duration * 1000:.1f}",
+            f'db;dur={metrics["query_time"] * 1000:.1f};desc="{metrics["queries"]} queries"',
+            f"tpl;dur={metrics['template_time'] * 1000:.1f}"])
+
+        # Only named URL patterns, anything else would make unbounded series
+        match = request.resolver_match
+        if match is None or not match.url_name:
+            return response
+        view = match.view_name
+
+        request_duration.observe(view, duration)
+        request_queries.observe(view, metrics["queries"])
+        request_query_duration.observe(view, metrics["query_time"])
+        template_duration.observe(view, metrics["template_time"])
+
+        if not response.streaming:
+            response_size.observe(view, len(response.content))
+        elif response.is_async:
+            response.streaming_content = acounted(response.streaming_content, view)
+        else:
+            response.streaming_content = counted(response.streaming_content, view)
+
+        if view in UPLOAD_VIEWS and duration > 0:
+            upload_rate.observe(view, int(request.META.get("CONTENT_LENGTH") or 0) / duration)
+
+        return response
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+
+    email = dispatcher.metrics()
+    for name, kind, help, value in (
+            ("sea_email_queue_depth", "gauge", "Emails waiting to be sent.", email["queue_depth"]),
+            ("sea_emails_sent_total", "counter", "Emails sent.", email["sent"]),
+            ("sea_emails_failed_total", "counter", "Emails that failed to send.", email["failed"]),
+            ("sea_emails_coalesced_total", "counter", "Duplicate emails not queued.", email["coalesced"]),
+            ("sea_emails_dropped_total", "counter", "Emails dropped on a full queue.", email["dropped"]),
+            ("sea_email_send_latency_seconds_avg", "gauge", "Average time from queued to sent.", email["send_latency_avg"]),
+            ("sea_email_send_latency_seconds_max", "gauge", "Longest time from queued to sent.", email["send_latency_max"])):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0035_alter_joincourseworkrequest_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="user",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Student", "Student"),
+                    ("Teacher", "Teacher"),
+                    ("Teaching Assistant", "Teaching Assistant"),
+                ],
+                default="Student",
+                max_length=18,
+            ),
+        ),
+    ]
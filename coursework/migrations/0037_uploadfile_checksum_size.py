@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0036_uploadsession"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadfile",
+            name="checksum",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
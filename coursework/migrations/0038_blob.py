@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:14
+
+import coursework.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_display_name(apps, schema_editor):
+    # Files uploaded before keep their storage name as display name
+    UploadFile = apps.get_model("coursework", "UploadFile")
+    UploadFile.objects.update(display_name=models.F("file"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0037_uploadfile_checksum_size"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("checksum", models.CharField(max_length=64, unique=True)),
+                ("file", models.FileField(upload_to=coursework.models.blob_path)),
+                ("size", models.BigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["checksum"],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="uploadfile",
+            options={"ordering": ["assignment", "assignment__student", "display_name"]},
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="display_name",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="upload_file",
+                to="coursework.blob",
+            ),
+        ),
+        migrations.RunPython(fill_display_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:16
+
+import coursework.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0038_blob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadfile",
+            name="channels",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="duration",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="peaks",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="preview",
+            field=models.FileField(
+                blank=True, null=True, upload_to=coursework.models.preview_path
+            ),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="sample_rate",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
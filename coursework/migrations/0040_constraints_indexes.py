@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+def duplicates(model, fields):
+    # Groups of rows sharing the values of fields, oldest row first
+    groups = (
+        model.objects.order_by()
+        .values(*fields)
+        .annotate(count=models.Count("pk"))
+        .filter(count__gt=1)
+    )
+    for group in groups:
+        del group["count"]
+        yield list(model.objects.filter(**group).order_by("pk"))
+
+
+def dedupe(apps, schema_editor):
+    AssignmentStatus = apps.get_model("coursework", "AssignmentStatus")
+    JoinCourseworkRequest = apps.get_model("coursework", "JoinCourseworkRequest")
+    StudentList = apps.get_model("coursework", "StudentList")
+    UploadFile = apps.get_model("coursework", "UploadFile")
+    UploadSession = apps.get_model("coursework", "UploadSession")
+
+    # Files & memos of duplicated statuses are merged into the oldest one
+    for kept, *others in duplicates(AssignmentStatus, ["assignment", "student"]):
+        memos = [kept.memo] if kept.memo else []
+        for status in others:
+            if status.memo and status.memo not in memos:
+                memos.append(status.memo)
+        kept.memo = "\n\n".join(memos) or kept.memo
+        kept.save(update_fields=["memo"])
+
+        UploadFile.objects.filter(assignment__in=others).update(assignment=kept)
+        UploadSession.objects.filter(assignment__in=others).update(assignment=kept)
+        AssignmentStatus.objects.filter(
+            pk__in=[status.pk for status in others]
+        ).delete()
+
+    for kept, *others in duplicates(JoinCourseworkRequest, ["student", "coursework"]):
+        JoinCourseworkRequest.objects.filter(
+            pk__in=[request.pk for request in others]
+        ).delete()
+
+    # The last name registered for a student id wins
+    for *others, kept in duplicates(StudentList, ["student_id"]):
+        StudentList.objects.filter(pk__in=[student.pk for student in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0039_uploadfile_wav_analysis"),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="studentlist",
+            name="student_id",
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="assignment",
+            index=models.Index(
+                fields=["coursework", "deadline"], name="assignment_coursework_deadline"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="assignmentstatus",
+            constraint=models.UniqueConstraint(
+                fields=("assignment", "student"), name="unique_assignment_status"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="joincourseworkrequest",
+            constraint=models.UniqueConstraint(
+                fields=("student", "coursework"), name="unique_join_coursework_request"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0040_constraints_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="joincourseworkrequest",
+            name="created_on",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AddField(
+            model_name="uploadfile",
+            name="created_on",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
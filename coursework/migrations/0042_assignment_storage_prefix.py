@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:02
+
+import coursework.models
+from django.db import migrations, models
+
+
+def generate_prefixes(apps, schema_editor):
+    # One prefix per existing assignment, files already stored keep their names
+    Assignment = apps.get_model("coursework", "Assignment")
+    assignments = list(Assignment.objects.only("pk"))
+    for assignment in assignments:
+        assignment.storage_prefix = coursework.models.storage_prefix()
+    Assignment.objects.bulk_update(assignments, ["storage_prefix"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0041_upload_request_created_on"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assignment",
+            name="storage_prefix",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(generate_prefixes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="assignment",
+            name="storage_prefix",
+            field=models.CharField(
+                default=coursework.models.storage_prefix,
+                editable=False,
+                max_length=64,
+                unique=True,
+            ),
+        ),
+    ]
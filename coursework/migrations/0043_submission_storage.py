@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:08
+
+import coursework.models
+import coursework.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0042_assignment_storage_prefix"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="assignment",
+            name="result_zip_file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=coursework.storage.get_submission_storage,
+                upload_to="",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="blob",
+            name="file",
+            field=models.FileField(
+                storage=coursework.storage.get_submission_storage,
+                upload_to=coursework.models.blob_path,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="uploadfile",
+            name="file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=coursework.storage.get_submission_storage,
+                upload_to=coursework.models.path_and_rename,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="uploadfile",
+            name="preview",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=coursework.storage.get_submission_storage,
+                upload_to=coursework.models.preview_path,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coursework", "0043_submission_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="upload_id",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,13 +1,18 @@
+from django.db.models import ExpressionWrapper, F, Q
 from django.contrib.auth.models import AbstractUser
+from .storage import get_submission_storage
+from django.db.models.functions import Now
+from django.db import models, transaction
 from django.utils import timezone
-from django.db import models
+from django.conf import settings
+import uuid
 import os
 
 
 class StudentList(models.Model):
     first_name = models.CharField(max_length=18)
     last_name = models.CharField(max_length=18)
-    student_id = models.IntegerField()
+    student_id = models.IntegerField(unique=True)
 
     def __str__(self):
         return f"{self.last_name}{self.first_name}-{self.student_id}"
@@ -69,12 +74,31 @@ class JoinCourseworkRequest(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name="request_student")
+    created_on = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self):
         return f"{self.student} request join {self.coursework}."
 
     class Meta:
         ordering = ["student", "coursework"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "coursework"],
+                name="unique_join_coursework_request")]
+
+
+def storage_prefix():
+    # Sharded by the first characters of a random key to keep directories small
+    key = uuid.uuid4().hex
+    return os.path.join("assignments", key[:2], key[2:4], key)
+
+
+class AssignmentQuerySet(models.QuerySet):
+    def with_expiry(self):
+        """Compute in the database whether each assignment is expired."""
+        return self.annotate(expired=ExpressionWrapper(
+            Q(deadline__lt=Now()),
+            output_field=models.BooleanField()))
 
 
 class Assignment(models.Model):
@@ -84,9 +108,18 @@ class Assignment(models.Model):
         related_name="assignment")
     created_on = models.DateTimeField(auto_now_add=True)
     deadline = models.DateTimeField()
-    result_zip_file = models.FileField(null=True, blank=True)
+    result_zip_file = models.FileField(null=True, blank=True, storage=get_submission_storage)
     title = models.CharField(max_length=128)
 
+    # Directory of the assignment's files, set once so renaming moves nothing
+    storage_prefix = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False,
+        default=storage_prefix)
+
+    objects = AssignmentQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -100,6 +133,10 @@ class Assignment(models.Model):
 
     class Meta:
         ordering = ["coursework", "-created_on"]
+        indexes = [
+            models.Index(
+                fields=["coursework", "deadline"],
+                name="assignment_coursework_deadline")]
 
 
 class AssignmentStatus(models.Model):
@@ -114,16 +151,59 @@ class AssignmentStatus(models.Model):
 
     class Meta:
         ordering = ["assignment", "student__username"]
+        # Also the index of statuses by assignment
+        constraints = [
+            models.UniqueConstraint(
+                fields=["assignment", "student"],
+                name="unique_assignment_status")]
+
+
+def submission_name(assignment_status, filename):
+    """Name of a submitted file as listed & downloaded: <username>.<extension>."""
+    return f"{assignment_status.student.username}.{filename.split('.')[-1]}"
 
 
 def path_and_rename(instance, filename):
-    # For use later
+    # Names only the legacy uploads saved before blobs, new ones are stored under blob_path
+    # Needs the status' assignment & student, no title or deadline
     assign = instance.assignment
+    return os.path.join(assign.assignment.storage_prefix, submission_name(assign, filename))
 
-    # Return path and name
+
+def blob_path(instance, filename):
+    # Shard by the first bytes of the hash to keep directories small
     return os.path.join(
-        f"{assign.assignment.coursework}_{assign.assignment}_{assign.assignment.deadline.strftime('%Y%m%d')}",
-        f"{assign.student.username}.{filename.split('.')[-1]}")
+        "blobs",
+        instance.checksum[:2],
+        instance.checksum[2:4],
+        instance.checksum)
+
+
+def preview_path(instance, filename):
+    return os.path.join("previews", filename[:2], f"{filename}.wav")
+
+
+class Blob(models.Model):
+    checksum = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_path, storage=get_submission_storage)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.checksum}({self.ref_count})"
+
+    def release(self):
+        """Drop one reference, deleting the blob after the last & its file once committed."""
+        with transaction.atomic():
+            Blob.objects.filter(pk=self.pk).update(ref_count=F("ref_count") - 1)
+            deleted, _ = Blob.objects.filter(pk=self.pk, ref_count=0).delete()
+
+        if deleted:
+            transaction.on_commit(lambda: self.file.delete(save=False))
+        return bool(deleted)
+
+    class Meta:
+        ordering = ["checksum"]
 
 
 class UploadFile(models.Model):
@@ -131,17 +211,84 @@ class UploadFile(models.Model):
         AssignmentStatus,
         on_delete=models.CASCADE,
         related_name="upload_file")
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="upload_file")
     file = models.FileField(
         blank=True,
         null=True,
-        upload_to=path_and_rename)
+        upload_to=path_and_rename,
+        storage=get_submission_storage)
+    display_name = models.CharField(max_length=255, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    created_on = models.DateTimeField(default=timezone.now, db_index=True)
+
+    # Filled in by the WAV analysis
+    duration = models.FloatField(null=True, blank=True)
+    sample_rate = models.PositiveIntegerField(null=True, blank=True)
+    channels = models.PositiveSmallIntegerField(null=True, blank=True)
+    peaks = models.JSONField(null=True, blank=True)
+    preview = models.FileField(
+        blank=True,
+        null=True,
+        upload_to=preview_path,
+        storage=get_submission_storage)
 
     def __str__(self):
-        return f"{self.assignment}({self.file})"
+        return f"{self.assignment}({self.display_name})"
+
+    @property
+    def waveform(self):
+        """SVG path drawing the peaks as bars in a 100 units high box."""
+        return " ".join(
+            f"M{x} {50 - peak * 50:.1f}V{50 + peak * 50:.1f}"
+            for x, peak in enumerate(self.peaks or []))
+
+    class Meta:
+        ordering = ["assignment", "assignment__student", "display_name"]
+
 
-    def delete(self, *args, **kwargs):
-        self.file.delete()
-        super().delete(*args, **kwargs)
+class UploadSession(models.Model):
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False)
+    assignment = models.ForeignKey(
+        AssignmentStatus,
+        on_delete=models.CASCADE,
+        related_name="upload_session")
+    created_on = models.DateTimeField(auto_now_add=True)
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received = models.BigIntegerField(default=0)
+
+    # Multipart upload of a direct upload, whose parts go to storage straight from the client
+    upload_id = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.assignment}({self.file_name} {self.received}/{self.file_size})"
+
+    @property
+    def next_chunk(self):
+        return self.received // self.chunk_size
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.file_size // self.chunk_size))
+
+    @property
+    def staging_path(self):
+        return os.path.join(settings.UPLOAD_STAGING_DIR, f"{self.id}.part")
+
+    @property
+    def staging_name(self):
+        # Storage name a direct upload is assembled under, only this session can write to it
+        return f"uploads/{self.id}"
 
     class Meta:
-        ordering = ["assignment", "assignment__student", "file"]
+        ordering = ["assignment", "created_on"]
@@ -0,0 +1,118 @@
+from .models import Coursework, JoinCourseworkRequest
+from django.core.cache import cache
+from contextvars import ContextVar
+from django.conf import settings
+import asyncio
+import json
+import time
+
+
+# Seconds between two looks at the counter in the event stream
+POLL_INTERVAL = 2
+
+# Seconds after which the browser reconnects
+STREAM_DURATION = 60
+
+# Seconds between two requests of the count under WSGI, where the stream isn't held
+WSGI_RETRY_INTERVAL = 60
+
+# Seconds between two keepalive comments
+KEEPALIVE_INTERVAL = 15
+
+# Set while a batch of requests adjusts the counters by itself
+adjusting_batch = ContextVar("adjusting_batch", default=False)
+
+
+def request_count_key(user_id):
+    return f"coursework-request-count-{user_id}"
+
+
+def request_count(user):
+    """Pending join requests for the courseworks user teaches or assists.
+
+    Counters are adjusted as requests come & go and recomputed after
+    REQUEST_COUNT_CACHE_TIMEOUT, in case another process' cache missed a change.
+    """
+    if user.status == "Student":
+        return 0
+
+    count = cache.get(request_count_key(user.id))
+    if count is None:
+        count = JoinCourseworkRequest.objects.filter(
+            coursework__taken_person=user).count()
+        cache.add(request_count_key(user.id), count, settings.REQUEST_COUNT_CACHE_TIMEOUT)
+        count = cache.get(request_count_key(user.id), count)
+    return count
+
+
+async def arequest_count(user):
+    """request_count() for async views, without blocking the event loop."""
+    if user.status == "Student":
+        return 0
+
+    count = await cache.aget(request_count_key(user.id))
+    if count is None:
+        count = await JoinCourseworkRequest.objects.filter(
+            coursework__taken_person=user).acount()
+        await cache.aadd(request_count_key(user.id), count, settings.REQUEST_COUNT_CACHE_TIMEOUT)
+        count = await cache.aget(request_count_key(user.id), count)
+    return count
+
+
+def adjust_request_count(coursework_id, delta):
+    """Apply a new or removed request to the counters of the coursework staff."""
+    adjust_request_counts({coursework_id: delta})
+
+
+def adjust_request_counts(deltas):
+    """adjust_request_count() for several courseworks at once, {coursework id: delta}."""
+    staff = Coursework.taken_person.through.objects.filter(
+        coursework_id__in=deltas
+    ).exclude(user__status="Student").values_list("user_id", "coursework_id")
+
+    for user_id, coursework_id in staff:
+        # Counters not cached yet get computed on next read
+        try:
+            cache.incr(request_count_key(user_id), deltas[coursework_id])
+        except ValueError:
+            pass
+
+
+def forget_request_count(user_ids):
+    cache.delete_many([request_count_key(user_id) for user_id in user_ids])
+
+
+def request_count_events(user):
+    """The request count as a single Server-Sent Event, for WSGI.
+
+    A held stream would keep a worker thread sleeping, the browser asks
+    again after WSGI_RETRY_INTERVAL instead.
+    """
+    count = request_count(user)
+    yield f"retry: {WSGI_RETRY_INTERVAL * 1000}\n\n"
+    yield f"data: {json.dumps({'request_count': count, 'delta': count})}\n\n"
+
+
+async def arequest_count_events(user):
+    """Server-Sent Events pushing the request count whenever it changes, for ASGI.
+
+    Waits on the event loop, so an open page doesn't hold a thread.
+    """
+    started = last_sent = time.monotonic()
+    count = None
+
+    # Reconnect after 1 second when the stream ends
+    yield "retry: 1000\n\n"
+
+    while time.monotonic() - started < STREAM_DURATION:
+        new_count = await arequest_count(user)
+        if new_count != count:
+            yield f"data: {json.dumps({'request_count': new_count, 'delta': new_count - (count or 0)})}\n\n"
+            count = new_count
+            last_sent = time.monotonic()
+
+        elif time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,262 @@
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from .storage import CHUNK_SIZE, MIN_PART_SIZE, checksum_header, signature
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, unquote
+from email.utils import format_datetime
+from xml.etree import ElementTree
+import threading
+import hashlib
+import uuid
+import hmac
+import re
+
+
+AUTHORIZATION_RE = re.compile(
+    r"AWS4-HMAC-SHA256 Credential=([^/]+)/\d{8}/([^/]+)/s3/aws4_request, SignedHeaders=([^,]+), Signature=([0-9a-f]+)")
+
+RANGE_RE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ObjectStore:
+    """In-process stand-in for an S3-compatible object store.
+
+    One bucket kept in memory & served over HTTP from a thread, enough of
+    the S3 REST API for S3Storage: signed & presigned PUT, GET (with ranges),
+    HEAD, DELETE and copy of objects, multipart uploads, SHA-256 checksums
+    enforced on upload.
+    """
+
+    # Parts listed per page
+    max_parts = 1000
+
+    def __init__(self, bucket="submissions", access_key="access-key", secret_key="secret-key", region="us-east-1"):
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+        self.server = None
+
+    def start(self):
+        """Serve on a free local port, returns the endpoint URL."""
+        self.server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler, allow_reuse_address=False)
+        self.server.set_app(self)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.endpoint_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def endpoint_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def storage_options(self):
+        """OPTIONS of an S3Storage using this store."""
+        return {
+            "endpoint_url": self.endpoint_url,
+            "bucket": self.bucket,
+            "access_key": self.access_key,
+            "secret_key": self.secret_key,
+            "region": self.region}
+
+    def authorized(self, method, path, query, environ):
+        def header(name):
+            if name == "host":
+                return environ.get("HTTP_HOST", "")
+            return environ.get(f"HTTP_{name.upper().replace('-', '_')}", "")
+
+        # Presigned URL
+        if "X-Amz-Signature" in query:
+            access_key, _, region, *_ = query.get("X-Amz-Credential", "").split("/") + ["", "", ""]
+            amz_date = query.get("X-Amz-Date", "")
+            expires = datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc) + timedelta(
+                seconds=int(query.get("X-Amz-Expires", 0)))
+            if expires < datetime.now(timezone.utc):
+                return False
+            names = query.get("X-Amz-SignedHeaders", "").split(";")
+            expected = query["X-Amz-Signature"]
+            query = {key: value for key, value in query.items() if key != "X-Amz-Signature"}
+
+        # Signed headers
+        else:
+            match = AUTHORIZATION_RE.fullmatch(environ.get("HTTP_AUTHORIZATION", ""))
+            if not match:
+                return False
+            access_key, region, names, expected = match.groups()
+            names = names.split(";")
+            amz_date = header("x-amz-date")
+
+        _, signed = signature(
+            self.secret_key, region, method, path, query,
+            {name: header(name) for name in names}, amz_date)
+        return access_key == self.access_key and hmac.compare_digest(signed, expected)
+
+    def __call__(self, environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        path = environ["PATH_INFO"].encode("latin-1").decode()
+        query = dict(parse_qsl(environ.get("QUERY_STRING", ""), keep_blank_values=True))
+        self.requests.append((method, path))
+
+        def respond(status, headers=(), body=b""):
+            start_response(status, [("Access-Control-Allow-Origin", "*"), *headers])
+            return [body] if isinstance(body, bytes) else body
+
+        def respond_xml(root, status="200 OK"):
+            return respond(status, [("Content-Type", "application/xml")], ElementTree.tostring(root))
+
+        # Browsers check before sending presigned uploads
+        if method == "OPTIONS":
+            return respond("200 OK", [
+                ("Access-Control-Allow-Methods", "GET, HEAD, PUT"),
+                ("Access-Control-Allow-Headers", "*")])
+
+        prefix = f"/{self.bucket}/"
+        if not path.startswith(prefix) or len(path) == len(prefix):
+            return respond("400 Bad Request")
+        if not self.authorized(method, path, query, environ):
+            return respond("403 Forbidden")
+        name = path[len(prefix):]
+
+        if "uploads" in query or "uploadId" in query:
+            return self.multipart(method, name, query, environ, respond, respond_xml)
+
+        if method == "PUT" and "HTTP_X_AMZ_COPY_SOURCE" in environ:
+            with self.lock:
+                stored = self.objects.get(unquote(environ["HTTP_X_AMZ_COPY_SOURCE"])[len(prefix):])
+                if stored is None:
+                    return respond("404 Not Found")
+                self.objects[name] = (*stored[:2], datetime.now(timezone.utc))
+            root = ElementTree.Element("CopyObjectResult")
+            ElementTree.SubElement(root, "ETag").text = f'"{hashlib.md5(stored[0]).hexdigest()}"'
+            return respond_xml(root)
+
+        if method == "PUT":
+            data = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+            checksum = environ.get("HTTP_X_AMZ_CHECKSUM_SHA256")
+            if checksum and checksum != checksum_header(hashlib.sha256(data).hexdigest()):
+                return respond("400 Bad Request", body=b"BadDigest")
+            with self.lock:
+                self.objects[name] = (data, environ.get("CONTENT_TYPE") or "application/octet-stream", datetime.now(timezone.utc))
+            return respond("200 OK", [("ETag", f'"{hashlib.md5(data).hexdigest()}"')])
+
+        with self.lock:
+            stored = self.objects.get(name)
+
+        if method == "DELETE":
+            with self.lock:
+                self.objects.pop(name, None)
+            return respond("204 No Content")
+
+        if stored is None:
+            return respond("404 Not Found")
+        data, content_type, modified = stored
+
+        headers = [
+            ("Content-Type", query.get("response-content-type", content_type)),
+            ("Last-Modified", format_datetime(modified, usegmt=True)),
+            ("Accept-Ranges", "bytes")]
+        if "response-content-disposition" in query:
+            headers.append(("Content-Disposition", query["response-content-disposition"]))
+
+        status, start, end = "200 OK", 0, len(data) - 1
+        match = RANGE_RE.match(environ.get("HTTP_RANGE", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start > end:
+                return respond("416 Range Not Satisfiable", [("Content-Range", f"bytes */{len(data)}")])
+            status = "206 Partial Content"
+            headers.append(("Content-Range", f"bytes {start}-{end}/{len(data)}"))
+        headers.append(("Content-Length", str(end - start + 1)))
+
+        if method == "HEAD":
+            return respond(status, headers)
+        return respond(status, headers, (data[offset:min(offset + CHUNK_SIZE, end + 1)] for offset in range(start, end + 1, CHUNK_SIZE)))
+
+    def multipart(self, method, name, query, environ, respond, respond_xml):
+        """Create, upload a part of, list the parts of, complete or abort a multipart upload."""
+        if method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.lock:
+                self.uploads[upload_id] = (name, {})
+            root = ElementTree.Element("InitiateMultipartUploadResult")
+            ElementTree.SubElement(root, "Key").text = name
+            ElementTree.SubElement(root, "UploadId").text = upload_id
+            return respond_xml(root)
+
+        with self.lock:
+            upload = self.uploads.get(query["uploadId"])
+        if upload is None or upload[0] != name:
+            return respond("404 Not Found", body=b"NoSuchUpload")
+        parts = upload[1]
+
+        if method == "PUT":
+            data = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+            checksum = environ.get("HTTP_X_AMZ_CHECKSUM_SHA256", "")
+            if checksum and checksum != checksum_header(hashlib.sha256(data).hexdigest()):
+                return respond("400 Bad Request", body=b"BadDigest")
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            with self.lock:
+                parts[int(query["partNumber"])] = (data, checksum, etag)
+            return respond("200 OK", [("ETag", etag)])
+
+        if method == "GET":
+            numbers = sorted(number for number in parts if number > int(query.get("part-number-marker") or 0))
+            root = ElementTree.Element("ListPartsResult")
+            ElementTree.SubElement(root, "UploadId").text = query["uploadId"]
+            for number in numbers[:self.max_parts]:
+                data, checksum, etag = parts[number]
+                element = ElementTree.SubElement(root, "Part")
+                ElementTree.SubElement(element, "PartNumber").text = str(number)
+                ElementTree.SubElement(element, "ETag").text = etag
+                ElementTree.SubElement(element, "Size").text = str(len(data))
+                if checksum:
+                    ElementTree.SubElement(element, "ChecksumSHA256").text = checksum
+            truncated = len(numbers) > self.max_parts
+            ElementTree.SubElement(root, "IsTruncated").text = "true" if truncated else "false"
+            if truncated:
+                ElementTree.SubElement(root, "NextPartNumberMarker").text = str(numbers[self.max_parts - 1])
+            return respond_xml(root)
+
+        if method == "DELETE":
+            with self.lock:
+                self.uploads.pop(query["uploadId"], None)
+            return respond("204 No Content")
+
+        # Complete, every listed part must match & all but the last be big enough
+        body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        listed = [
+            (int(part.findtext("PartNumber")), part.findtext("ETag"))
+            for part in ElementTree.fromstring(body).iterfind("Part")]
+        error = None
+        if not listed or [number for number, _ in listed] != sorted({number for number, _ in listed}):
+            error = "InvalidPartOrder"
+        elif any(number not in parts or parts[number][2] != etag for number, etag in listed):
+            error = "InvalidPart"
+        elif any(len(parts[number][0]) < MIN_PART_SIZE for number, _ in listed[:-1]):
+            error = "EntityTooSmall"
+
+        # Errors of a complete come with a 200 status
+        if error:
+            root = ElementTree.Element("Error")
+            ElementTree.SubElement(root, "Code").text = error
+            ElementTree.SubElement(root, "Message").text = "Multipart upload not completed."
+            return respond_xml(root)
+
+        data = b"".join(parts[number][0] for number, _ in listed)
+        with self.lock:
+            self.uploads.pop(query["uploadId"], None)
+            self.objects[name] = (data, "application/octet-stream", datetime.now(timezone.utc))
+        root = ElementTree.Element("CompleteMultipartUploadResult")
+        ElementTree.SubElement(root, "Key").text = name
+        return respond_xml(root)
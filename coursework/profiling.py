@@ -0,0 +1,141 @@
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection
+from django.conf import settings
+import threading
+import cProfile
+import random
+import pstats
+import json
+import time
+import uuid
+import io
+import os
+
+
+# Python frames & statements kept in a report
+PROFILE_LINES = 40
+EXPLAINED_QUERIES = 5
+
+# cProfile can only follow one request at a time
+profiling = threading.Lock()
+
+
+def report_path(name):
+    # Names come from the URL, never leave the store
+    return os.path.join(settings.SLOW_REQUEST_DIR, os.path.basename(name))
+
+
+def explain(query):
+    """Query plan of a captured SELECT, or the error preventing it."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}", query["params"])
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+
+    except DatabaseError as error:
+        return [f"Can't explain: {error}"]
+
+
+def save_report(report):
+    """Write the report to the store, dropping the oldest beyond SLOW_REQUEST_KEEP."""
+    os.makedirs(settings.SLOW_REQUEST_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.json"
+
+    # Written aside then renamed, so the admin never reads half a report
+    temp_path = report_path(f".{name}")
+    with open(temp_path, "w") as file:
+        json.dump(report, file)
+    os.replace(temp_path, report_path(name))
+
+    for old in list_reports()[settings.SLOW_REQUEST_KEEP:]:
+        try:
+            os.remove(report_path(old))
+        except FileNotFoundError:
+            pass
+
+
+def list_reports():
+    """Report names, newest first."""
+    try:
+        names = os.listdir(settings.SLOW_REQUEST_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if name.endswith(".json") and not name.startswith(".")), reverse=True)
+
+
+def load_report(name):
+    with open(report_path(name)) as file:
+        return json.load(file)
+
+
+class SlowRequestProfiler:
+    """Profile a sample of requests, keeping a report of those over the threshold.
+
+    Opt-in with SLOW_REQUEST_PROFILING. A report holds the cProfile summary,
+    every SQL statement with its duration and the query plan of the slowest
+    SELECTs, and can be browsed from the admin.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SLOW_REQUEST_SAMPLE_RATE or not profiling.acquire(blocking=False):
+            return self.get_response(request)
+
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    "sql": sql,
+                    "params": None if many else params,
+                    "duration": time.perf_counter() - start})
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(record_query):
+                profile.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profile.disable()
+        finally:
+            profiling.release()
+        duration = time.perf_counter() - start
+
+        if duration >= settings.SLOW_REQUEST_THRESHOLD:
+            self.report(request, response, duration, profile, queries)
+        return response
+
+    def report(self, request, response, duration, profile, queries):
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+        # Only reads can be explained without side effects
+        slowest = sorted(
+            (query for query in queries if query["sql"].lstrip().upper().startswith("SELECT")),
+            key=lambda query: -query["duration"])[:EXPLAINED_QUERIES]
+
+        save_report({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": request.resolver_match.view_name if request.resolver_match else "",
+            "user": str(request.user) if hasattr(request, "user") else "",
+            "status": response.status_code,
+            "duration": duration,
+            "query_time": sum(query["duration"] for query in queries),
+            "queries": [
+                {"sql": query["sql"], "params": repr(query["params"]), "duration": query["duration"]}
+                for query in queries],
+            "explain": [
+                {"sql": query["sql"], "duration": query["duration"], "plan": explain(query)}
+                for query in slowest],
+            "profile": summary.getvalue()})
@@ -0,0 +1,67 @@
+from django.contrib.auth.hashers import make_password
+from .utils import activation_email
+from .mail import dispatcher
+from .models import User
+import itertools
+
+
+# Accounts inserted and emailed at a time
+BATCH_SIZE = 500
+
+
+def student_email(student_id):
+    return f"{student_id}@itd.tnnua.edu.tw"
+
+
+def provision_batch(students, domain):
+    # Students already registered are left alone
+    taken = set(User.objects.filter(
+        username__in=[str(student.student_id) for student in students]
+    ).values_list("username", flat=True))
+    pending = {}
+    for student in students:
+        if str(student.student_id) not in taken:
+            pending.setdefault(str(student.student_id), student)
+
+    # Unusable until chosen, each one distinct & nothing to hash
+    passwords = {username: make_password(None) for username in pending}
+
+    User.objects.bulk_create([
+        User(
+            username=username,
+            email=student_email(username),
+            first_name=student.first_name,
+            last_name=student.last_name,
+            password=passwords[username])
+        for username, student in pending.items()
+    ], ignore_conflicts=True)
+
+    # Accounts registered in the meantime keep their own password
+    created = [
+        user for user in User.objects.filter(username__in=pending)
+        if user.password == passwords[user.username]]
+
+    dispatcher.send_many([
+        (activation_email(user, domain, set_password=True), f"activate-{user.pk}")
+        for user in created])
+
+    return len(created)
+
+
+def provision_accounts(students, domain, batch_size=BATCH_SIZE):
+    """Create the accounts of `students` (StudentList rows) that don't exist yet.
+
+    Accounts are inserted with bulk_create & an unusable password, no
+    password is generated or sent: the activation emails, queued on the
+    dispatcher once per batch, carry a one-time link to choose one. Returns
+    the number of accounts created and of students skipped.
+    """
+    counts = {"created": 0, "skipped": 0}
+    students = iter(students)
+
+    while batch := list(itertools.islice(students, batch_size)):
+        created = provision_batch(batch, domain)
+        counts["created"] += created
+        counts["skipped"] += len(batch) - created
+
+    return counts
@@ -0,0 +1,45 @@
+from .models import AssignmentStatus, User
+
+
+def build_assignment_result(assignment):
+    """Collect the roster x memo x file matrix of an assignment.
+
+    Runs a fixed number of queries (roster, statuses, files) whatever the
+    class size and returns the per-student rows used by assignment_result.
+    """
+    # Every status of the assignment with its student & files in 2 queries
+    assignment_status = list(
+        AssignmentStatus.objects
+        .filter(assignment=assignment)
+        .select_related("student")
+        .prefetch_related("upload_file"))
+
+    # Index the statuses by student for O(1) lookup per roster row
+    status_by_student = {
+        status.student_id: status for status in assignment_status}
+    student_who_submit_memo = {
+        status.student_id for status in assignment_status if status.memo}
+    student_who_upload_file = {
+        status.student_id for status in assignment_status
+        if status.upload_file.all()}
+
+    # Build one row per student taking the coursework
+    rows = []
+    for student in User.objects.filter(
+            coursework_taken=assignment.coursework_id).exclude(status="Teacher"):
+        has_memo = student.id in student_who_submit_memo
+        has_file = student.id in student_who_upload_file
+        rows.append({
+            "student": student,
+            "status": status_by_student.get(student.id),
+            "submitted": has_memo or has_file,
+            "has_memo": has_memo,
+            "has_file": has_file})
+
+    return {
+        "rows": rows,
+        "memos": [
+            status for status in assignment_status if status.memo],
+        "uploads": [
+            status for status in assignment_status
+            if status.student_id in student_who_upload_file]}
@@ -0,0 +1,90 @@
+from django.db import transaction
+from .models import StudentList
+import itertools
+import csv
+
+
+# Rows looked up, inserted and updated per query
+BATCH_SIZE = 1000
+
+FIELDS = ("student_id", "last_name", "first_name")
+
+
+class RosterError(ValueError):
+    pass
+
+
+def read_roster(lines):
+    """Parse the registrar's CSV one line at a time, yielding StudentList rows."""
+    reader = csv.reader(lines)
+
+    # Columns can come in any order, headers are matched case insensitively
+    header = [name.strip().lstrip("\ufeff").lower() for name in next(reader, [])]
+    missing = [field for field in FIELDS if field not in header]
+    if missing:
+        raise RosterError(f"Missing column(s): {', '.join(missing)}")
+    columns = [header.index(field) for field in FIELDS]
+
+    for row in reader:
+        # Skip blank lines
+        if not any(value.strip() for value in row):
+            continue
+
+        try:
+            student_id, last_name, first_name = (row[column].strip() for column in columns)
+            student = StudentList(
+                student_id=int(student_id),
+                last_name=last_name,
+                first_name=first_name)
+
+        except (IndexError, ValueError):
+            raise RosterError(f"Line {reader.line_num}: invalid row {row!r}")
+
+        for field in ("last_name", "first_name"):
+            if len(getattr(student, field)) > StudentList._meta.get_field(field).max_length:
+                raise RosterError(f"Line {reader.line_num}: {field} is too long")
+
+        yield student
+
+
+def upsert_batch(students, counts):
+    # Last occurrence of a student id wins
+    students = {student.student_id: student for student in students}
+    existing = {
+        student.student_id: student
+        for student in StudentList.objects.filter(student_id__in=students)}
+
+    inserted, updated = [], []
+    for student_id, student in students.items():
+        current = existing.get(student_id)
+        if current is None:
+            inserted.append(student)
+
+        elif (current.last_name, current.first_name) != (student.last_name, student.first_name):
+            current.last_name = student.last_name
+            current.first_name = student.first_name
+            updated.append(current)
+
+    StudentList.objects.bulk_create(inserted)
+    StudentList.objects.bulk_update(updated, ["last_name", "first_name"])
+
+    counts["inserted"] += len(inserted)
+    counts["updated"] += len(updated)
+    counts["unchanged"] += len(students) - len(inserted) - len(updated)
+
+
+def import_roster(lines, batch_size=BATCH_SIZE):
+    """Upsert the roster by student id, all or nothing.
+
+    `lines` is any iterable of CSV lines (an open file, a decoded upload),
+    only `batch_size` rows are held in memory at a time. Returns the number
+    of students inserted, updated and left unchanged.
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    students = read_roster(lines)
+
+    with transaction.atomic():
+        while batch := list(itertools.islice(students, batch_size)):
+            upsert_batch(batch, counts)
+
+    return counts
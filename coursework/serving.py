@@ -0,0 +1,130 @@
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.utils.cache import get_conditional_response
+from .storage import content_disposition
+from django.conf import settings
+from urllib.parse import quote
+import mimetypes
+import re
+
+
+# Size of the pieces read from the file for ranged responses
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """Return the (start, end) of a single byte range, None if not usable.
+
+    Raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    # Suffix range, the last N bytes
+    if not start:
+        length = int(end)
+        if not length:
+            raise ValueError
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """A range only applies if the client's copy is still current."""
+    validator = request.headers.get("If-Range")
+    if not validator:
+        return True
+    if validator.startswith(("W/", '"')):
+        return validator == etag
+    return parse_http_date_safe(validator) == last_modified
+
+
+def iter_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length:
+            data = file.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_file(request, field_file, filename, etag=None, as_attachment=False):
+    """Send a stored file with byte ranges & conditional GET support.
+
+    Object stores hand out a presigned URL & the browser is redirected to
+    it, the bytes never go through the app. With MEDIA_ACCEL_HEADER set
+    only the headers of local files are produced, the front proxy then
+    transfers the bytes (and handles ranges) by itself.
+    """
+    storage = field_file.storage
+    url = storage.download_url(field_file.name, filename, as_attachment)
+    if url is not None:
+        return HttpResponseRedirect(url)
+
+    # Missing from storage, e.g. removed by hand or not restored from a backup
+    try:
+        size = storage.size(field_file.name)
+        last_modified = int(storage.get_modified_time(field_file.name).timestamp())
+    except FileNotFoundError:
+        raise Http404("File not found.")
+    etag = quote_etag(etag or f"{last_modified:x}-{size:x}")
+
+    # Answer 304/412 when the client's copy is still good
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    # Hand the transfer to nginx / Apache
+    if settings.MEDIA_ACCEL_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_ACCEL_HEADER == "X-Accel-Redirect":
+            response["X-Accel-Redirect"] = quote(settings.MEDIA_ACCEL_PREFIX + field_file.name)
+        else:
+            response[settings.MEDIA_ACCEL_HEADER] = storage.path(field_file.name)
+
+    # Send a single byte range
+    elif "Range" in request.headers and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+        if byte_range is None:
+            response = FileResponse(storage.open(field_file.name, "rb"), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                iter_range(storage.open(field_file.name, "rb"), start, end - start + 1),
+                status=206,
+                content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = end - start + 1
+
+    # Send the whole file
+    else:
+        response = FileResponse(storage.open(field_file.name, "rb"), content_type=content_type)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Content-Disposition"] = content_disposition(filename, as_attachment)
+    return response
@@ -0,0 +1,66 @@
+from .notifications import adjust_request_count, adjusting_batch, forget_request_count
+from .models import Coursework, JoinCourseworkRequest, UploadFile, UploadSession
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.backends.signals import connection_created
+from .uploads import release_upload, remove_staging_file
+from django.core.signals import setting_changed
+from .metrics import install_query_recorder
+from .membership import forget_memberships
+from django.utils.functional import empty
+from .storage import submission_storage
+from django.dispatch import receiver
+from django.db import transaction
+
+
+@receiver(post_save, sender=JoinCourseworkRequest)
+def request_created(sender, instance, created, **kwargs):
+    # Counters only move once committed, a rolled back request never counted
+    if created:
+        transaction.on_commit(lambda: adjust_request_count(instance.coursework_id, 1))
+
+
+@receiver(post_delete, sender=JoinCourseworkRequest)
+def request_deleted(sender, instance, **kwargs):
+    # Batches adjust the counters by themselves
+    if not adjusting_batch.get():
+        transaction.on_commit(lambda: adjust_request_count(instance.coursework_id, -1))
+
+
+@receiver(post_delete, sender=UploadFile)
+def upload_deleted(sender, instance, **kwargs):
+    # Unlike an overridden delete(), also runs for cascades & queryset deletes
+    release_upload(instance)
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_deleted(sender, instance, **kwargs):
+    remove_staging_file(instance)
+
+
+@receiver(m2m_changed, sender=Coursework.taken_person.through)
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Memberships & counters of people joining or leaving a coursework get recomputed
+    if action in ("post_add", "post_remove"):
+        user_ids = [instance.pk] if reverse else pk_set
+
+    elif action == "pre_clear":
+        user_ids = [instance.pk] if reverse else list(
+            instance.taken_person.values_list("id", flat=True))
+
+    else:
+        return
+
+    forget_memberships(user_ids)
+    forget_request_count(user_ids)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+@receiver(setting_changed)
+def storages_changed(sender, setting, **kwargs):
+    # Django rebuilds its storages, the submission storage follows
+    if setting == "STORAGES":
+        submission_storage._wrapped = empty
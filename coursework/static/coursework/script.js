@@ -55,49 +55,221 @@ function editMemo(assignmentStatusId) {
         });
 }
 
-function uploadFile() {
+// CRC-32 lookup table used to checksum upload chunks
+const crcTable = new Uint32Array(256).map((_, n) => {
+    let c = n;
+    for (let k = 0; k < 8; k++) {
+        c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+    }
+    return c;
+});
+
+function crc32(bytes) {
+    let crc = 0xffffffff;
+    for (let i = 0; i < bytes.length; i++) {
+        crc = crcTable[(crc ^ bytes[i]) & 0xff] ^ (crc >>> 8);
+    }
+    return ((crc ^ 0xffffffff) >>> 0).toString(16).padStart(8, '0');
+}
+
+async function openUploadSession(assignmentId, file, direct) {
+    // Resume the unfinished session of the same file if there is one
+    const url = direct ? '/upload/direct' : '/upload/session';
+    const storageKey = `upload-${assignmentId}-${file.name}-${file.size}`;
+    const sessionId = localStorage.getItem(storageKey);
+
+    if (sessionId) {
+        const response = await fetch(`${url}/${sessionId}`);
+        if (response.ok) {
+            return { storageKey, sessionId, ...(await response.json()) };
+        }
+    }
+
+    // Otherwise create a new upload session
+    const result = await fetch(url, {
+        method: 'POST',
+        body: JSON.stringify({
+            assignmentId: assignmentId,
+            fileName: file.name,
+            fileSize: file.size,
+        }),
+    }).then((response) => response.json());
+
+    if (result.error) {
+        throw new Error(result.error);
+    }
+
+    localStorage.setItem(storageKey, result.session_id);
+    return { storageKey, sessionId: result.session_id, ...result };
+}
+
+async function uploadChunks(session, file) {
+    let offset = session.offset;
+    let failures = 0;
+
+    while (offset < file.size) {
+        // Send the next chunk with its checksum
+        const chunk = new Uint8Array(
+            await file.slice(offset, offset + session.chunk_size).arrayBuffer()
+        );
+        const index = Math.floor(offset / session.chunk_size);
+
+        try {
+            const response = await fetch(
+                `/upload/session/${session.sessionId}/chunk/${index}`,
+                {
+                    method: 'PUT',
+                    headers: { 'X-Chunk-Checksum': crc32(chunk) },
+                    body: chunk,
+                }
+            );
+            const result = await response.json();
+
+            // Resume from where the server is when the chunk is rejected
+            if (!response.ok && result.offset === undefined) {
+                throw new Error(result.error);
+            }
+            failures = response.ok ? 0 : failures + 1;
+            offset = result.offset;
+        } catch (error) {
+            // Ask the server where to resume after a dropped connection
+            failures += 1;
+            const response = await fetch(`/upload/session/${session.sessionId}`);
+            if (response.ok) {
+                offset = (await response.json()).offset;
+            }
+        }
+
+        if (failures >= 5) {
+            throw new Error('Upload failed, please try again!');
+        }
+    }
+}
+
+async function sha256(bytes) {
+    // WebCrypto has no incremental digest, each part is hashed on its own
+    const digest = await crypto.subtle.digest('SHA-256', bytes);
+    return Array.from(new Uint8Array(digest), (byte) =>
+        byte.toString(16).padStart(2, '0')
+    ).join('');
+}
+
+async function uploadParts(session, file) {
+    // Send the parts the object store doesn't hold yet, one in memory at a time
+    const count = Math.max(1, Math.ceil(file.size / session.chunk_size));
+    const received = new Set(session.parts);
+
+    for (let index = 0; index < count; index++) {
+        if (received.has(index)) {
+            continue;
+        }
+        const part = new Uint8Array(
+            await file
+                .slice(index * session.chunk_size, (index + 1) * session.chunk_size)
+                .arrayBuffer()
+        );
+        const checksum = await sha256(part);
+
+        for (let failures = 0; ; failures++) {
+            if (failures >= 5) {
+                throw new Error('Upload failed, please try again!');
+            }
+
+            // Get a presigned URL for the part, it then goes straight to the object store
+            try {
+                const upload = await fetch(
+                    `/upload/direct/${session.sessionId}/part/${index}`,
+                    { method: 'POST', body: JSON.stringify({ checksum }) }
+                ).then((response) => response.json());
+                if (upload.error) {
+                    throw new Error(upload.error);
+                }
+
+                const response = await fetch(upload.url, {
+                    method: 'PUT',
+                    headers: upload.headers,
+                    body: part,
+                });
+                if (response.ok) {
+                    break;
+                }
+            } catch (error) {
+                // Retry the part after a dropped connection
+            }
+        }
+    }
+}
+
+async function uploadFile() {
     // For use later
     const addButton = document.getElementById('label-upload');
     const spinner = document.getElementById('spinner');
+    const assignmentId = document.getElementById('assignment-id').value;
+    const input = document.getElementById('upload-file');
+    const file = input.files[0];
 
     // Hide add button & show spinner
     addButton.classList.add('d-none');
     spinner.classList.remove('d-none');
 
-    // Create and fill in form
-    const formData = new FormData();
+    try {
+        let result;
+        let session;
 
-    formData.append('studentId', document.getElementById('student-id').value);
-    formData.append(
-        'assignmentId',
-        document.getElementById('assignment-id').value
-    );
-    formData.append('file', document.getElementById('upload-file').files[0]);
+        // Send file to the object store in parts when the storage allows it,
+        // hashing them needs WebCrypto which is missing over plain HTTP
+        if (
+            input.dataset.directUpload !== undefined &&
+            window.crypto &&
+            crypto.subtle
+        ) {
+            session = await openUploadSession(assignmentId, file, true);
+            await uploadParts(session, file);
 
-    // Request upload file API
-    fetch('/upload/file', {
-        method: 'POST',
-        body: formData,
-    })
-        .then((response) => response.json())
-        .then((result) => {
-            // Show add button & hide spinner
-            addButton.classList.remove('d-none');
-            spinner.classList.add('d-none');
+            result = await fetch(
+                `/upload/direct/${session.sessionId}/complete`,
+                { method: 'POST' }
+            ).then((response) => response.json());
+        }
 
-            // Alert error if error
-            if (result.error) {
-                alert(result.error);
-            }
+        // Otherwise upload file chunk by chunk & assemble it on the server
+        else {
+            session = await openUploadSession(assignmentId, file, false);
+            await uploadChunks(session, file);
 
-            // Alert message if success
-            else if (result.message) {
-                alert(result.message);
-            }
+            result = await fetch(
+                `/upload/session/${session.sessionId}/finalize`,
+                { method: 'POST' }
+            ).then((response) => response.json());
+        }
 
-            // Refresh page
-            location.reload();
-        });
+        // Alert error if error
+        if (result.error) {
+            alert(result.error);
+        }
+
+        // Alert message if success
+        else if (result.message) {
+            localStorage.removeItem(session.storageKey);
+            alert(result.message);
+        }
+    } catch (error) {
+        alert(error.message);
+    }
+
+    // Show add button & hide spinner
+    addButton.classList.remove('d-none');
+    spinner.classList.add('d-none');
+
+    // Refresh page
+    location.reload();
+}
+
+function selectAllRequests(checked) {
+    // Tick or untick every request of the page
+    document
+        .querySelectorAll('.request-checkbox')
+        .forEach((checkbox) => (checkbox.checked = checked));
 }
 
 // https://getbootstrap.com/docs/5.2/forms/validation/#custom-styles
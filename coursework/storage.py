@@ -0,0 +1,353 @@
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.utils.functional import LazyObject
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlsplit
+from datetime import datetime, timezone
+from django.core.files import File
+from xml.etree import ElementTree
+import http.client
+import mimetypes
+import hashlib
+import base64
+import hmac
+import io
+
+
+# Size of the pieces sent & received
+CHUNK_SIZE = 1024 * 1024
+
+# Seconds a presigned URL stays valid
+URL_EXPIRES = 3600
+
+# Payload of signed requests, the body isn't hashed before being sent
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+# Bounds of multipart uploads, every part but the last is at least this big
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class SubmissionStorage(LazyObject):
+    """Storage of uploads, previews & result archives, the "submissions" entry of STORAGES."""
+
+    def _setup(self):
+        self._wrapped = storages["submissions"]
+
+
+submission_storage = SubmissionStorage()
+
+
+def get_submission_storage():
+    # Callable given to the file fields, so the backend is looked up at runtime
+    return submission_storage
+
+
+class LocalStorage(FileSystemStorage):
+    """Files under MEDIA_ROOT, sent & received through the app."""
+
+    direct_upload = False
+
+    def download_url(self, name, filename, as_attachment=False):
+        return None
+
+
+def content_disposition(filename, as_attachment):
+    return f"{'attachment' if as_attachment else 'inline'}; filename*=UTF-8''{quote(filename)}"
+
+
+def checksum_header(checksum):
+    """x-amz-checksum-sha256 value of a hex SHA-256."""
+    return base64.b64encode(bytes.fromhex(checksum)).decode()
+
+
+def signing_key(secret_key, date, region):
+    key = f"AWS4{secret_key}".encode()
+    for part in (date, region, "s3", "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+
+def query_string(query):
+    """Canonical query string, sorted & percent-encoded as SigV4 expects."""
+    return "&".join(
+        f"{quote(key, safe='-_.~')}={quote(str(value), safe='-_.~')}"
+        for key, value in sorted(query.items()))
+
+
+def signature(secret_key, region, method, path, query, headers, amz_date):
+    """AWS Signature Version 4 of a request, returns (signed headers, signature).
+
+    `query` holds every parameter but the signature, `headers` the headers
+    to sign (host included).
+    """
+    names = sorted(name.lower() for name in headers)
+    values = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed_headers = ";".join(names)
+
+    canonical_request = "\n".join([
+        method,
+        quote(path, safe="/-_.~"),
+        query_string(query),
+        "".join(f"{name}:{values[name]}\n" for name in names),
+        signed_headers,
+        UNSIGNED_PAYLOAD])
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest()])
+
+    return signed_headers, hmac.new(
+        signing_key(secret_key, amz_date[:8], region),
+        string_to_sign.encode(),
+        hashlib.sha256).hexdigest()
+
+
+class ObjectStoreError(OSError):
+    pass
+
+
+class ObjectReader(io.RawIOBase):
+    """Seekable read-only view of an object, fetched by ranges as it is read.
+
+    Sequential reads share one response, seeking elsewhere opens a new one.
+    """
+
+    def __init__(self, storage, name, size):
+        self.storage = storage
+        self.name = name
+        self.size = size
+        self.position = 0
+        self.response = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        position = {
+            io.SEEK_SET: offset,
+            io.SEEK_CUR: self.position + offset,
+            io.SEEK_END: self.size + offset}[whence]
+        if position != self.position:
+            self.drop_response()
+            self.position = max(position, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        if self.response is None:
+            self.response = self.storage.request(
+                "GET", self.name, {"Range": f"bytes={self.position}-"}, expected=(206,))
+
+        read = self.response.readinto(buffer)
+        self.position += read
+        return read
+
+    def drop_response(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+    def close(self):
+        self.drop_response()
+        super().close()
+
+
+class S3Storage(Storage):
+    """Files in a bucket of an S3-compatible object store.
+
+    Speaks the S3 REST API with path-style URLs, so AWS, MinIO, Ceph & co
+    all work without an SDK. Browsers download from the bucket & upload to
+    it in parts through presigned URLs, the bytes don't go through the app.
+    """
+
+    direct_upload = True
+
+    def __init__(self, endpoint_url, bucket, access_key, secret_key, region="us-east-1", expires=URL_EXPIRES):
+        self.endpoint = urlsplit(endpoint_url)
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.expires = expires
+
+    def object_path(self, name):
+        return f"/{self.bucket}/{name}"
+
+    def connection(self):
+        connection_class = http.client.HTTPSConnection if self.endpoint.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.endpoint.netloc, blocksize=CHUNK_SIZE)
+
+    def request(self, method, name, headers=None, body=None, expected=(200,), query=None):
+        """Send a signed request about object `name`, returns the open response."""
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers = {
+            **(headers or {}),
+            "Host": self.endpoint.netloc,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": UNSIGNED_PAYLOAD}
+        signed = {
+            name: value for name, value in headers.items()
+            if name.lower() in ("host", "range") or name.lower().startswith("x-amz-")}
+        signed_headers, request_signature = signature(
+            self.secret_key, self.region, method, self.object_path(name), query or {}, signed, amz_date)
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request, "
+            f"SignedHeaders={signed_headers}, Signature={request_signature}")
+
+        # One connection per request, the socket is closed with the response
+        connection = self.connection()
+        headers["Connection"] = "close"
+        path = quote(self.object_path(name), safe="/-_.~")
+        if query:
+            path = f"{path}?{query_string(query)}"
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+
+        if response.status not in expected:
+            response.close()
+            if response.status == 404:
+                raise FileNotFoundError(name)
+            raise ObjectStoreError(f"{method} {name}: {response.status} {response.reason}")
+        return response
+
+    def head(self, name):
+        response = self.request("HEAD", name)
+        response.close()
+        return response
+
+    def xml(self, method, name, **kwargs):
+        """Send a request answered in XML, returns the root element."""
+        with self.request(method, name, **kwargs) as response:
+            root = ElementTree.fromstring(response.read())
+
+        # Some operations fail with a 200 status & an error document
+        if root.tag.rpartition("}")[2] == "Error":
+            raise ObjectStoreError(f"{method} {name}: {root.findtext('{*}Code')} {root.findtext('{*}Message')}")
+        return root
+
+    def presigned_url(self, method, name, query=None, headers=None, expires=None):
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers = {"host": self.endpoint.netloc, **(headers or {})}
+        query = {
+            **(query or {}),
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(self.expires if expires is None else expires),
+            "X-Amz-SignedHeaders": ";".join(sorted(name.lower() for name in headers))}
+        _, query["X-Amz-Signature"] = signature(
+            self.secret_key, self.region, method, self.object_path(name), query, headers, amz_date)
+
+        return "{}://{}{}?{}".format(
+            self.endpoint.scheme,
+            self.endpoint.netloc,
+            quote(self.object_path(name), safe="/-_.~"),
+            query_string(query))
+
+    def download_url(self, name, filename, as_attachment=False):
+        """Presigned GET of the object, saved by the browser as `filename`."""
+        return self.presigned_url("GET", name, {
+            "response-content-disposition": content_disposition(filename, as_attachment),
+            "response-content-type": mimetypes.guess_type(filename)[0] or "application/octet-stream"})
+
+    def create_multipart(self, name):
+        """Start a multipart upload of object `name`, returns its upload ID."""
+        return self.xml(
+            "POST", name,
+            headers={"x-amz-checksum-algorithm": "SHA256"},
+            query={"uploads": ""}).findtext("{*}UploadId")
+
+    def part_url(self, name, upload_id, number, checksum):
+        """Presigned PUT of one part & the headers to send with it.
+
+        The store rejects a part whose SHA-256 isn't `checksum`.
+        """
+        headers = {"x-amz-checksum-sha256": checksum_header(checksum)}
+        query = {"partNumber": str(number), "uploadId": upload_id}
+        return self.presigned_url("PUT", name, query, headers), headers
+
+    def list_parts(self, name, upload_id):
+        """Parts received so far, dicts of number, size, etag & checksum by part number."""
+        parts = []
+        marker = "0"
+        while True:
+            root = self.xml("GET", name, query={"uploadId": upload_id, "part-number-marker": marker})
+            parts += [{
+                "number": int(part.findtext("{*}PartNumber")),
+                "size": int(part.findtext("{*}Size")),
+                "etag": part.findtext("{*}ETag"),
+                "checksum": part.findtext("{*}ChecksumSHA256", "")}
+                for part in root.iterfind("{*}Part")]
+
+            if root.findtext("{*}IsTruncated") != "true":
+                return sorted(parts, key=lambda part: part["number"])
+            marker = root.findtext("{*}NextPartNumberMarker")
+
+    def complete_multipart(self, name, upload_id, parts):
+        """Assemble the `parts` listed by list_parts() into object `name`."""
+        root = ElementTree.Element("CompleteMultipartUpload")
+        for part in parts:
+            element = ElementTree.SubElement(root, "Part")
+            ElementTree.SubElement(element, "PartNumber").text = str(part["number"])
+            ElementTree.SubElement(element, "ETag").text = part["etag"]
+            if part["checksum"]:
+                ElementTree.SubElement(element, "ChecksumSHA256").text = part["checksum"]
+
+        self.xml(
+            "POST", name,
+            headers={"Content-Type": "application/xml"},
+            body=ElementTree.tostring(root),
+            query={"uploadId": upload_id})
+
+    def abort_multipart(self, name, upload_id):
+        self.request("DELETE", name, expected=(200, 204, 404), query={"uploadId": upload_id}).close()
+
+    def copy(self, source, name):
+        """Copy object `source` to `name` inside the store, returns `name`."""
+        self.xml("PUT", name, headers={"x-amz-copy-source": quote(self.object_path(source), safe="/-_.~")})
+        return name
+
+    def _open(self, name, mode="rb"):
+        if "w" in mode or "a" in mode or "+" in mode:
+            raise ValueError("Objects are opened for reading only.")
+        size = self.size(name)
+        file = File(io.BufferedReader(ObjectReader(self, name, size), CHUNK_SIZE), name)
+        file.size = size
+        return file
+
+    def _save(self, name, content):
+        if hasattr(content, "seek") and content.seekable():
+            content.seek(0)
+        self.request("PUT", name, {
+            "Content-Length": str(content.size),
+            "Content-Type": mimetypes.guess_type(name)[0] or "application/octet-stream"},
+            body=content).close()
+        return name
+
+    def delete(self, name):
+        self.request("DELETE", name, expected=(200, 204, 404)).close()
+
+    def exists(self, name):
+        try:
+            self.head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return int(self.head(name).getheader("Content-Length"))
+
+    def get_modified_time(self, name):
+        return parsedate_to_datetime(self.head(name).getheader("Last-Modified"))
+
+    def url(self, name):
+        return self.presigned_url("GET", name)
@@ -1,3 +1,1771 @@
-from django.test import TestCase
+from .models import Assignment, AssignmentStatus, Blob, Course, Coursework, JoinCourseworkRequest, StudentList, UploadFile, UploadSession, User, path_and_rename
+from .uploads import attach_upload, delete_statuses, delete_uploads, expire_upload_sessions
+from .storage import MIN_PART_SIZE, ObjectStoreError, S3Storage, submission_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.tokens import default_token_generator
+from .join_requests import pending_requests, resolve_requests
+from django.db import IntegrityError, connection, transaction
+from .notifications import request_count, request_count_key
+from .provisioning import provision_accounts, student_email
+from django.db.migrations.executor import MigrationExecutor
+from django.core.mail.backends.locmem import EmailBackend
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+from django.utils.http import urlsafe_base64_encode
+from django.core.files.move import file_move_safe
+from .profiling import list_reports, load_report
+from django.core.files.base import ContentFile
+from .roster import RosterError, import_roster
+from .audio import analyze_upload, analyze_wav
+from django.utils.encoding import force_bytes
+from .mail import EmailDispatcher, dispatcher
+from django.db.models.query import QuerySet
+from urllib.request import Request, urlopen
+from django.core.mail import EmailMessage
+from .archive import sync_result_archive
+from django.template.base import Node
+from .objectstore import ObjectStore
+from django.core.cache import cache
+from urllib.error import HTTPError
+from .membership import is_member
+from .utils import generate_token
+from django.utils import timezone
+from .metrics import TIME_BUCKETS
+from django.conf import settings
+from unittest.mock import patch
+from datetime import timedelta
+from django.core import mail
+from . import loadtest
+import numpy as np
+import tempfile
+import hashlib
+import django
+import shutil
+import struct
+import json
+import wave
+import zlib
+import threading
+import time
+import sys
+import io
+import re
+import os
 
-# Create your tests here.
+
+class EmailDispatcherTest(TestCase):
+    def setUp(self):
+        # Local stand-in for the SMTP server, counting the connections made
+        self.connections = []
+
+        def connection_factory(**kwargs):
+            connection = EmailBackend(**kwargs)
+            self.connections.append(connection)
+            return connection
+
+        self.dispatcher = EmailDispatcher(
+            workers=1,
+            cooldown=60,
+            connection_factory=connection_factory)
+
+    def message(self, to):
+        return EmailMessage(subject="Subject", body="Body", to=[to])
+
+    def fail_send(self):
+        raise ConnectionError("Connection lost.")
+
+    def test_burst_reuses_connection(self):
+        for i in range(20):
+            self.dispatcher.send(self.message(f"{i}@example.com"))
+        self.dispatcher.join()
+
+        self.assertEqual(len(mail.outbox), 20)
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.dispatcher.metrics()["sent"], 20)
+        self.assertEqual(self.dispatcher.metrics()["queue_depth"], 0)
+
+    def test_duplicate_activation_emails_coalesced(self):
+        for _ in range(3):
+            self.dispatcher.send(self.message("1@example.com"), key="activate-1")
+        self.dispatcher.send(self.message("2@example.com"), key="activate-2")
+        self.dispatcher.join()
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.dispatcher.metrics()["coalesced"], 2)
+
+    def test_failed_batch_retried_on_fresh_connection(self):
+        # The first connection breaks after one message
+        def connection_factory(**kwargs):
+            connection = EmailBackend(**kwargs)
+            if not self.connections:
+                send_messages = connection.send_messages
+                connection.send_messages = lambda messages: (
+                    send_messages(messages) if not mail.outbox else self.fail_send())
+            self.connections.append(connection)
+            return connection
+
+        self.dispatcher.connection_factory = connection_factory
+        for i in range(3):
+            self.dispatcher.send(self.message(f"{i}@example.com"), key=f"activate-{i}")
+        self.dispatcher.join()
+
+        # Nothing lost, nothing sent twice
+        self.assertEqual([message.to for message in mail.outbox], [[f"{i}@example.com"] for i in range(3)])
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(self.dispatcher.metrics()["failed"], 0)
+
+    def test_failed_message_releases_key(self):
+        def connection_factory(**kwargs):
+            connection = EmailBackend(**kwargs)
+            connection.send_messages = lambda messages: self.fail_send()
+            self.connections.append(connection)
+            return connection
+
+        self.dispatcher.connection_factory = connection_factory
+        self.dispatcher.send(self.message("1@example.com"), key="activate-1")
+        self.dispatcher.join()
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(self.dispatcher.metrics()["failed"], 1)
+
+        # Given up on, the same email may be queued again at once
+        self.assertTrue(self.dispatcher.send(self.message("1@example.com"), key="activate-1"))
+        self.dispatcher.join()
+
+    def test_full_queue_drops_message(self):
+        dispatcher = EmailDispatcher(workers=0, max_queue=1)
+
+        self.assertTrue(dispatcher.send(self.message("1@example.com")))
+        self.assertFalse(dispatcher.send(self.message("2@example.com")))
+        self.assertEqual(dispatcher.metrics()["dropped"], 1)
+        self.assertEqual(dispatcher.metrics()["queue_depth"], 1)
+
+
+class ListingQueryCountTest(TestCase):
+    """Listings must run the same number of queries whatever their size."""
+
+    def setUp(self):
+        cache.clear()
+        self.student = User.objects.create_user("student", password="password")
+        self.client.force_login(self.student)
+
+    def add_courseworks(self, courseworks, assignments):
+        for i in range(courseworks):
+            coursework = Coursework.objects.create(
+                course=Course.objects.create(name=f"Course {Course.objects.count()}"))
+            coursework.taken_person.add(self.student)
+
+            # Half expired, half still open
+            for j in range(assignments):
+                Assignment.objects.create(
+                    coursework=coursework,
+                    title=f"Assignment {j}",
+                    deadline=timezone.now() + timedelta(days=j - assignments // 2))
+        return coursework
+
+    def test_index(self):
+        self.add_courseworks(1, 2)
+        with self.assertNumQueries(5):
+            self.client.get("/")
+
+        self.add_courseworks(8, 25)
+        with self.assertNumQueries(5):
+            response = self.client.get("/")
+        self.assertEqual(len(response.context["assignments"]), 202)
+
+    def test_coursework_view(self):
+        coursework = self.add_courseworks(1, 2)
+        with self.assertNumQueries(6):
+            self.client.get(f"/coursework/{coursework.id}")
+
+        coursework = self.add_courseworks(8, 200)
+        with self.assertNumQueries(6):
+            response = self.client.get(f"/coursework/{coursework.id}")
+        self.assertEqual(len(response.context["assignments"]), 200)
+
+
+def query_location():
+    """Template line being rendered when a query runs, with the line of code."""
+    frame = sys._getframe(2)
+    app_line = django_line = None
+
+    while frame is not None:
+        # Checking the type, not isinstance(), which would evaluate lazy objects
+        node = frame.f_locals.get("self")
+        if issubclass(type(node), Node) and getattr(node, "token", None) is not None:
+            template_line = f"{node.origin.template_name}:{node.token.lineno}"
+            return f"{template_line} ({app_line})" if app_line else template_line
+
+        # Innermost line of the app, else of Django outside the ORM
+        filename = frame.f_code.co_filename
+        if app_line is None and filename.startswith(os.path.join(settings.BASE_DIR, "coursework")) and filename != __file__:
+            app_line = f"{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno}"
+        if django_line is None and filename.startswith(os.path.dirname(django.__file__)) and f"{os.sep}db{os.sep}" not in filename:
+            django_line = f"django/{os.path.relpath(filename, os.path.dirname(django.__file__))}:{frame.f_lineno}"
+        frame = frame.f_back
+
+    return app_line or django_line
+
+
+class QueryBudget:
+    """Record every query with the template or code line it came from."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((query_location(), sql))
+        return execute(sql, params, many, context)
+
+    def report(self):
+        groups = {}
+        for location, sql in self.queries:
+            groups.setdefault(location, []).append(sql)
+
+        lines = []
+        for location, queries in sorted(groups.items(), key=lambda group: -len(group[1])):
+            lines.append(f"  {location}: {len(queries)} queries")
+            for sql in dict.fromkeys(queries):
+                lines.append(f"    {queries.count(sql)} x {sql}")
+        return "\n".join(lines)
+
+
+def add_upload(status, content, name="submission.txt"):
+    """Attach `content` to the status through the content-addressed store."""
+    return attach_upload(
+        status,
+        ContentFile(content, name=name),
+        hashlib.sha256(content).hexdigest(),
+        len(content))
+
+
+class TemporaryMediaMixin:
+    """Files of the test class go to a temporary MEDIA_ROOT, removed afterwards."""
+
+    @classmethod
+    def overridden_settings(cls, media):
+        return {
+            "MEDIA_ROOT": media,
+            "UPLOAD_STAGING_DIR": os.path.join(media, "staging")}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media, ignore_errors=True)
+        cls.enterClassContext(override_settings(**cls.overridden_settings(media)))
+
+
+class SubmissionMixin(TemporaryMediaMixin):
+    """A student of a coursework with an assignment due in `deadline`, & its status."""
+
+    deadline = timedelta(days=1)
+
+    def setUp(self):
+        super().setUp()
+        self.coursework = Coursework.objects.create(course=Course.objects.create(name="Course"))
+        self.assignment = Assignment.objects.create(
+            coursework=self.coursework,
+            title="Assignment",
+            deadline=timezone.now() + self.deadline)
+        self.student = User.objects.create_user("student")
+        self.coursework.taken_person.add(self.student)
+        self.status = AssignmentStatus.objects.create(assignment=self.assignment, student=self.student)
+
+    def upload(self, content, name="submission.txt", status=None):
+        return add_upload(status or self.status, content, name)
+
+
+class ViewQueryBudgetTest(TemporaryMediaMixin, TestCase):
+    """Every view must stay within its query budget whatever the amount of data.
+
+    Each view is requested once, then the data grows (more courseworks,
+    assignments, students, files and requests) and it is requested again:
+    both runs must fit the budget and make the same number of queries.
+    """
+
+    def setUp(self):
+        self.teacher = User.objects.create_user("teacher", status="Teacher")
+        self.assistant = User.objects.create_user("assistant", status="Teaching Assistant")
+        self.student = User.objects.create_user("student", password="password", is_email_verified=True)
+        self.courseworks = []
+        self.students = [self.student]
+        self.grow()
+
+        # Requested views are about these, which get more submissions as data grows
+        self.coursework = self.courseworks[0]
+        self.expired = self.coursework.assignment.get(title="Expired 0")
+        self.open = self.coursework.assignment.get(title="Open 1")
+
+    def grow(self):
+        """Add a coursework with 2 assignments & 5 students, submitting there & to the requested coursework.
+
+        Only new rows are added, so each call costs the same whatever was added before.
+        """
+        course = Course.objects.create(name=f"Course {len(self.courseworks)}")
+        coursework = Coursework.objects.create(course=course)
+        self.courseworks.append(coursework)
+
+        offset = len(self.students)
+        StudentList.objects.bulk_create(
+            StudentList(student_id=i, last_name="Student", first_name=str(i))
+            for i in range(offset, offset + 5))
+        students = [User.objects.create_user(str(i), first_name=str(i)) for i in range(offset, offset + 5)]
+        self.students += students
+
+        # The student & staff are in every coursework, newcomers in theirs & the first one
+        first = self.courseworks[0]
+        coursework.taken_person.add(self.teacher, self.assistant, self.student, *students)
+        if coursework != first:
+            first.taken_person.add(*students)
+        Assignment.objects.bulk_create([
+            Assignment(
+                coursework=coursework,
+                title="Expired 0",
+                deadline=timezone.now() - timedelta(days=1)),
+            Assignment(
+                coursework=coursework,
+                title="Open 1",
+                deadline=timezone.now() + timedelta(days=1))])
+
+        for assignment in coursework.assignment.all():
+            for student in [self.student, *students]:
+                self.submit(assignment, student)
+        if coursework != first:
+            for assignment in first.assignment.all():
+                for student in students:
+                    self.submit(assignment, student)
+
+        # A student asking to join the new & the first coursework
+        newcomer = User.objects.create_user(f"newcomer-{len(self.courseworks)}")
+        JoinCourseworkRequest.objects.bulk_create(
+            JoinCourseworkRequest(student=newcomer, coursework=joined)
+            for joined in {first, coursework})
+
+    def submit(self, assignment, student):
+        status, created = AssignmentStatus.objects.get_or_create(
+            assignment=assignment,
+            student=student,
+            defaults={"memo": f"Memo of {student}"})
+        if created:
+            self.add_file(status)
+        return status
+
+    def add_file(self, status):
+        return add_upload(status, os.urandom(64))
+
+    def assertQueryBudget(self, budget, user, request, prepare=None):
+        """Run request as user before & after growing the data.
+
+        What `prepare` returns, queried beforehand, is passed to request.
+        """
+        counts = []
+        for _ in range(2):
+            # Cached memberships & counters would hide the queries
+            cache.clear()
+            if user is None:
+                self.client.logout()
+            else:
+                self.client.force_login(user)
+
+            args = () if prepare is None else (prepare(),)
+            queries = QueryBudget()
+            # Work deferred until commit is part of the request
+            with connection.execute_wrapper(queries), self.captureOnCommitCallbacks(execute=True):
+                response = request(*args)
+                # Streamed responses query while being consumed
+                if response.streaming and response.get("Content-Type") != "text/event-stream":
+                    b"".join(response.streaming_content)
+
+            self.assertLess(response.status_code, 400, response.content if not response.streaming else "")
+            self.assertLessEqual(
+                len(queries.queries), budget,
+                f"{len(queries.queries)} queries over a budget of {budget}:\n{queries.report()}")
+            counts.append(len(queries.queries))
+            self.grow()
+
+        self.assertEqual(
+            counts[0], counts[1],
+            f"Queries grow with the data: {counts[0]} then {counts[1]}\n{queries.report()}")
+
+    def status(self, assignment):
+        return AssignmentStatus.objects.get(assignment=assignment, student=self.student)
+
+    def upload(self, assignment):
+        return UploadFile.objects.filter(assignment=self.status(assignment)).last()
+
+    def post_json(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type="application/json")
+
+    def test_index(self):
+        self.assertQueryBudget(5, self.student, lambda: self.client.get("/"))
+        self.assertQueryBudget(5, self.teacher, lambda: self.client.get("/"))
+
+    def test_activate_user(self):
+        self.assertQueryBudget(
+            2, None,
+            lambda user: self.client.get(
+                f"/activate/{urlsafe_base64_encode(force_bytes(user.pk))}/{generate_token.make_token(user)}"),
+            lambda: User.objects.create_user(f"unverified-{User.objects.count()}"))
+
+    def test_assignment_result(self):
+        # Archive created beforehand, new submissions then get added before each request
+        sync_result_archive(self.expired)
+        self.grow()
+        self.assertQueryBudget(10, self.teacher, lambda: self.client.post(
+            "/assignment/result", {"assignment-id": self.expired.id}))
+
+        # Submissions can still change, no archive yet
+        self.assertQueryBudget(8, self.teacher, lambda: self.client.post(
+            "/assignment/result", {"assignment-id": self.open.id}))
+        self.open.refresh_from_db()
+        self.assertFalse(self.open.result_zip_file)
+
+    def test_download_assignment_files(self):
+        self.assertQueryBudget(7, self.teacher, lambda: self.client.get(
+            f"/assignment/{self.open.id}/download"))
+        sync_result_archive(self.expired)
+        self.grow()
+        self.assertQueryBudget(8, self.teacher, lambda: self.client.get(
+            f"/assignment/{self.expired.id}/download"))
+
+    def test_coursework_view(self):
+        self.assertQueryBudget(6, self.student, lambda: self.client.get(
+            f"/coursework/{self.coursework.id}"))
+
+    def test_submit_assignment(self):
+        self.assertQueryBudget(8, self.student, lambda: self.client.get(
+            f"/coursework/{self.coursework.id}/assignment/{self.open.id}/submit"))
+
+    def test_view_submit_result(self):
+        self.assertQueryBudget(8, self.student, lambda: self.client.get(
+            f"/coursework/{self.coursework.id}/assignment/{self.expired.id}/view"))
+
+    def test_create_assignment(self):
+        self.assertQueryBudget(6, self.teacher, lambda: self.client.get(
+            f"/coursework/{self.coursework.id}/assignment/create"))
+
+    def test_create_coursework(self):
+        self.assertQueryBudget(5, self.teacher, lambda: self.client.get("/coursework/create"))
+
+    def test_join_coursework(self):
+        self.assertQueryBudget(5, self.student, lambda: self.client.get("/coursework/join"))
+
+    def test_request_coursework(self):
+        self.assertQueryBudget(5, self.teacher, lambda: self.client.get("/coursework/request"))
+        self.assertQueryBudget(5, self.teacher, lambda: self.client.get("/coursework/request?after=1"))
+
+    def test_resolve_coursework_requests(self):
+        # Every pending request at once, more of them as data grows, loaded again for the delete signals
+        def pending():
+            return list(JoinCourseworkRequest.objects.values_list("id", flat=True))
+
+        self.assertQueryBudget(
+            10, self.teacher,
+            lambda request_ids: self.client.post("/coursework/request", {
+                "request-id": request_ids,
+                "request-action": "Accept"}),
+            pending)
+        self.assertQueryBudget(
+            10, self.teacher,
+            lambda request_ids: self.client.post("/coursework/request", {
+                "request-id": request_ids,
+                "request-action": "Decline"}),
+            pending)
+
+    def test_serve_upload_file(self):
+        self.assertQueryBudget(
+            3, self.student,
+            lambda upload: self.client.get(f"/file/{upload.id}"),
+            lambda: self.upload(self.open))
+
+    def test_serve_upload_preview(self):
+        def preview():
+            upload = self.upload(self.open)
+            upload.preview.save(upload.checksum, ContentFile(b"preview"))
+            return upload
+
+        self.assertQueryBudget(
+            3, self.student,
+            lambda upload: self.client.get(f"/file/{upload.id}/preview"),
+            preview)
+
+    def test_metrics(self):
+        self.assertQueryBudget(0, None, lambda: self.client.get("/metrics"))
+
+    def test_set_password(self):
+        def link():
+            user = User.objects.create_user(f"provisioned-{User.objects.count()}")
+            return f"/password/{urlsafe_base64_encode(force_bytes(user.pk))}/{default_token_generator.make_token(user)}"
+
+        def form(path):
+            self.client.get(path)
+            return path.rsplit("/", 1)[0] + "/set-password"
+
+        self.assertQueryBudget(5, None, lambda path: self.client.get(path), link)
+        self.assertQueryBudget(6, None, lambda path: self.client.post(path, {
+            "new_password1": "correct horse battery",
+            "new_password2": "correct horse battery"}),
+            lambda: form(link()))
+
+    def test_login(self):
+        self.assertQueryBudget(0, None, lambda: self.client.get("/login"))
+        self.assertQueryBudget(9, None, lambda: self.client.post(
+            "/login", {"student-id": "student", "password": "password"}))
+
+    def test_logout(self):
+        self.assertQueryBudget(4, self.student, lambda: self.client.get("/logout"))
+
+    def test_register(self):
+        self.assertQueryBudget(0, None, lambda: self.client.get("/register"))
+
+    def test_count_coursework_request(self):
+        self.assertQueryBudget(3, self.teacher, lambda: self.client.get("/coursework/request/count"))
+
+    def test_stream_coursework_request(self):
+        self.assertQueryBudget(2, self.teacher, lambda: self.client.get("/coursework/request/stream"))
+
+    def test_delete_file(self):
+        self.assertQueryBudget(
+            10, self.student,
+            lambda upload: self.post_json("/delete/file", {"file_id": upload.id}),
+            lambda: self.add_file(self.status(self.open)))
+
+    def test_edit_memo(self):
+        self.assertQueryBudget(
+            4, self.student,
+            lambda status: self.post_json("/edit/memo", {"assignmentStatusId": status.id, "newMemo": "Edited"}),
+            lambda: self.status(self.open))
+
+    def test_upload_file(self):
+        self.assertQueryBudget(11, self.student, lambda: self.client.post("/upload/file", {
+            "assignmentId": self.open.id,
+            "studentId": self.student.id,
+            "file": ContentFile(os.urandom(64), name="upload.txt")}))
+
+    def test_admin(self):
+        admin = User.objects.create_superuser("admin")
+        for model, budget in (
+                ("uploadfile", 6), ("assignmentstatus", 6), ("joincourseworkrequest", 7),
+                ("assignment", 7), ("coursework", 6)):
+            with self.subTest(model):
+                self.assertQueryBudget(budget, admin, lambda: self.client.get(f"/admin/coursework/{model}/"))
+        self.assertQueryBudget(6, admin, lambda: self.client.get(
+            f"/admin/coursework/uploadfile/?coursework={self.coursework.id}&created_on__gte=2000-01-01T00:00:00%2B00:00"))
+        self.assertQueryBudget(4, admin, lambda: self.client.get(
+            "/admin/autocomplete/?app_label=coursework&model_name=uploadfile&field_name=assignment&term=student"))
+
+    def test_admin_delete_submissions(self):
+        admin = User.objects.create_superuser("admin")
+
+        def selected():
+            return list(UploadFile.objects.values_list("id", flat=True))
+
+        self.assertQueryBudget(16, admin, lambda upload_ids: self.client.post("/admin/coursework/uploadfile/", {
+            "action": "delete_submissions",
+            "_selected_action": upload_ids}), selected)
+
+    def test_upload_session(self):
+        def create():
+            return self.post_json("/upload/session", {
+                "assignmentId": self.open.id,
+                "fileName": "upload.txt",
+                "fileSize": 64})
+
+        def session():
+            self.client.force_login(self.student)
+            return json.loads(create().content)["session_id"], os.urandom(64)
+
+        def chunk(upload):
+            session_id, content = upload
+            return self.client.put(
+                f"/upload/session/{session_id}/chunk/0",
+                content,
+                content_type="application/octet-stream",
+                HTTP_X_CHUNK_CHECKSUM=f"{zlib.crc32(content):08x}")
+
+        def uploaded_session():
+            upload = session()
+            chunk(upload)
+            return upload
+
+        self.assertQueryBudget(5, self.student, create)
+        self.assertQueryBudget(
+            3, self.student,
+            lambda upload: self.client.get(f"/upload/session/{upload[0]}"),
+            session)
+        self.assertQueryBudget(4, self.student, chunk, session)
+        # Attached in a transaction holding the session's lock
+        self.assertQueryBudget(
+            14, self.student,
+            lambda upload: self.client.post(f"/upload/session/{upload[0]}/finalize"),
+            uploaded_session)
+
+    def test_direct_upload(self):
+        store = ObjectStore()
+        store.start()
+        self.addCleanup(store.stop)
+        self.enterContext(override_settings(STORAGES={
+            **settings.STORAGES,
+            "submissions": {
+                "BACKEND": "coursework.storage.S3Storage",
+                "OPTIONS": store.storage_options()}}))
+
+        def create():
+            return self.post_json("/upload/direct", {
+                "assignmentId": self.open.id,
+                "fileName": "upload.txt",
+                "fileSize": 64})
+
+        def session():
+            self.client.force_login(self.student)
+            return json.loads(create().content)["session_id"], os.urandom(64)
+
+        def part(upload):
+            session_id, content = upload
+            return self.post_json(
+                f"/upload/direct/{session_id}/part/0",
+                {"checksum": hashlib.sha256(content).hexdigest()})
+
+        def uploaded_session():
+            upload = session()
+            signed = json.loads(part(upload).content)
+            urlopen(Request(signed["url"], data=upload[1], headers=signed["headers"], method="PUT")).close()
+            return upload
+
+        self.assertQueryBudget(5, self.student, create)
+        self.assertQueryBudget(
+            3, self.student,
+            lambda upload: self.client.get(f"/upload/direct/{upload[0]}"),
+            session)
+        self.assertQueryBudget(3, self.student, part, session)
+        self.assertQueryBudget(
+            12, self.student,
+            lambda upload: self.client.post(f"/upload/direct/{upload[0]}/complete"),
+            uploaded_session)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user("student"))
+
+    def scrape(self):
+        """Samples of /metrics by series, with the exposition's comment lines."""
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        lines = response.content.decode().splitlines()
+        samples = dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+        return {series: float(value) for series, value in samples.items()}, lines
+
+    def test_request_metrics(self):
+        before, _ = self.scrape()
+        response = self.client.get("/")
+
+        # Time of the app, SQL & templates, as seen in the browser's network panel
+        timing = re.fullmatch(
+            r'app;dur=[\d.]+, db;dur=[\d.]+;desc="(\d+) queries", tpl;dur=[\d.]+',
+            response["Server-Timing"])
+        self.assertIsNotNone(timing)
+        queries = int(timing[1])
+        self.assertGreater(queries, 0)
+
+        after, lines = self.scrape()
+        series = 'sea_request_duration_seconds{}{{view="index"{}}}'
+        self.assertEqual(after[series.format("_count", "")] - before.get(series.format("_count", ""), 0), 1)
+        self.assertGreater(after[series.format("_sum", "")], before.get(series.format("_sum", ""), 0))
+
+        # Cumulative buckets, the last one counting every request
+        buckets = [after[series.format("_bucket", f',le="{bound}"')] for bound in TIME_BUCKETS]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(after[series.format("_bucket", ',le="+Inf"')], after[series.format("_count", "")])
+
+        queried = 'sea_request_queries_sum{view="index"}'
+        self.assertEqual(after[queried] - before.get(queried, 0), queries)
+        self.assertIn("# TYPE sea_request_duration_seconds histogram", lines)
+
+        # Emails of the dispatcher
+        self.assertIn("# TYPE sea_emails_sent_total counter", lines)
+        self.assertEqual(after["sea_emails_sent_total"], dispatcher.metrics()["sent"])
+        self.assertIn("sea_email_queue_depth", after)
+
+    def test_allowed_addresses(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="192.0.2.1").status_code, 403)
+
+
+class SlowRequestProfilerTest(TemporaryMediaMixin, TestCase):
+    @classmethod
+    def overridden_settings(cls, media):
+        # Every request profiled & reported
+        return {
+            **super().overridden_settings(media),
+            "SLOW_REQUEST_PROFILING": True,
+            "SLOW_REQUEST_SAMPLE_RATE": 1,
+            "SLOW_REQUEST_THRESHOLD": 0,
+            "SLOW_REQUEST_DIR": os.path.join(media, "profiles")}
+
+    def test_report(self):
+        self.client.force_login(User.objects.create_superuser("admin"))
+        self.client.get("/")
+
+        (name,) = list_reports()
+        report = load_report(name)
+        self.assertEqual(os.listdir(settings.SLOW_REQUEST_DIR), [name])
+        self.assertEqual((report["method"], report["path"], report["view"]), ("GET", "/", "index"))
+        self.assertEqual((report["user"], report["status"]), ("admin", 200))
+        self.assertTrue(report["queries"])
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in report["explain"]))
+        self.assertTrue(all(query["plan"] for query in report["explain"]))
+        self.assertIn("cumulative", report["profile"])
+
+        # Listed & shown in the admin
+        response = self.client.get("/admin/slow-requests/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'href="/admin/slow-requests/{name}"')
+        self.assertContains(response, "GET /")
+
+        response = self.client.get(f"/admin/slow-requests/{name}")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, report["explain"][0]["plan"][0])
+        self.assertEqual(self.client.get("/admin/slow-requests/missing.json").status_code, 404)
+
+
+def wav_file(samples, bits=16, rate=8000, float_samples=False, extensible=False, chunks=()):
+    """WAV file of a (frames, channels) array in [-1, 1], optional chunks around the format."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if float_samples:
+        data = samples.astype("<f4").tobytes()
+    elif bits == 8:
+        data = np.clip(samples * 128 + 128, 0, 255).astype(np.uint8).tobytes()
+    elif bits == 24:
+        values = np.clip(samples * 2 ** 23, -2 ** 23, 2 ** 23 - 1).astype("<i4")
+        data = values.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        data = np.clip(samples * 2 ** (bits - 1), -2 ** (bits - 1), 2 ** (bits - 1) - 1).astype(f"<i{bits // 8}").tobytes()
+
+    def chunk(chunk_id, body):
+        return struct.pack("<4sI", chunk_id, len(body)) + body + b"\0" * (len(body) % 2)
+
+    channels = samples.shape[1]
+    audio_format = 3 if float_samples else 1
+    fmt = struct.pack(
+        "<HHIIHH", 0xFFFE if extensible else audio_format, channels, rate,
+        rate * channels * bits // 8, channels * bits // 8, bits)
+    if extensible:
+        fmt += struct.pack("<HHIH", 22, bits, 0, audio_format) + bytes(14)
+
+    body = b"WAVE" + b"".join(chunk(*extra) for extra in chunks) + chunk(b"fmt ", fmt) + chunk(b"data", data)
+    return io.BytesIO(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+class AudioAnalysisTest(TestCase):
+    samples = [[0.0, 0.5], [-0.5, 0.25], [-1.0, 0.0], [0.75, -0.125]]
+
+    def analyze(self, source):
+        preview = io.BytesIO()
+        metadata = analyze_wav(source, preview)
+        preview.seek(0)
+        return metadata, preview
+
+    def test_decode(self):
+        # Every sample depth & encoding decodes to the same peaks
+        for name, source in (
+                ("8-bit", wav_file(self.samples, bits=8)),
+                ("16-bit", wav_file(self.samples)),
+                ("24-bit", wav_file(self.samples, bits=24)),
+                ("32-bit", wav_file(self.samples, bits=32)),
+                ("float", wav_file(self.samples, bits=32, float_samples=True)),
+                ("extensible", wav_file(self.samples, bits=24, extensible=True)),
+                ("extensible float", wav_file(self.samples, bits=32, float_samples=True, extensible=True)),
+                ("extra chunks", wav_file(self.samples, chunks=[(b"LIST", b"odd"), (b"bext", bytes(10))]))):
+            with self.subTest(name):
+                metadata, _ = self.analyze(source)
+                self.assertEqual(metadata["peaks"], [0.5, 0.5, 1.0, 0.75])
+                self.assertEqual((metadata["channels"], metadata["sample_rate"]), (2, 8000))
+                self.assertEqual(metadata["duration"], 4 / 8000)
+
+    def test_unsupported(self):
+        source = wav_file(self.samples)
+        source.getbuffer()[20:22] = struct.pack("<H", 2)
+        for source in (source, io.BytesIO(b"ID3" + bytes(100))):
+            with self.assertRaises(ValueError):
+                analyze_wav(source, io.BytesIO())
+
+    def test_peaks(self):
+        # One spike in 2000 frames, bars of 3 frames, decoded a few blocks at a time
+        samples = np.zeros((2000, 1))
+        samples[1000] = -1.0
+        with patch("coursework.audio.BLOCK_FRAMES", 64):
+            metadata, _ = self.analyze(wav_file(samples))
+
+        self.assertEqual(len(metadata["peaks"]), 667)
+        self.assertEqual(metadata["peaks"][333], 1.0)
+        self.assertEqual(sum(metadata["peaks"]), 1.0)
+
+    def test_preview(self):
+        # Stereo at twice the preview rate, mixed down to mono & downsampled
+        samples = np.tile([0.5, 0.0], (1000, 1))
+        _, preview = self.analyze(wav_file(samples, rate=16000))
+
+        with wave.open(preview, "rb") as reader:
+            self.assertEqual((reader.getnchannels(), reader.getsampwidth(), reader.getframerate()), (1, 2, 8000))
+            frames = np.frombuffer(reader.readframes(reader.getnframes()), dtype="<i2")
+        self.assertEqual(len(frames), 500)
+        self.assertTrue((frames == int(0.25 * 32767)).all())
+
+
+class AnalyzeUploadTest(SubmissionMixin, TransactionTestCase):
+    """Analyses run in worker threads, which close their connection afterwards."""
+
+    def test_shared_analysis(self):
+        content = wav_file(AudioAnalysisTest.samples).getvalue()
+        first = self.upload(content, "first.wav")
+        analyze_upload(first.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.peaks, [0.5, 0.5, 1.0, 0.75])
+
+        # The same content uploaded again reuses the results & preview without decoding
+        other = User.objects.create_user("other")
+        status = AssignmentStatus.objects.create(assignment=self.assignment, student=other)
+        second = self.upload(content, "second.wav", status)
+        with patch("coursework.audio.analyze_wav") as analyze:
+            analyze_upload(second.pk)
+        analyze.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual((second.peaks, second.preview.name), (first.peaks, first.preview.name))
+
+        # Other content is analyzed on its own
+        third = self.upload(wav_file(AudioAnalysisTest.samples[::-1]).getvalue(), "third.wav")
+        analyze_upload(third.pk)
+        third.refresh_from_db()
+        self.assertEqual(third.peaks, [0.75, 1.0, 0.5, 0.5])
+        self.assertNotEqual(third.preview.name, first.preview.name)
+
+
+class UploadSessionTest(SubmissionMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+        self.content = os.urandom(2500)
+
+    def create(self, size=None):
+        return self.client.post("/upload/session", json.dumps({
+            "assignmentId": self.assignment.pk,
+            "fileName": "report.txt",
+            "fileSize": len(self.content) if size is None else size,
+            "chunkSize": 1000}),
+            content_type="application/json")
+
+    def put(self, session_id, index, checksum=None):
+        chunk = self.content[index * 1000:(index + 1) * 1000]
+        return self.client.put(
+            f"/upload/session/{session_id}/chunk/{index}",
+            chunk,
+            content_type="application/octet-stream",
+            HTTP_X_CHUNK_CHECKSUM=checksum or f"{zlib.crc32(chunk):08x}")
+
+    def test_upload_file(self):
+        # Posted at once, the file is hashed while staged & moved into storage
+        os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+        staged = os.listdir(settings.UPLOAD_STAGING_DIR)
+        with patch("django.core.files.storage.filesystem.file_move_safe", wraps=file_move_safe) as move:
+            response = self.client.post("/upload/file", {
+                "assignmentId": self.assignment.pk,
+                "studentId": self.student.pk,
+                "file": ContentFile(self.content, name="report.txt")})
+        self.assertEqual(response.status_code, 201)
+
+        upload = UploadFile.objects.get(assignment=self.status)
+        self.assertEqual(upload.checksum, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(upload.size, len(self.content))
+        with upload.file.open("rb") as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(os.path.dirname(move.call_args.args[0]), settings.UPLOAD_STAGING_DIR)
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_DIR), staged)
+
+    def test_resume_and_finalize(self):
+        session_id = self.create().json()["session_id"]
+        self.assertEqual(self.put(session_id, 0).json(), {"offset": 1000})
+
+        # After a dropped connection the client asks where to resume
+        self.assertEqual(self.client.get(f"/upload/session/{session_id}").json(), {
+            "chunk_size": 1000, "offset": 1000, "next_chunk": 1})
+        self.assertEqual(self.put(session_id, 1).json(), {"offset": 2000})
+
+        # A chunk sent twice or ahead of time is refused with the offset to resume from
+        for index in (0, 1):
+            response = self.put(session_id, index)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()["offset"], 2000)
+
+        response = self.client.post(f"/upload/session/{session_id}/finalize")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["offset"], 2000)
+
+        self.put(session_id, 2)
+        staging_path = UploadSession.objects.get().staging_path
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/upload/session/{session_id}/finalize")
+        self.assertEqual(response.status_code, 201)
+
+        # Checksum computed over the assembled file
+        upload = UploadFile.objects.get()
+        self.assertEqual(upload.checksum, hashlib.sha256(self.content).hexdigest())
+        with upload.file.open("rb") as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(staging_path))
+
+    def test_out_of_order(self):
+        session_id = self.create().json()["session_id"]
+        response = self.put(session_id, 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 0)
+
+    def test_checksum_mismatch(self):
+        session_id = self.create().json()["session_id"]
+        self.put(session_id, 0)
+
+        # The corrupted chunk is cut off the staged file, the offset doesn't move
+        response = self.put(session_id, 1, checksum="00000000")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["offset"], 1000)
+        self.assertEqual(os.path.getsize(UploadSession.objects.get().staging_path), 1000)
+        self.assertEqual(self.put(session_id, 1).json(), {"offset": 2000})
+
+    @override_settings(UPLOAD_MAX_SIZE=10000, UPLOAD_SESSION_LIMIT=2)
+    def test_limits(self):
+        self.assertEqual(self.create(size=10001).status_code, 400)
+        self.assertEqual(self.create().status_code, 201)
+        self.assertEqual(self.create().status_code, 201)
+        self.assertEqual(self.create().status_code, 429)
+
+        # Expired sessions no longer count
+        UploadSession.objects.update(created_on=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.create().status_code, 201)
+
+    def test_expire(self):
+        session_id = self.create().json()["session_id"]
+        self.put(session_id, 0)
+        upload_session = UploadSession.objects.get()
+        UploadSession.objects.update(created_on=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.client.get(f"/upload/session/{session_id}").status_code, 404)
+        self.assertEqual(self.put(session_id, 1).status_code, 404)
+
+        # Left over by a crash
+        stray = os.path.join(settings.UPLOAD_STAGING_DIR, "stray.upload")
+        open(stray, "wb").close()
+        os.utime(stray, (0, 0))
+        live = self.create().json()["session_id"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_upload_sessions(), 1)
+        self.assertFalse(os.path.exists(upload_session.staging_path))
+        self.assertFalse(os.path.exists(stray))
+        self.assertTrue(os.path.exists(UploadSession.objects.get(pk=live).staging_path))
+
+
+class JoinRequestQueueTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.assistant = User.objects.create_user("assistant", status="Teaching Assistant")
+        self.coursework = Coursework.objects.create(course=Course.objects.create(name="Course"))
+        self.other = Coursework.objects.create(course=Course.objects.create(name="Other"))
+        self.coursework.taken_person.add(self.assistant)
+
+        self.students = [User.objects.create_user(f"student-{i}") for i in range(7)]
+        for student in self.students:
+            JoinCourseworkRequest.objects.create(student=student, coursework=self.coursework)
+            JoinCourseworkRequest.objects.create(student=student, coursework=self.other)
+
+    def test_pages(self):
+        # Only requests of the assistant's courseworks, each exactly once
+        seen, after = [], None
+        while True:
+            page, after = pending_requests(self.assistant, after, page_size=3)
+            seen += page
+            if after is None:
+                break
+
+        self.assertEqual(
+            [request.student for request in seen],
+            self.students)
+        self.assertEqual({request.coursework for request in seen}, {self.coursework})
+
+    def test_resolve(self):
+        # Cached before the requests get resolved
+        self.assertEqual(request_count(self.assistant), 7)
+        self.assertFalse(is_member(self.students[0], self.coursework.id))
+
+        accepted = list(JoinCourseworkRequest.objects.filter(coursework=self.coursework)[:4])
+        with self.captureOnCommitCallbacks(execute=True):
+            resolve_requests(self.assistant, [request.id for request in accepted], accept=True)
+
+        self.assertEqual(
+            set(self.coursework.taken_person.all()),
+            {self.assistant, *(request.student for request in accepted)})
+        self.assertTrue(is_member(accepted[0].student, self.coursework.id))
+        self.assertEqual(request_count(self.assistant), 3)
+
+        # Requests of another coursework are left alone
+        other = JoinCourseworkRequest.objects.filter(coursework=self.other)
+        declined = list(JoinCourseworkRequest.objects.filter(coursework=self.coursework)) + list(other)
+        with self.captureOnCommitCallbacks(execute=True):
+            resolved = resolve_requests(self.assistant, [request.id for request in declined], accept=False)
+
+        self.assertEqual(len(resolved), 3)
+        self.assertEqual(other.count(), 7)
+        self.assertEqual(self.coursework.taken_person.count(), 5)
+        self.assertEqual(request_count(self.assistant), 0)
+
+    def test_rolled_back_request(self):
+        self.assertEqual(request_count(self.assistant), 7)
+
+        # Counted once committed only
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    JoinCourseworkRequest.objects.create(student=self.assistant, coursework=self.other)
+                    JoinCourseworkRequest.objects.filter(student=self.students[0], coursework=self.coursework).delete()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(request_count(self.assistant), 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            JoinCourseworkRequest.objects.filter(student=self.students[0], coursework=self.coursework).delete()
+        self.assertEqual(request_count(self.assistant), 6)
+
+    def test_request_count_stream(self):
+        # Under WSGI pages fetch the count, the stream sends it once without holding a thread
+        self.client.force_login(self.assistant)
+        self.assertFalse(self.client.get("/").context["request_count_stream"])
+
+        response = self.client.get("/coursework/request/stream")
+        self.assertEqual(b"".join(response.streaming_content), (
+            b"retry: 60000\n\n"
+            b'data: {"request_count": 7, "delta": 7}\n\n'))
+
+    def test_membership_expiry(self):
+        self.assertFalse(is_member(self.students[0], self.coursework.id))
+
+        # Changed by another process, seen once the cached entry expires
+        Coursework.taken_person.through.objects.create(coursework=self.coursework, user=self.students[0])
+        self.assertFalse(is_member(self.students[0], self.coursework.id))
+        later = time.time() + settings.MEMBERSHIP_CACHE_TIMEOUT + 1
+        with patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertTrue(is_member(self.students[0], self.coursework.id))
+
+    def test_request_count_expiry(self):
+        self.assertEqual(request_count(self.assistant), 7)
+
+        # Changed by another process, recounted once the cached counter expires
+        JoinCourseworkRequest.objects.filter(student=self.students[0]).delete()
+        cache.set(request_count_key(self.assistant.id), 7, settings.REQUEST_COUNT_CACHE_TIMEOUT)
+        self.assertEqual(request_count(self.assistant), 7)
+        later = time.time() + settings.REQUEST_COUNT_CACHE_TIMEOUT + 1
+        with patch("django.core.cache.backends.locmem.time.time", return_value=later):
+            self.assertEqual(request_count(self.assistant), 6)
+
+
+class RosterTest(TestCase):
+    def setUp(self):
+        StudentList.objects.create(student_id=1, last_name="Chen", first_name="Wei")
+        StudentList.objects.create(student_id=2, last_name="Lin", first_name="Mei")
+
+    def students(self):
+        return list(StudentList.objects.values_list("student_id", "last_name", "first_name"))
+
+    def test_upsert(self):
+        counts = import_roster([
+            "\ufeffFirst_Name,Student_ID,Last_Name\n",
+            "Wei,1,Chen\n",
+            "Ling,2,Lin\n",
+            "\n",
+            "Hao,3,Wang\n",
+            "Yu,3,Wang\n"])
+
+        # Last occurrence of a student id wins, counted once
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "unchanged": 1})
+        self.assertEqual(self.students(), [(1, "Chen", "Wei"), (2, "Lin", "Ling"), (3, "Wang", "Yu")])
+
+    def test_duplicates_across_batches(self):
+        import_roster(["student_id,last_name,first_name\n", "3,Wang,Hao\n", "4,Wu,Jie\n", "3,Wang,Yu\n"], batch_size=2)
+        self.assertEqual(self.students()[2:], [(3, "Wang", "Yu"), (4, "Wu", "Jie")])
+
+    def test_rollback(self):
+        # A malformed row after a written batch leaves the list untouched
+        with self.assertRaisesMessage(RosterError, "Line 4"):
+            import_roster(["student_id,last_name,first_name\n", "1,Chen,Bo\n", "3,Wang,Hao\n", "x,Wu,Jie\n"], batch_size=2)
+        self.assertEqual(self.students(), [(1, "Chen", "Wei"), (2, "Lin", "Mei")])
+
+
+class ProvisioningTest(TestCase):
+    def setUp(self):
+        # Keys of emails queued by earlier tests, whose user IDs come again
+        dispatcher.recent.clear()
+        self.students = [
+            StudentList.objects.create(first_name=f"First{i}", last_name="Last", student_id=1000 + i)
+            for i in range(3)]
+
+    def provision(self):
+        counts = provision_accounts(StudentList.objects.all(), "testserver", batch_size=2)
+        dispatcher.join()
+        return counts
+
+    def test_skip_registered(self):
+        registered = User.objects.create_user("1001", email="own@example.com", password="own password")
+
+        # Students with an account keep it & get no email
+        self.assertEqual(self.provision(), {"created": 2, "skipped": 1})
+        self.assertEqual(self.provision(), {"created": 0, "skipped": 3})
+        registered.refresh_from_db()
+        self.assertTrue(registered.check_password("own password"))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [student_email(1000), student_email(1002)])
+
+    def test_set_password_link(self):
+        self.assertEqual(self.provision(), {"created": 3, "skipped": 0})
+        user = User.objects.get(username="1000")
+        self.assertFalse(user.has_usable_password())
+
+        # The email carries a one-time link, no password
+        body = next(message.body for message in mail.outbox if message.to == [user.email])
+        link = re.search(r"http://testserver(/password/\S+)", body).group(1)
+        response = self.client.get(link, follow=True)
+        response = self.client.post(response.redirect_chain[-1][0], {
+            "new_password1": "correct horse battery",
+            "new_password2": "correct horse battery"})
+        self.assertRedirects(response, "/login", fetch_redirect_response=False)
+
+        user.refresh_from_db()
+        self.assertTrue(user.is_email_verified)
+        self.assertTrue(self.client.login(username="1000", password="correct horse battery"))
+
+        # Used once, the link no longer works
+        self.client.logout()
+        response = self.client.get(link, follow=True)
+        self.assertFalse(response.context["validlink"])
+
+
+class LoadTestTest(TemporaryMediaMixin, TransactionTestCase):
+    """The load test replays what script.js sends, against a server in a thread."""
+
+    @classmethod
+    def overridden_settings(cls, media):
+        return {**super().overridden_settings(media), "ALLOWED_HOSTS": ["127.0.0.1"]}
+
+    def test_run(self):
+        report = loadtest.run(students=2, concurrency=2, file_size=1024, chunk_size=512)
+
+        # Every student got through every step script.js takes
+        self.assertEqual(report["completed"], 2)
+        self.assertEqual(set(report["steps"]), {
+            "login page", "login", "submit page", "upload session", "upload chunk", "finalize", "edit memo"})
+        self.assertEqual({step: stats["errors"] for step, stats in report["steps"].items() if stats["errors"]}, {})
+        self.assertEqual(report["steps"]["upload chunk"]["requests"], 4)
+        self.assertGreater(report["lock_waits"]["transactions"], 0)
+
+        # The seeded coursework, students & files are gone
+        self.assertFalse(Coursework.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+
+
+class FinalizeRaceTest(SubmissionMixin, TransactionTestCase):
+    """A retried finalize runs alongside the first, each request in a thread of its own."""
+
+    def test_concurrent_finalize(self):
+        self.client.force_login(self.student)
+        content = os.urandom(1000)
+        session_id = self.client.post("/upload/session", json.dumps({
+            "assignmentId": self.assignment.pk,
+            "fileName": "report.txt",
+            "fileSize": len(content),
+            "chunkSize": 1000}),
+            content_type="application/json").json()["session_id"]
+        self.client.put(
+            f"/upload/session/{session_id}/chunk/0",
+            content,
+            content_type="application/octet-stream",
+            HTTP_X_CHUNK_CHECKSUM=f"{zlib.crc32(content):08x}")
+
+        # The first attach is slowed down, the retry comes in meanwhile
+        def slow_attach(*args):
+            time.sleep(0.2)
+            return attach_upload(*args)
+
+        statuses = []
+
+        def finalize():
+            try:
+                statuses.append(self.client.post(f"/upload/session/{session_id}/finalize").status_code)
+            finally:
+                connection.close()
+
+        with patch("coursework.views.attach_upload", slow_attach):
+            threads = [threading.Thread(target=finalize) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.05)
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(statuses, [201, 404])
+        self.assertEqual(UploadFile.objects.get().size, len(content))
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class UniqueConstraintTest(TestCase):
+    def setUp(self):
+        self.coursework = Coursework.objects.create(course=Course.objects.create(name="Course"))
+        self.assignment = Assignment.objects.create(
+            coursework=self.coursework,
+            title="Assignment",
+            deadline=timezone.now() + timedelta(days=1))
+        self.student = User.objects.create_user("student")
+
+    def test_duplicates_rejected(self):
+        AssignmentStatus.objects.create(assignment=self.assignment, student=self.student)
+        JoinCourseworkRequest.objects.create(student=self.student, coursework=self.coursework)
+        StudentList.objects.create(student_id=1, last_name="Chen", first_name="Wei")
+
+        for create in (
+                lambda: AssignmentStatus.objects.create(assignment=self.assignment, student=self.student),
+                lambda: JoinCourseworkRequest.objects.create(student=self.student, coursework=self.coursework),
+                lambda: StudentList.objects.create(student_id=1, last_name="Lin", first_name="Mei")):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                create()
+
+    def test_get_or_create_race(self):
+        # Someone else inserts the row between the lookup & the insert
+        get = QuerySet.get
+        raced = set()
+
+        def racing_get(queryset, *args, **kwargs):
+            if queryset.model not in raced:
+                raced.add(queryset.model)
+                queryset.model.objects.create(**kwargs)
+                raise queryset.model.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, "get", racing_get):
+            status, created = AssignmentStatus.objects.get_or_create(
+                assignment=self.assignment, student=self.student)
+            request, request_created = JoinCourseworkRequest.objects.get_or_create(
+                student=self.student, coursework=self.coursework)
+
+        self.assertFalse(created)
+        self.assertFalse(request_created)
+        self.assertEqual(list(AssignmentStatus.objects.all()), [status])
+        self.assertEqual(list(JoinCourseworkRequest.objects.all()), [request])
+
+
+class DedupeMigrationTest(TransactionTestCase):
+    """Duplicates from before the unique constraints are merged by migration 0040, not lost."""
+
+    before = [("coursework", "0039_uploadfile_wav_analysis")]
+    after = [("coursework", "0040_constraints_indexes")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes("coursework"))
+
+    def test_dedupe(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model("coursework", "User")
+        Assignment = apps.get_model("coursework", "Assignment")
+        AssignmentStatus = apps.get_model("coursework", "AssignmentStatus")
+        JoinCourseworkRequest = apps.get_model("coursework", "JoinCourseworkRequest")
+        StudentList = apps.get_model("coursework", "StudentList")
+        UploadFile = apps.get_model("coursework", "UploadFile")
+
+        coursework = apps.get_model("coursework", "Coursework").objects.create(
+            course=apps.get_model("coursework", "Course").objects.create(name="Course"))
+        assignment = Assignment.objects.create(
+            coursework=coursework,
+            title="Assignment",
+            deadline=timezone.now())
+        student = User.objects.create(username="student")
+
+        kept, *others = [
+            AssignmentStatus.objects.create(assignment=assignment, student=student, memo=memo)
+            for memo in ("First", "Second", "First", None)]
+        for status in others:
+            UploadFile.objects.create(assignment=status, file=f"{status.pk}.txt")
+        for _ in range(2):
+            JoinCourseworkRequest.objects.create(student=student, coursework=coursework)
+        StudentList.objects.create(student_id=1, last_name="Chen", first_name="Wei")
+        StudentList.objects.create(student_id=1, last_name="Lin", first_name="Mei")
+
+        apps = self.migrate(self.after)
+        AssignmentStatus = apps.get_model("coursework", "AssignmentStatus")
+
+        # Files & distinct memos of the duplicates end up in the oldest status
+        self.assertEqual(list(AssignmentStatus.objects.values_list("pk", "memo")), [(kept.pk, "First\n\nSecond")])
+        self.assertEqual(
+            sorted(apps.get_model("coursework", "UploadFile").objects.values_list("assignment", "file")),
+            [(kept.pk, f"{status.pk}.txt") for status in others])
+        self.assertEqual(apps.get_model("coursework", "JoinCourseworkRequest").objects.count(), 1)
+        self.assertEqual(
+            list(apps.get_model("coursework", "StudentList").objects.values_list("student_id", "last_name")),
+            [(1, "Lin")])
+
+
+class DeleteUploadsTest(SubmissionMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.statuses = [self.status] + [
+            AssignmentStatus.objects.create(
+                assignment=self.assignment,
+                student=User.objects.create_user(f"student-{i}"))
+            for i in range(1, 3)]
+
+    def test_shared_blobs(self):
+        # Every student submits the same file, 2 of them submit another one too
+        uploads = [self.upload(b"shared", status=status) for status in self.statuses]
+        own = [self.upload(os.urandom(64), status=status) for status in self.statuses[:2]]
+
+        deleted = delete_uploads(
+            UploadFile.objects.filter(pk__in=[upload.pk for upload in uploads[:2] + own]),
+            batch_size=2)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(UploadFile.objects.all()), [uploads[2]])
+
+        # Content still referenced stays, the rest is gone with its files
+        shared = uploads[2].blob
+        shared.refresh_from_db()
+        self.assertEqual(shared.ref_count, 1)
+        self.assertTrue(os.path.exists(shared.file.path))
+        for upload in own:
+            self.assertFalse(Blob.objects.filter(pk=upload.blob_id).exists())
+            self.assertFalse(os.path.exists(upload.blob.file.path))
+
+    def test_statuses(self):
+        for status in self.statuses:
+            self.upload(b"shared", status=status)
+        blob = UploadFile.objects.first().blob
+
+        self.assertEqual(delete_statuses(AssignmentStatus.objects.all()), 3)
+        self.assertFalse(AssignmentStatus.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob.file.path))
+
+    def test_cascade(self):
+        for status in self.statuses:
+            self.upload(b"shared", status=status)
+        blob = UploadFile.objects.first().blob
+
+        # Statuses deleted one by one or as a queryset take their uploads' references along
+        with self.captureOnCommitCallbacks(execute=True):
+            self.statuses[0].delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertTrue(os.path.exists(blob.file.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AssignmentStatus.objects.all().delete()
+        self.assertFalse(UploadFile.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob.file.path))
+
+
+class StoragePrefixTest(SubmissionMixin, TestCase):
+    deadline = -timedelta(days=1)
+
+    def test_prefix(self):
+        other = Assignment.objects.create(
+            coursework=self.coursework,
+            title="Assignment",
+            deadline=timezone.now())
+        self.assertNotEqual(self.assignment.storage_prefix, other.storage_prefix)
+
+        # assignments/<2 chars>/<2 chars>/<key>
+        _, first, second, key = self.assignment.storage_prefix.split(os.sep)
+        self.assertEqual((first, second), (key[:2], key[2:4]))
+
+    def test_path_without_queries(self):
+        status = AssignmentStatus.objects.select_related("assignment", "student").get(pk=self.status.pk)
+        with self.assertNumQueries(0):
+            path = path_and_rename(UploadFile(assignment=status), "report.final.pdf")
+        self.assertEqual(path, os.path.join(self.assignment.storage_prefix, "student.pdf"))
+
+    def test_rename(self):
+        self.upload(b"content", "report.txt")
+        sync_result_archive(self.assignment)
+        name = self.assignment.result_zip_file.name
+
+        # Renamed afterwards, the archive stays where it is & gets updated
+        self.coursework.course.name = "Renamed course"
+        self.coursework.course.save()
+        self.assignment.title = "Renamed"
+        self.assignment.save()
+        self.upload(b"more", "notes.txt")
+        sync_result_archive(self.assignment)
+
+        self.assertEqual(self.assignment.result_zip_file.name, name)
+        self.assertTrue(name.startswith(self.assignment.storage_prefix))
+        with ZipFile(self.assignment.result_zip_file.path) as zip_file:
+            self.assertEqual(sorted(zip_file.namelist()), ["student.txt", "student_1.txt"])
+
+    def test_archive_replaced(self):
+        kept = self.upload(b"kept " * 1000, "report.txt")
+        removed = self.upload(b"removed", "image.png")
+        sync_result_archive(self.assignment)
+        path = self.assignment.result_zip_file.path
+
+        # Added members go into a copy, a download under way keeps the archive it started with
+        self.upload(b"added", "notes.md")
+        with open(path, "rb") as before:
+            sync_result_archive(self.assignment)
+            self.assertNotEqual(os.fstat(before.fileno()).st_ino, os.stat(path).st_ino)
+            with ZipFile(before) as zip_file:
+                self.assertEqual(zip_file.namelist(), ["student.png", "student.txt"])
+                self.assertIsNone(zip_file.testzip())
+        with ZipFile(path) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["student.png", "student.txt", "student.md"])
+
+        # Removed members get the archive rewritten
+        removed.delete()
+        sync_result_archive(self.assignment)
+        with ZipFile(path) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["student.txt", "student.md"])
+            self.assertEqual(zip_file.read("student.txt"), b"kept " * 1000)
+            self.assertEqual(zip_file.getinfo("student.txt").comment, str(kept.pk).encode())
+            self.assertIsNone(zip_file.testzip())
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))), ["result.lock", "result.zip"])
+
+
+class StreamZipTest(SubmissionMixin, TestCase):
+    def test_download(self):
+        teacher = User.objects.create_user("teacher", status="Teacher")
+        self.coursework.taken_person.add(teacher)
+        text, image = b"text " * 1000, os.urandom(1000)
+        self.upload(text, "report.txt")
+        self.upload(image, "figure.png")
+
+        # Before the deadline the archive is built as it is sent
+        self.client.force_login(teacher)
+        response = self.client.get(f"/assignment/{self.assignment.pk}/download")
+        self.assertEqual(response["Content-Type"], "application/zip")
+
+        with ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["student.png", "student.txt"])
+            self.assertEqual(zip_file.read("student.txt"), text)
+            self.assertEqual(zip_file.read("student.png"), image)
+            self.assertEqual(zip_file.getinfo("student.txt").compress_type, ZIP_DEFLATED)
+            self.assertEqual(zip_file.getinfo("student.png").compress_type, ZIP_STORED)
+            self.assertIsNone(zip_file.testzip())
+
+
+class ServeFileTest(SubmissionMixin, TestCase):
+    """Uploads sent from local disk by serve_upload_file."""
+
+    content = bytes(range(256)) * 4
+
+    @classmethod
+    def overridden_settings(cls, media):
+        return {**super().overridden_settings(media), "MEDIA_ACCEL_HEADER": None}
+
+    def setUp(self):
+        super().setUp()
+        self.served = self.upload(self.content, "report.pdf")
+        self.client.force_login(self.student)
+
+    def get(self, **headers):
+        return self.client.get(f"/file/{self.served.pk}", headers=headers)
+
+    def assertRange(self, response, start, end):
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/{len(self.content)}")
+        self.assertEqual(response["Content-Length"], str(end - start + 1))
+        self.assertEqual(b"".join(response.streaming_content), self.content[start:end + 1])
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Content-Disposition"], "inline; filename*=UTF-8''student.pdf")
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_missing_file(self):
+        self.served.file.delete(save=False)
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_range(self):
+        self.assertRange(self.get(Range="bytes=100-199"), 100, 199)
+        self.assertRange(self.get(Range="bytes=1000-"), 1000, 1023)
+
+        # An end past the file is cut to its last byte
+        self.assertRange(self.get(Range="bytes=1000-5000"), 1000, 1023)
+
+        # Several ranges aren't supported, the whole file is sent
+        response = self.get(Range="bytes=0-9,20-29")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_suffix_range(self):
+        self.assertRange(self.get(Range="bytes=-24"), 1000, 1023)
+
+        # A suffix longer than the file is the whole file
+        self.assertRange(self.get(Range="bytes=-5000"), 0, 1023)
+
+    def test_unsatisfiable(self):
+        for header in ("bytes=1024-", "bytes=200-100", "bytes=-0"):
+            response = self.get(Range=header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+        self.assertRange(self.get(Range="bytes=0-9", If_Range=etag), 0, 9)
+
+        # The client's copy is outdated, it gets the whole file
+        response = self.get(Range="bytes=0-9", If_Range='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response["ETag"], f'"{self.served.checksum}"')
+
+        response = self.get(If_None_Match=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        self.assertEqual(self.get(If_None_Match='"outdated"').status_code, 200)
+
+    def test_accel_header(self):
+        # Only the headers are sent, the proxy reads the file & handles ranges
+        with override_settings(MEDIA_ACCEL_HEADER="X-Sendfile"):
+            response = self.get(Range="bytes=0-9")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Sendfile"], self.served.file.path)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["ETag"], f'"{self.served.checksum}"')
+        self.assertEqual(response.content, b"")
+
+        with override_settings(MEDIA_ACCEL_HEADER="X-Accel-Redirect"):
+            response = self.get()
+        self.assertEqual(response["X-Accel-Redirect"], settings.MEDIA_ACCEL_PREFIX + self.served.file.name)
+        self.assertEqual(response.content, b"")
+
+        # Conditional requests are still answered by the app
+        with override_settings(MEDIA_ACCEL_HEADER="X-Sendfile"):
+            response = self.get(If_None_Match=f'"{self.served.checksum}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn("X-Sendfile", response)
+
+
+class ObjectStorageTest(SubmissionMixin, TestCase):
+    """Submissions kept in an S3-compatible store, here the in-process stand-in."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.store = ObjectStore()
+        cls.store.start()
+        cls.addClassCleanup(cls.store.stop)
+        super().setUpClass()
+
+    @classmethod
+    def overridden_settings(cls, media):
+        return {**super().overridden_settings(media), "STORAGES": {
+            **settings.STORAGES,
+            "submissions": {
+                "BACKEND": "coursework.storage.S3Storage",
+                "OPTIONS": cls.store.storage_options()}}}
+
+    def setUp(self):
+        self.store.objects.clear()
+        self.store.uploads.clear()
+        super().setUp()
+        self.client.force_login(self.student)
+
+    def direct_upload(self, content, name="report.txt"):
+        return self.client.post("/upload/direct", json.dumps({
+            "assignmentId": self.assignment.pk,
+            "fileName": name,
+            "fileSize": len(content)}),
+            content_type="application/json").json()
+
+    def send_part(self, session, index, content, checksum=None):
+        part = self.client.post(
+            f"/upload/direct/{session['session_id']}/part/{index}",
+            json.dumps({"checksum": checksum or hashlib.sha256(content).hexdigest()}),
+            content_type="application/json").json()
+        with urlopen(Request(part["url"], data=content, headers=part["headers"], method="PUT")) as response:
+            return response.status
+
+    def complete(self, session):
+        return self.client.post(f"/upload/direct/{session['session_id']}/complete")
+
+    def test_save_open(self):
+        name = submission_storage.save("folder/file.txt", ContentFile(b"0123456789" * 1000))
+        self.assertTrue(submission_storage.exists(name))
+        self.assertEqual(submission_storage.size(name), 10000)
+
+        # Reads seek through ranged requests
+        with submission_storage.open(name) as file:
+            file.seek(5003)
+            self.assertEqual(file.read(4), b"3456")
+            file.seek(-2, os.SEEK_END)
+            self.assertEqual(file.read(), b"89")
+
+        submission_storage.delete(name)
+        self.assertFalse(submission_storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            submission_storage.open(name)
+
+    def test_signatures(self):
+        submission_storage.save("file.txt", ContentFile(b"content"))
+        with urlopen(submission_storage.url("file.txt")) as response:
+            self.assertEqual(response.read(), b"content")
+
+        # Wrong key, expired or tampered URLs are refused
+        with self.assertRaises(ObjectStoreError):
+            S3Storage(**{**self.store.storage_options(), "secret_key": "wrong"}).size("file.txt")
+        for url in (
+                submission_storage.presigned_url("GET", "file.txt", expires=-1),
+                submission_storage.url("file.txt").replace("file.txt", "other.txt", 1)):
+            with self.assertRaises(HTTPError) as error:
+                urlopen(url)
+            self.assertEqual(error.exception.code, 403)
+
+    def test_download_redirect(self):
+        upload = self.upload(b"content", "report.txt")
+
+        # The browser is sent to the store, the bytes skip the app
+        response = self.client.get(f"/file/{upload.pk}")
+        self.assertEqual(response.status_code, 302)
+        with urlopen(response["Location"]) as download:
+            self.assertEqual(download.read(), b"content")
+            self.assertEqual(download.headers["Content-Disposition"], "inline; filename*=UTF-8''student.txt")
+
+    def test_direct_upload(self):
+        response = self.client.get(f"/coursework/{self.coursework.pk}/assignment/{self.assignment.pk}/submit")
+        self.assertContains(response, "data-direct-upload")
+
+        content = bytes(range(256)) * (MIN_PART_SIZE // 256) + b"end"
+        session = self.direct_upload(content)
+        self.assertEqual(session["chunk_size"], MIN_PART_SIZE)
+        self.assertEqual(self.client.post(
+            f"/upload/direct/{session['session_id']}/part/2",
+            json.dumps({"checksum": hashlib.sha256(b"").hexdigest()}),
+            content_type="application/json").status_code, 400)
+
+        # Nothing to assemble before the parts are in the store
+        response = self.complete(session)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["missing"], [0, 1])
+
+        # A part not matching its checksum is refused by the store
+        with self.assertRaises(HTTPError) as error:
+            self.send_part(session, 0, b"altered", hashlib.sha256(content[:MIN_PART_SIZE]).hexdigest())
+        self.assertEqual(error.exception.code, 400)
+
+        # Resumed from the parts the store holds
+        self.assertEqual(self.send_part(session, 0, content[:MIN_PART_SIZE]), 200)
+        response = self.client.get(f"/upload/direct/{session['session_id']}")
+        self.assertEqual(response.json(), {"chunk_size": MIN_PART_SIZE, "parts": [0]})
+
+        # Parts are listed page by page
+        self.assertEqual(self.send_part(session, 1, content[MIN_PART_SIZE:]), 200)
+        self.store.max_parts = 1
+        self.addCleanup(delattr, self.store, "max_parts")
+        response = self.client.get(f"/upload/direct/{session['session_id']}")
+        self.assertEqual(response.json()["parts"], [0, 1])
+
+        self.assertEqual(self.complete(session).status_code, 201)
+
+        upload_file = UploadFile.objects.select_related("blob").get(assignment=self.status)
+        self.assertEqual(upload_file.display_name, "student.txt")
+        self.assertEqual(upload_file.checksum, hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload_file.blob.ref_count, 1)
+        with upload_file.file.open("rb") as file:
+            self.assertEqual(file.read(), content)
+
+        # The staged object & session are gone
+        self.assertEqual([name for name in self.store.objects if name.startswith("uploads/")], [])
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_direct_upload_claim(self):
+        secret = self.upload(b"secret answer", "report.txt")
+        thief = User.objects.create_user("thief")
+        self.coursework.taken_person.add(thief)
+        AssignmentStatus.objects.create(assignment=self.assignment, student=thief)
+        self.client.force_login(thief)
+
+        # Knowing the size & hash of someone's content isn't enough to get it
+        session = self.direct_upload(b"secret answer")
+        self.assertEqual(self.complete(session).status_code, 400)
+
+        # What the store received is what gets attached
+        self.assertEqual(self.send_part(session, 0, b"guess answer!"), 200)
+        self.assertEqual(self.complete(session).status_code, 201)
+        upload = UploadFile.objects.get(assignment__student=thief)
+        self.assertNotEqual(upload.blob_id, secret.blob_id)
+        self.assertEqual(Blob.objects.get(pk=secret.blob_id).ref_count, 1)
+
+        # Sessions only work for their owner
+        session = self.direct_upload(b"content")
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(f"/upload/direct/{session['session_id']}").status_code, 404)
+        self.assertEqual(self.complete(session).status_code, 404)
+
+    def test_direct_upload_dedupe(self):
+        first = self.upload(b"content", "report.txt")
+        blobs = [name for name in self.store.objects if name.startswith("blobs/")]
+
+        # Content already stored is shared, not copied again
+        session = self.direct_upload(b"content", "notes.txt")
+        self.assertEqual(self.send_part(session, 0, b"content"), 200)
+        self.assertEqual(self.complete(session).status_code, 201)
+
+        self.assertEqual(Blob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertEqual([name for name in self.store.objects if name.startswith(("blobs/", "uploads/"))], blobs)
+
+    def test_direct_upload_abandoned(self):
+        session = self.direct_upload(b"content")
+        self.assertEqual(self.send_part(session, 0, b"content"), 200)
+
+        # Deleting the session aborts its multipart upload
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadSession.objects.all().delete()
+        self.assertEqual(self.store.uploads, {})
+
+    def test_direct_upload_local(self):
+        with override_settings(STORAGES={**settings.STORAGES, "submissions": {"BACKEND": "coursework.storage.LocalStorage"}}):
+            response = self.client.post("/upload/direct", json.dumps({
+                "assignmentId": self.assignment.pk,
+                "fileName": "report.txt",
+                "fileSize": 7}),
+                content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_archive(self):
+        kept = self.upload(b"kept " * 1000, "report.txt")
+        removed = self.upload(b"removed", "image.png")
+        sync_result_archive(self.assignment)
+        name = self.assignment.result_zip_file.name
+
+        # Removed members are dropped, the new archive replaces the old object
+        removed.delete()
+        self.upload(b"added", "notes.md")
+        sync_result_archive(self.assignment)
+
+        self.assertNotIn(name, self.store.objects)
+        with self.assignment.result_zip_file.open("rb") as archive, ZipFile(archive) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["student.txt", "student.md"])
+            self.assertEqual(zip_file.read("student.txt"), b"kept " * 1000)
+            self.assertEqual(zip_file.read("student.md"), b"added")
+            self.assertEqual(zip_file.getinfo("student.txt").comment, str(kept.pk).encode())
+            self.assertIsNone(zip_file.testzip())
+
+        # Nothing changed, nothing written
+        objects = dict(self.store.objects)
+        sync_result_archive(self.assignment)
+        self.assertEqual(self.store.objects, objects)
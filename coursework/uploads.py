@@ -0,0 +1,361 @@
+from .models import Blob, UploadFile, UploadSession, blob_path, submission_name
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+from .storage import submission_storage
+from django.core.files import File
+from contextvars import ContextVar
+from django.utils import timezone
+from django.conf import settings
+from collections import Counter
+from datetime import timedelta
+from django.db.models import F
+import tempfile
+import hashlib
+import zlib
+import os
+
+
+# Size of the pieces read from the request body
+READ_SIZE = 64 * 1024
+
+# Uploads deleted per transaction
+DELETE_BATCH_SIZE = 500
+
+# Set while delete_uploads releases the blobs of a batch itself
+releasing_batch = ContextVar("releasing_batch", default=False)
+
+
+class StagedFile(File):
+    """Fully received file, moved (not copied) into storage when saved."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """Uploaded file written in the staging directory, next to MEDIA_ROOT."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(
+            suffix=".upload", dir=settings.UPLOAD_STAGING_DIR)
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset, content_type_extra)
+        self.checksum = ""
+
+
+class SubmissionUploadHandler(FileUploadHandler):
+    """Stream submitted files once to disk, hashing them on the fly.
+
+    Only one chunk is held in memory and since the staged file sits on the
+    same disk as MEDIA_ROOT, saving it into storage is a rename, not a copy.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.checksum = self.hash.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+
+def store_blob(file, checksum, size):
+    """Return the blob holding `file`, writing its bytes only if new."""
+    try:
+        return Blob.objects.get(checksum=checksum)
+
+    except Blob.DoesNotExist:
+        blob = Blob(checksum=checksum, size=size)
+        blob.file.save(checksum, file, save=False)
+
+        # Someone stored the same content meanwhile, keep theirs
+        try:
+            with transaction.atomic():
+                blob.save()
+
+        except IntegrityError:
+            blob.file.delete(save=False)
+            blob = Blob.objects.get(checksum=checksum)
+
+        return blob
+
+
+def attach_upload(assignment_status, file, checksum, size):
+    """Add `file` to the assignment status through the content-addressed store.
+
+    Identical content is stored once and shared, the upload keeps its usual
+    <username>.<extension> name as `display_name`.
+    """
+    upload = UploadFile(
+        assignment=assignment_status,
+        checksum=checksum,
+        size=size)
+    upload.display_name = submission_name(assignment_status, file.name)
+
+    while True:
+        blob = store_blob(file, checksum, size)
+        if take_reference(upload, blob):
+            return upload
+
+
+def take_reference(upload, blob):
+    """Save the upload as a reference to blob, False if the blob was released in between."""
+    with transaction.atomic():
+        if Blob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1):
+            upload.blob = blob
+            upload.file = blob.file.name
+            upload.save()
+            return True
+    return False
+
+
+def stored_checksum(storage, name):
+    """SHA-256 of the stored file `name`, read where it lies."""
+    hash = hashlib.sha256()
+    with storage.open(name) as file:
+        for chunk in iter(lambda: file.read(READ_SIZE), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def attach_stored_upload(assignment_status, filename, staged_name, size):
+    """Add the content a client assembled in storage under `staged_name` itself.
+
+    Same as attach_upload without the bytes going through the app: the
+    staged object is hashed where it lies, then copied to its blob unless
+    the same content is already stored. The staged object is deleted,
+    returns None if it's missing or not `size` bytes long.
+    """
+    storage = submission_storage
+    try:
+        if storage.size(staged_name) != size:
+            storage.delete(staged_name)
+            return None
+    except FileNotFoundError:
+        return None
+
+    # Only what was actually received counts, never a checksum the client claims
+    checksum = stored_checksum(storage, staged_name)
+    upload = UploadFile(
+        assignment=assignment_status,
+        checksum=checksum,
+        size=size)
+    upload.display_name = submission_name(assignment_status, filename)
+
+    try:
+        while True:
+            try:
+                blob = Blob.objects.get(checksum=checksum)
+
+            except Blob.DoesNotExist:
+                blob = Blob(checksum=checksum, size=size)
+                blob.file.name = storage.copy(
+                    staged_name, storage.get_available_name(blob_path(blob, filename)))
+
+                # Someone stored the same content meanwhile, take theirs
+                try:
+                    with transaction.atomic():
+                        blob.save()
+                except IntegrityError:
+                    blob.file.delete(save=False)
+                    continue
+
+            if take_reference(upload, blob):
+                return upload
+
+    finally:
+        storage.delete(staged_name)
+
+
+def release_upload(upload):
+    """Release what a deleted upload held, run for every delete by a post_delete receiver.
+
+    Shared content goes away with its last reference only, files no longer
+    referenced are removed once the deletion is committed.
+    """
+    # The batch releases its blobs by itself
+    if releasing_batch.get():
+        return
+
+    if upload.blob_id is None:
+        files = [upload.file, upload.preview]
+    elif upload.blob.release():
+        files = [upload.preview]
+    else:
+        return
+
+    def delete_files():
+        for field_file in files:
+            field_file.delete(save=False)
+
+    transaction.on_commit(delete_files)
+
+
+def delete_uploads(uploads, batch_size=DELETE_BATCH_SIZE):
+    """Delete a queryset of uploads in batches, releasing their blobs.
+
+    Does what release_upload() does with a few queries per batch instead
+    of a few per upload, files no longer referenced are removed once their
+    batch is committed. Returns the number of uploads deleted.
+    """
+    deleted = 0
+    last_id = 0
+
+    while batch := list(
+            uploads.filter(id__gt=last_id)
+            .select_related(None)
+            .order_by("id")
+            .only("id", "blob", "file", "preview")[:batch_size]):
+        last_id = batch[-1].id
+
+        with transaction.atomic():
+            token = releasing_batch.set(True)
+            try:
+                UploadFile.objects.filter(pk__in=[upload.pk for upload in batch]).delete()
+            finally:
+                releasing_batch.reset(token)
+
+            # Same blob referenced n times in the batch loses n references at once
+            references = Counter(upload.blob_id for upload in batch if upload.blob_id)
+            for count in set(references.values()):
+                Blob.objects.filter(
+                    pk__in=[blob_id for blob_id, n in references.items() if n == count]
+                ).update(ref_count=F("ref_count") - count)
+
+            released = list(Blob.objects.filter(pk__in=references, ref_count=0))
+            Blob.objects.filter(pk__in=[blob.pk for blob in released]).delete()
+
+        # Shared content goes away with its last reference only
+        released_ids = {blob.pk for blob in released}
+        for blob in released:
+            blob.file.delete(save=False)
+        for upload in batch:
+            if upload.blob_id is None:
+                upload.file.delete(save=False)
+            if upload.blob_id is None or upload.blob_id in released_ids:
+                upload.preview.delete(save=False)
+
+        deleted += len(batch)
+
+    return deleted
+
+
+def delete_statuses(statuses, batch_size=DELETE_BATCH_SIZE):
+    """Delete a queryset of assignment statuses with their uploads & upload sessions."""
+    deleted = delete_uploads(UploadFile.objects.filter(assignment__in=statuses), batch_size)
+
+    # Few sessions are left to cascade, their staged files go with them
+    statuses.delete()
+    return deleted
+
+
+def session_cutoff():
+    """Creation time before which upload sessions have expired."""
+    return timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRES)
+
+
+def remove_staging_file(upload_session):
+    """Remove the staged file of a deleted upload session once the deletion is committed.
+
+    Direct uploads have their multipart upload aborted & staged object deleted.
+    """
+    # Deleted instances lose their primary key, the names are taken beforehand
+    staging_path = upload_session.staging_path
+    staging_name = upload_session.staging_name
+    upload_id = upload_session.upload_id
+
+    def remove():
+        try:
+            os.remove(staging_path)
+        except FileNotFoundError:
+            pass
+
+    def remove_direct():
+        # Abandoned parts are also swept by the bucket's lifecycle rule
+        try:
+            submission_storage.abort_multipart(staging_name, upload_id)
+            submission_storage.delete(staging_name)
+        except OSError:
+            pass
+
+    transaction.on_commit(remove_direct if upload_id else remove)
+
+
+def expire_upload_sessions():
+    """Delete the expired upload sessions & whatever is left in the staging directory from before.
+
+    Returns the number of sessions deleted.
+    """
+    cutoff = session_cutoff()
+    _, deleted = UploadSession.objects.filter(created_on__lt=cutoff).delete()
+
+    # Staged files of live sessions are younger, the rest is left over by crashes
+    try:
+        entries = list(os.scandir(settings.UPLOAD_STAGING_DIR))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        if entry.is_file() and entry.stat().st_mtime < cutoff.timestamp():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    return deleted.get(UploadSession._meta.label, 0)
+
+
+def file_checksum(path):
+    """SHA-256 of the file at `path`."""
+    hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(READ_SIZE), b""):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def create_staging_file(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def write_chunk(path, offset, stream, length):
+    """Write up to `length` bytes of `stream` at `offset` of the staged file.
+
+    Anything past the chunk is cut off, so a retried chunk simply overwrites
+    the previous attempt. Returns the CRC-32 & number of bytes written.
+    """
+    crc = 0
+    written = 0
+
+    with open(path, "r+b") as staged:
+        staged.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+            staged.write(data)
+            written += len(data)
+        staged.truncate()
+
+    return crc, written
+
+
+def discard_chunk(path, offset):
+    """Cut the staged file back to the last verified chunk."""
+    with open(path, "r+b") as staged:
+        staged.truncate(offset)
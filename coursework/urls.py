@@ -1,5 +1,3 @@
-from django.conf.urls.static import static
-from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -10,6 +8,8 @@ urlpatterns = [
     path("activate/<uidb64>/<token>",
          views.activate_user, name="activate_user"),
     path("assignment/result", views.assignment_result, name="assignment_result"),
+    path("assignment/<int:assignment_id>/download",
+         views.download_assignment_files, name="download_assignment_files"),
     path("coursework/<int:coursework_id>",
          views.coursework_view, name="coursework_view"),
     path("coursework/<int:coursework_id>/assignment/<int:assignment_id>/submit",
@@ -24,24 +24,45 @@ urlpatterns = [
          views.join_coursework, name="join_coursework"),
     path("coursework/request",
          views.request_coursework, name="request_coursework"),
+    path("file/<int:file_id>",
+         views.serve_upload_file, name="serve_upload_file"),
+    path("file/<int:file_id>/preview",
+         views.serve_upload_file, {"preview": True}, name="serve_upload_preview"),
+    path("metrics",
+         views.metrics, name="metrics"),
     path("login",
          views.login_view, name="login"),
     path("logout",
          views.logout_view, name="logout"),
+    path("password/<uidb64>/<token>",
+         views.SetPasswordView.as_view(), name="set_password"),
     path("register",
          views.register, name="register"),
 
     # Below are API Route
     path("coursework/request/count",
          views.count_coursework_request, name="count_coursework_request"),
+    path("coursework/request/stream",
+         views.stream_coursework_request, name="stream_coursework_request"),
     path("delete/file",
          views.delete_file, name="delete_file"),
     path("edit/memo",
          views.edit_memo, name="edit_memo"),
+    path("upload/direct",
+         views.create_direct_upload, name="create_direct_upload"),
+    path("upload/direct/<uuid:session_id>",
+         views.direct_upload, name="direct_upload"),
+    path("upload/direct/<uuid:session_id>/complete",
+         views.complete_direct_upload, name="complete_direct_upload"),
+    path("upload/direct/<uuid:session_id>/part/<int:index>",
+         views.direct_upload_part, name="direct_upload_part"),
     path("upload/file",
-         views.upload_file, name="upload_file")]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT)
+         views.upload_file, name="upload_file"),
+    path("upload/session",
+         views.create_upload_session, name="create_upload_session"),
+    path("upload/session/<uuid:session_id>",
+         views.upload_session, name="upload_session"),
+    path("upload/session/<uuid:session_id>/chunk/<int:index>",
+         views.upload_chunk, name="upload_chunk"),
+    path("upload/session/<uuid:session_id>/finalize",
+         views.finalize_upload_session, name="finalize_upload_session")]
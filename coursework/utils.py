@@ -1,5 +1,10 @@
 # Reference: https://stackoverflow.com/questions/55005070/how-to-send-email-verification-link-in-django
-from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.contrib.auth.tokens import PasswordResetTokenGenerator, default_token_generator
+from django.template.loader import render_to_string
+from django.utils.http import urlsafe_base64_encode
+from django.utils.encoding import force_bytes
+from django.core.mail import EmailMessage
+from django.conf import settings
 import six
 
 
@@ -9,3 +14,18 @@ class TokenGenerator(PasswordResetTokenGenerator):
 
 
 generate_token = TokenGenerator()
+
+
+def activation_email(user, domain, set_password=False):
+    """Verification email of user, a one-time link to choose a password for provisioned accounts."""
+    token_generator = default_token_generator if set_password else generate_token
+    return EmailMessage(
+        subject="Activate your SEA account",
+        body=render_to_string("coursework/activate.html", {
+            "user": user,
+            "domain": domain,
+            "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+            "token": token_generator.make_token(user),
+            "set_password": set_password}),
+        from_email=settings.EMAIL_FROM_USER,
+        to=[user.email])
@@ -1,25 +1,36 @@
-from .models import Assignment, AssignmentStatus, Course, Coursework, JoinCourseworkRequest, StudentList, UploadFile, User
-from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from .uploads import StagedFile, SubmissionUploadHandler, attach_stored_upload, attach_upload, create_staging_file, discard_chunk, file_checksum, session_cutoff, write_chunk
+from .models import Assignment, AssignmentStatus, Course, Coursework, JoinCourseworkRequest, StudentList, UploadFile, UploadSession, User
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, StreamingHttpResponse
+from .notifications import arequest_count, arequest_count_events, request_count_events
+from .storage import MAX_PARTS, MIN_PART_SIZE, ObjectStoreError, submission_storage
+from .archive import assignment_files, stream_zip, sync_result_archive
+from django.contrib.auth.views import PasswordResetConfirmView
+from .join_requests import pending_requests, resolve_requests
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.sites.shortcuts import get_current_site
-from django.http import HttpResponse, HttpResponseRedirect
 from django.contrib.auth.decorators import login_required
-from django.utils.encoding import force_bytes, force_str
+from .membership import is_member, user_coursework_ids
 from django.views.decorators.csrf import csrf_exempt
-from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
-from zipfile import ZIP_DEFLATED, ZipFile
-from django.http import JsonResponse
-from django.db import IntegrityError
+from django.utils.http import urlsafe_base64_decode
+from .utils import activation_email, generate_token
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import Http404, JsonResponse
+from django.urls import reverse, reverse_lazy
+from .results import build_assignment_result
+from django.utils.encoding import force_str
+from .provisioning import student_email
+from asgiref.sync import sync_to_async
+from .audio import schedule_analysis
 from django.contrib import messages
 from django.shortcuts import render
-from django.core.files import File
-from .utils import generate_token
+from .metrics import render_metrics
 from django.conf import settings
-from django.urls import reverse
-from pathlib import Path
-import threading
+from .serving import serve_file
+from urllib.parse import quote
+from .mail import dispatcher
 import json
+import re
 import os
 
 
@@ -27,32 +38,18 @@ import os
 def index(request):
     # Return all coursework assignments that user has joined in
     return render(request, "coursework/index.html", {
-        "assignments": Assignment.objects.filter(coursework__taken_person=request.user)})
-
-
-class EmailThread(threading.Thread):
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
-
-    def run(self):  # Send email
-        self.email.send()
+        "assignments": Assignment.objects
+        .filter(coursework__in=user_coursework_ids(request.user))
+        .select_related("coursework__course")
+        .with_expiry()})
 
 
 # Reference: https://stackoverflow.com/questions/55005070/how-to-send-email-verification-link-in-django
 def send_activate_email(request, user):
-    # Declare email content
-    email = EmailMessage(
-        subject="Activate your SEA account",
-        body=render_to_string("coursework/activate.html", {
-            "user": user,
-            "domain": get_current_site(request),
-            "uid": urlsafe_base64_encode(force_bytes(user.pk)),
-            "token": generate_token.make_token(user)}),
-        from_email=settings.EMAIL_FROM_USER,
-        to=[user.email])
+    email = activation_email(user, get_current_site(request).domain)
 
-    EmailThread(email).start()  # Send email via thread
+    # Send email via the dispatcher, at most once per cooldown for a user
+    dispatcher.send(email, key=f"activate-{user.pk}")
 
 
 # Reference: https://stackoverflow.com/questions/55005070/how-to-send-email-verification-link-in-django
@@ -81,6 +78,21 @@ def activate_user(request, uidb64, token):
         return HttpResponse("Something went wrong, please contact teaching assistant.")
 
 
+class SetPasswordView(PasswordResetConfirmView):
+    """Provisioned students choose their password through the emailed one-time link.
+
+    Coming from the school address, the link also verifies the email.
+    """
+
+    template_name = "coursework/set_password.html"
+    success_url = reverse_lazy("login")
+
+    def form_valid(self, form):
+        form.user.is_email_verified = True
+        messages.success(self.request, "Password set, you can now login!")
+        return super().form_valid(form)
+
+
 def login_view(request):
     # Prevent login again
     if request.user.is_authenticated:
@@ -154,7 +166,7 @@ def register(request):
         try:
             user = User.objects.create_user(
                 student_id,
-                f"{student_id}@itd.tnnua.edu.tw",
+                student_email(student_id),
                 password)
             user.first_name = student.first_name
             user.last_name = student.last_name
@@ -231,10 +243,8 @@ def join_coursework(request):
             messages.warning(request, "You didn't select any coursework!")
             return HttpResponseRedirect(reverse("join_coursework"))
 
-        taken_person = coursework.taken_person
-
         # Remind user if already join coursework
-        if user in taken_person.all():
+        if is_member(user, coursework.id):
             messages.warning(
                 request,
                 f"You have already joined coursework <strong>{coursework}</strong>!")
@@ -242,18 +252,10 @@ def join_coursework(request):
 
         # User request join coursework
         else:
-            # Try query for request
-            try:
-                JoinCourseworkRequest.objects.get(
-                    student=user,
-                    coursework=coursework)
-
-            # User 1st time request
-            except JoinCourseworkRequest.DoesNotExist:
-                JoinCourseworkRequest.objects.create(
-                    student=user,
-                    coursework=coursework
-                ).save()
+            # Created on 1st request only, even when submitted twice at once
+            JoinCourseworkRequest.objects.get_or_create(
+                student=user,
+                coursework=coursework)
 
             messages.info(
                 request,
@@ -263,7 +265,7 @@ def join_coursework(request):
     # User access join coursework page
     else:
         return render(request, "coursework/join_coursework.html", {
-            "courseworks": Coursework.objects.all()})
+            "courseworks": Coursework.objects.select_related("course")})
 
 
 @login_required
@@ -271,38 +273,40 @@ def request_coursework(request):
     # Only TA & teacher can access this page
     if request.user.status != "Student":
         if request.method == "POST":
-            # For use later
-            request_coursework = JoinCourseworkRequest.objects.get(
-                pk=request.POST["request-id"])
-
-            student = request_coursework.student
-            student_name = f"{student.last_name}{student.first_name}({student.username})"
-            coursework_name = request_coursework.coursework.__str__()
-
-            # Accept request
-            if request.POST["request-action"] == "Accept":
-                # Add student to coursework
-                request_coursework.coursework.taken_person.add(student)
-
-                # Delete request
-                request_coursework.delete()
+            # Accept or decline every selected request at once
+            accept = request.POST.get("request-action") == "Accept"
+            resolved = resolve_requests(
+                request.user,
+                [int(request_id) for request_id in request.POST.getlist("request-id") if request_id.isdigit()],
+                accept)
+
+            if not resolved:
+                messages.warning(request, "You didn't select any request!")
+
+            elif len(resolved) == 1:
+                student = resolved[0].student
+                student_name = f"{student.last_name}{student.first_name}({student.username})"
                 messages.success(
                     request,
-                    f"Accept <strong>{student_name}</strong>'s request to join <strong>{coursework_name}</strong>.")
+                    f"{'Accept' if accept else 'Decline'} <strong>{student_name}</strong>'s request to join <strong>{resolved[0].coursework}</strong>.")
 
-            # Decline request
             else:
-                request_coursework.delete()
-                messages.warning(
+                messages.success(
                     request,
-                    f"Decline <strong>{student_name}</strong>'s request to join <strong>{coursework_name}</strong>.")
+                    f"{'Accept' if accept else 'Decline'} <strong>{len(resolved)}</strong> requests.")
 
             return HttpResponseRedirect(reverse("request_coursework"))
 
         # User access approve request page
         else:
+            after = request.GET.get("after", "")
+            coursework_requests, next_after = pending_requests(
+                request.user,
+                int(after) if after.isdigit() else None)
             return render(request, "coursework/request_coursework.html", {
-                "coursework_requests": JoinCourseworkRequest.objects.all()})
+                "coursework_requests": coursework_requests,
+                "next_after": next_after,
+                "paginated": after.isdigit()})
 
     # Prevent student access
     else:
@@ -313,22 +317,35 @@ def request_coursework(request):
 # API
 @csrf_exempt
 @login_required
-def count_coursework_request(request):
+async def count_coursework_request(request):
     if request.method == "GET":
         return JsonResponse({
-            "request_count": int(JoinCourseworkRequest.objects.all().count())},
+            "request_count": await arequest_count(await request.auser())},
             status=201)
 
 
+# API
 @login_required
-def coursework_view(request, coursework_id):
-    # For user later
-    coursework = Coursework.objects.get(pk=int(coursework_id))
+async def stream_coursework_request(request):
+    # Push the request count to the page whenever it changes under ASGI,
+    # under WSGI send it once so no thread is held
+    user = await request.auser()
+    response = StreamingHttpResponse(
+        arequest_count_events(user) if isinstance(request, ASGIRequest) else request_count_events(user),
+        content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 
+@login_required
+def coursework_view(request, coursework_id):
     # Make sure user have join coursework
-    if request.user in coursework.taken_person.all():
+    if is_member(request.user, coursework_id):
+        coursework = Coursework.objects.select_related("course").get(pk=int(coursework_id))
         return render(request, "coursework/coursework_view.html", {
-            "coursework": coursework})
+            "coursework": coursework,
+            "assignments": coursework.assignment.with_expiry()})
 
     # Remind & redirect to index if user haven't join coursework
     else:
@@ -370,11 +387,8 @@ def create_assignment(request, coursework_id):
 
 def user_in_coursework(user, coursework_id, assignment):
     """User & assignment must be model object."""
-    # For use later
-    coursework = Coursework.objects.get(pk=int(coursework_id))
-
     # Return boolean
-    return True if user in coursework.taken_person.all() and assignment.coursework == coursework else False
+    return assignment.coursework_id == int(coursework_id) and is_member(user, coursework_id)
 
 
 @login_required
@@ -385,23 +399,17 @@ def submit_assignment(request, coursework_id, assignment_id):
 
     # Make sure user have join coursework
     if user_in_coursework(user, coursework_id, assignment) and not assignment.is_expired:
-        # Try get the assignment status
-        try:
-            assignment_status = AssignmentStatus.objects.get(
-                assignment=assignment,
-                student=user)
-
-        # User 1st time submit
-        except AssignmentStatus.DoesNotExist:
-            assignment_status = AssignmentStatus.objects.create(
-                assignment=assignment,
-                student=user)
+        # Created on 1st visit only, even when opened twice at once
+        assignment_status, _ = AssignmentStatus.objects.get_or_create(
+            assignment=assignment,
+            student=user)
 
         # User access manage file page
         if request.method == "GET":
             return render(request, "coursework/submit_assignment.html", {
                 "assignment_status": assignment_status,
-                "upload_file": UploadFile.objects.filter(assignment=assignment_status)})
+                "upload_file": UploadFile.objects.filter(assignment=assignment_status),
+                "direct_upload": submission_storage.direct_upload})
 
     # Remind & redirect to index if user haven't join coursework
     else:
@@ -409,10 +417,43 @@ def submit_assignment(request, coursework_id, assignment_id):
         return HttpResponseRedirect(reverse("index"))
 
 
+@login_required
+def serve_upload_file(request, file_id, preview=False):
+    # For use later
+    user = request.user
+
+    try:
+        upload = UploadFile.objects.select_related("assignment__assignment").get(pk=int(file_id))
+
+    except UploadFile.DoesNotExist:
+        raise Http404("File not found.")
+
+    # Students see their own files, teacher & TA the files of their coursework
+    assignment = upload.assignment.assignment
+    if upload.assignment.student_id == user.id or (
+            user.status != "Student" and user_in_coursework(user, assignment.coursework_id, assignment)):
+        # Lightweight version of a WAV file
+        if preview:
+            if not upload.preview:
+                raise Http404("Preview not available.")
+            return serve_file(
+                request,
+                upload.preview,
+                f"preview-{os.path.basename(upload.display_name)}")
+
+        return serve_file(
+            request,
+            upload.file,
+            os.path.basename(upload.display_name or upload.file.name),
+            etag=upload.checksum or None)
+
+    raise Http404("File not found.")
+
+
 # API
 @csrf_exempt
 @login_required
-def delete_file(request):
+async def delete_file(request):
     # Delete file must be via POST
     if request.method != "POST":
         return JsonResponse({
@@ -424,16 +465,16 @@ def delete_file(request):
 
     # Query for request file
     try:
-        file = UploadFile.objects.get(pk=int(file_id))
+        file = await UploadFile.objects.select_related("blob").aget(pk=int(file_id))
 
     except UploadFile.DoesNotExist:
         return JsonResponse({
             "error": "File not found."},
             status=400)
 
-    # Delete file and return message
+    # Delete file and return message, storage is blocking so it runs in a thread
     try:
-        file.delete()
+        await sync_to_async(file.delete)()
         return JsonResponse({
             "message": "Delete successfully!"},
             status=201)
@@ -447,25 +488,32 @@ def delete_file(request):
 # API
 @csrf_exempt
 @login_required
-def upload_file(request):
+async def upload_file(request):
     # Upload file must be via POST
     if request.method != "POST":
         return JsonResponse({
             "error": "POST request required."},
             status=400)
 
+    # Stream the file straight to disk while hashing it, off the event loop.
+    # Under ASGI Django has already spooled the whole body, so it's written twice:
+    # the page sends files through upload sessions instead
+    request.upload_handlers = [SubmissionUploadHandler(request)]
+    post, files = await sync_to_async(
+        lambda: (request.POST, request.FILES),
+        thread_sensitive=False)()
+
     # Query for the assignment status
     try:
-        assignment_status = AssignmentStatus.objects.get(
-            assignment=Assignment.objects.get(pk=request.POST["assignmentId"]),
-            student=User.objects.get(pk=request.POST["studentId"]))
+        assignment_status = await AssignmentStatus.objects.select_related("assignment", "student").aget(
+            assignment=post["assignmentId"],
+            student=post["studentId"])
 
         # Upload file if find status
         if not assignment_status.assignment.is_expired:
-            UploadFile.objects.create(
-                assignment=assignment_status,
-                file=request.FILES["file"]
-            ).save()
+            file = files["file"]
+            schedule_analysis(await sync_to_async(attach_upload)(
+                assignment_status, file, file.checksum, file.size))
 
             return JsonResponse({
                 "message": "Upload successfully!"},
@@ -485,7 +533,440 @@ def upload_file(request):
 # API
 @csrf_exempt
 @login_required
-def edit_memo(request):
+def create_direct_upload(request):
+    # Create direct upload must be via POST
+    if request.method != "POST":
+        return JsonResponse({
+            "error": "POST request required."},
+            status=400)
+
+    # Local storage receives files through the app only
+    if not submission_storage.direct_upload:
+        return JsonResponse({
+            "error": "Direct upload not available."},
+            status=404)
+
+    # Get the file description from the api
+    data = json.loads(request.body)
+
+    # Query for the assignment status of user
+    try:
+        assignment_status = AssignmentStatus.objects.select_related("assignment").get(
+            assignment=int(data.get("assignmentId", "")),
+            student=request.user)
+        file_name = os.path.basename(str(data["fileName"]))
+        file_size = int(data["fileSize"])
+
+    except (AssignmentStatus.DoesNotExist, KeyError, ValueError):
+        return JsonResponse({
+            "error": "Something went wrong!"},
+            status=400)
+
+    if assignment_status.assignment.is_expired:
+        return JsonResponse({
+            "error": "Assignment expired!"},
+            status=400)
+
+    if not file_name or file_size < 0:
+        return JsonResponse({
+            "error": "Invalid file."},
+            status=400)
+
+    if file_size > settings.UPLOAD_MAX_SIZE:
+        return JsonResponse({
+            "error": "File too large."},
+            status=400)
+
+    # Unfinished uploads expire, meanwhile each holds storage space
+    if assignment_status.upload_session.filter(
+            created_on__gte=session_cutoff()).count() >= settings.UPLOAD_SESSION_LIMIT:
+        return JsonResponse({
+            "error": "Too many unfinished uploads."},
+            status=429)
+
+    # Parts are big enough for the store & few enough for any file size
+    upload_session = UploadSession(
+        assignment=assignment_status,
+        file_name=file_name,
+        file_size=file_size,
+        chunk_size=max(settings.UPLOAD_CHUNK_SIZE, MIN_PART_SIZE, -(-file_size // MAX_PARTS)))
+
+    # The client only ever writes to the session's own staging object
+    upload_session.upload_id = submission_storage.create_multipart(upload_session.staging_name)
+    upload_session.save()
+
+    return JsonResponse({
+        "session_id": upload_session.id,
+        "chunk_size": upload_session.chunk_size,
+        "parts": []},
+        status=201)
+
+
+def received_parts(upload_session):
+    """Parts of a direct upload the store holds at their expected size, by part number."""
+    parts = {}
+    for part in submission_storage.list_parts(upload_session.staging_name, upload_session.upload_id):
+        offset = (part["number"] - 1) * upload_session.chunk_size
+        if part["number"] <= upload_session.part_count and part["size"] == min(
+                upload_session.chunk_size, upload_session.file_size - offset):
+            parts[part["number"]] = part
+    return parts
+
+
+# API
+@csrf_exempt
+@login_required
+def direct_upload(request, session_id):
+    # Query direct upload must be via GET
+    if request.method != "GET":
+        return JsonResponse({
+            "error": "GET request required."},
+            status=400)
+
+    upload_session = get_upload_session(request.user, session_id, direct=True)
+    if upload_session is None:
+        return JsonResponse({
+            "error": "Upload session not found."},
+            status=404)
+
+    # Return the parts the client doesn't need to send again
+    try:
+        parts = received_parts(upload_session)
+
+    except FileNotFoundError:
+        return JsonResponse({
+            "error": "Upload session not found."},
+            status=404)
+
+    return JsonResponse({
+        "chunk_size": upload_session.chunk_size,
+        "parts": [number - 1 for number in sorted(parts)]})
+
+
+# API
+@csrf_exempt
+@login_required
+def direct_upload_part(request, session_id, index):
+    # Sign part upload must be via POST
+    if request.method != "POST":
+        return JsonResponse({
+            "error": "POST request required."},
+            status=400)
+
+    upload_session = get_upload_session(request.user, session_id, direct=True)
+    if upload_session is None:
+        return JsonResponse({
+            "error": "Upload session not found."},
+            status=404)
+
+    if upload_session.assignment.assignment.is_expired:
+        return JsonResponse({
+            "error": "Assignment expired!"},
+            status=400)
+
+    # Every part carries its SHA-256, checked by the store
+    checksum = str(json.loads(request.body).get("checksum", "")).lower()
+    if index >= upload_session.part_count or not re.fullmatch(r"[0-9a-f]{64}", checksum):
+        return JsonResponse({
+            "error": "Invalid part."},
+            status=400)
+
+    url, headers = submission_storage.part_url(
+        upload_session.staging_name, upload_session.upload_id, index + 1, checksum)
+
+    return JsonResponse({
+        "url": url,
+        "headers": headers})
+
+
+# API
+@csrf_exempt
+@login_required
+def complete_direct_upload(request, session_id):
+    # Complete direct upload must be via POST
+    if request.method != "POST":
+        return JsonResponse({
+            "error": "POST request required."},
+            status=400)
+
+    upload_session = get_upload_session(request.user, session_id, direct=True)
+    if upload_session is None:
+        return JsonResponse({
+            "error": "Upload session not found."},
+            status=404)
+
+    if upload_session.assignment.assignment.is_expired:
+        return JsonResponse({
+            "error": "Assignment expired!"},
+            status=400)
+
+    # Every part must have been received, then the store assembles them
+    try:
+        parts = received_parts(upload_session)
+        missing = [
+            index for index in range(upload_session.part_count)
+            if index + 1 not in parts]
+        if not missing:
+            submission_storage.complete_multipart(
+                upload_session.staging_name,
+                upload_session.upload_id,
+                [parts[number] for number in sorted(parts)])
+
+    except (FileNotFoundError, ObjectStoreError):
+        missing = None
+
+    if missing is None or missing:
+        return JsonResponse({
+            "error": "Upload incomplete.",
+            "missing": missing or []},
+            status=400)
+
+    # Hash the assembled object & store it unless the same content is already there
+    upload = attach_stored_upload(
+        upload_session.assignment,
+        upload_session.file_name,
+        upload_session.staging_name,
+        upload_session.file_size)
+    upload_session.delete()
+    if upload is None:
+        return JsonResponse({
+            "error": "Upload not received."},
+            status=400)
+    schedule_analysis(upload)
+
+    return JsonResponse({
+        "message": "Upload successfully!"},
+        status=201)
+
+
+def get_upload_session(user, session_id, direct=False, lock=False):
+    """Return the upload session (direct or chunked) if it belongs to user, None otherwise.
+
+    With `lock` its row stays locked until the surrounding transaction ends.
+    """
+    sessions = UploadSession.objects.select_related("assignment__assignment", "assignment__student")
+    sessions = sessions.exclude(upload_id="") if direct else sessions.filter(upload_id="")
+    if lock:
+        sessions = sessions.select_for_update(of=("self",))
+
+    try:
+        return sessions.get(
+            pk=session_id,
+            assignment__student=user,
+            created_on__gte=session_cutoff())
+
+    except UploadSession.DoesNotExist:
+        return None
+
+
+# API
+@csrf_exempt
+@login_required
+def create_upload_session(request):
+    # Create upload session must be via POST
+    if request.method != "POST":
+        return JsonResponse({
+            "error": "POST request required."},
+            status=400)
+
+    # Get the file description from the api
+    data = json.loads(request.body)
+
+    # Query for the assignment status of user
+    try:
+        assignment_status = AssignmentStatus.objects.select_related("assignment").get(
+            assignment=int(data.get("assignmentId", "")),
+            student=request.user)
+        file_name = os.path.basename(str(data["fileName"]))
+        file_size = int(data["fileSize"])
+
+    except (AssignmentStatus.DoesNotExist, KeyError, ValueError):
+        return JsonResponse({
+            "error": "Something went wrong!"},
+            status=400)
+
+    if assignment_status.assignment.is_expired:
+        return JsonResponse({
+            "error": "Assignment expired!"},
+            status=400)
+
+    # Client may ask for smaller chunks, never bigger ones
+    try:
+        chunk_size = min(
+            int(data.get("chunkSize") or settings.UPLOAD_CHUNK_SIZE),
+            settings.UPLOAD_CHUNK_SIZE)
+
+    except ValueError:
+        chunk_size = settings.UPLOAD_CHUNK_SIZE
+
+    if not file_name or file_size < 0 or chunk_size < 1:
+        return JsonResponse({
+            "error": "Invalid file."},
+            status=400)
+
+    if file_size > settings.UPLOAD_MAX_SIZE:
+        return JsonResponse({
+            "error": "File too large."},
+            status=400)
+
+    # Unfinished uploads expire, meanwhile each holds disk space
+    if assignment_status.upload_session.filter(
+            created_on__gte=session_cutoff()).count() >= settings.UPLOAD_SESSION_LIMIT:
+        return JsonResponse({
+            "error": "Too many unfinished uploads."},
+            status=429)
+
+    # Create session & its empty staging file
+    upload_session = UploadSession.objects.create(
+        assignment=assignment_status,
+        file_name=file_name,
+        file_size=file_size,
+        chunk_size=chunk_size)
+    create_staging_file(upload_session.staging_path)
+
+    return JsonResponse({
+        "session_id": upload_session.id,
+        "chunk_size": upload_session.chunk_size,
+        "offset": upload_session.received},
+        status=201)
+
+
+# API
+@csrf_exempt
+@login_required
+def upload_session(request, session_id):
+    # Query upload session must be via GET
+    if request.method != "GET":
+        return JsonResponse({
+            "error": "GET request required."},
+            status=400)
+
+    upload_session = get_upload_session(request.user, session_id)
+    if upload_session is None:
+        return JsonResponse({
+            "error": "Upload session not found."},
+            status=404)
+
+    # Return where the client should resume
+    return JsonResponse({
+        "chunk_size": upload_session.chunk_size,
+        "offset": upload_session.received,
+        "next_chunk": upload_session.next_chunk})
+
+
+# API
+@csrf_exempt
+@login_required
+async def upload_chunk(request, session_id, index):
+    # Upload chunk must be via PUT
+    if request.method != "PUT":
+        return JsonResponse({
+            "error": "PUT request required."},
+            status=400)
+
+    try:
+        upload_session = await UploadSession.objects.select_related("assignment__assignment").aget(
+            pk=session_id,
+            assignment__student=await request.auser(),
+            created_on__gte=session_cutoff(),
+            upload_id="")
+
+    except UploadSession.DoesNotExist:
+        return JsonResponse({
+            "error": "Upload session not found."},
+            status=404)
+
+    if upload_session.assignment.assignment.is_expired:
+        return JsonResponse({
+            "error": "Assignment expired!"},
+            status=400)
+
+    # Chunks must arrive in order, tell the client where to resume
+    offset = upload_session.received
+    if index != upload_session.next_chunk or offset >= upload_session.file_size:
+        return JsonResponse({
+            "error": "Unexpected chunk.",
+            "offset": offset},
+            status=409)
+
+    # Every chunk is full size except the last one & carries its CRC-32
+    length = min(upload_session.chunk_size, upload_session.file_size - offset)
+    checksum = request.headers.get("X-Chunk-Checksum", "").lower()
+    if int(request.META.get("CONTENT_LENGTH") or 0) != length or not checksum:
+        return JsonResponse({
+            "error": "Invalid chunk.",
+            "offset": offset},
+            status=400)
+
+    # Write chunk & verify it before accepting it, file writes run in a thread
+    crc, written = await sync_to_async(write_chunk, thread_sensitive=False)(
+        upload_session.staging_path, offset, request, length)
+    if written != length or f"{crc:08x}" != checksum:
+        await sync_to_async(discard_chunk, thread_sensitive=False)(upload_session.staging_path, offset)
+        return JsonResponse({
+            "error": "Chunk checksum mismatch.",
+            "offset": offset},
+            status=400)
+
+    # Only move the offset if no concurrent request already did
+    await UploadSession.objects.filter(
+        pk=upload_session.pk,
+        received=offset
+    ).aupdate(received=offset + length)
+
+    return JsonResponse({
+        "offset": offset + length})
+
+
+# API
+@csrf_exempt
+@login_required
+def finalize_upload_session(request, session_id):
+    # Finalize upload session must be via POST
+    if request.method != "POST":
+        return JsonResponse({
+            "error": "POST request required."},
+            status=400)
+
+    # Session locked until attached & deleted, a retried finalize waits then finds it gone
+    with transaction.atomic():
+        upload_session = get_upload_session(request.user, session_id, lock=True)
+        if upload_session is None:
+            return JsonResponse({
+                "error": "Upload session not found."},
+                status=404)
+
+        if upload_session.assignment.assignment.is_expired:
+            return JsonResponse({
+                "error": "Assignment expired!"},
+                status=400)
+
+        # Every byte must have been received
+        if upload_session.received != upload_session.file_size:
+            return JsonResponse({
+                "error": "Upload incomplete.",
+                "offset": upload_session.received},
+                status=400)
+
+        # Move the staged file into storage unless the same content is already there
+        with open(upload_session.staging_path, "rb") as staged:
+            upload = attach_upload(
+                upload_session.assignment,
+                StagedFile(staged, name=upload_session.file_name),
+                file_checksum(upload_session.staging_path),
+                upload_session.file_size)
+        upload_session.delete()
+    schedule_analysis(upload)
+
+    return JsonResponse({
+        "message": "Upload successfully!"},
+        status=201)
+
+
+# API
+@csrf_exempt
+@login_required
+async def edit_memo(request):
     # Edit memo must be via POST
     if request.method != "POST":
         return JsonResponse({
@@ -499,7 +980,7 @@ def edit_memo(request):
 
     # Query for request assignment status
     try:
-        assignment_status = AssignmentStatus.objects.get(
+        assignment_status = await AssignmentStatus.objects.aget(
             pk=int(assignment_status_id))
 
     except AssignmentStatus.DoesNotExist:
@@ -510,7 +991,7 @@ def edit_memo(request):
     # Update memo
     try:
         assignment_status.memo = new_memo
-        assignment_status.save()
+        await assignment_status.asave()
 
         return JsonResponse({
             "message": "Edit successfully!"},
@@ -551,28 +1032,34 @@ def view_submit_result(request, coursework_id, assignment_id):
         return HttpResponseRedirect(reverse("index"))
 
 
-def create_zip_file(assignment):
-    # Create path and zip file name
-    folder_name = f"{assignment.coursework}_{assignment}_{assignment.deadline.strftime('%Y%m%d')}"
-    zip_file_name = f"{folder_name}.zip"
-
-    # Compress zip file
-    with ZipFile(zip_file_name, "w", compression=ZIP_DEFLATED) as zip_file:
-        os.chdir(os.path.join(settings.MEDIA_ROOT, folder_name))
-        for file in os.listdir():
-            if file.endswith(".ptx"):
-                zip_file.write(file)
+@login_required
+def download_assignment_files(request, assignment_id):
+    # For use later
+    user = request.user
+    assignment = Assignment.objects.get(pk=int(assignment_id))
 
-    # Add that zip file to assignment
-    path = Path(zip_file_name)
-    os.chdir("../..")
+    # Only teacher & TA of the coursework can download
+    if user.status != "Student" and user_in_coursework(user, assignment.coursework_id, assignment):
+        # Submissions are final after deadline, serve the managed archive
+        if assignment.is_expired:
+            sync_result_archive(assignment)
+            return serve_file(
+                request,
+                assignment.result_zip_file,
+                f"{assignment.coursework}_{assignment}.zip",
+                as_attachment=True)
 
-    with path.open(mode="rb") as result_zip:
-        assignment.result_zip_file = File(result_zip, name=path.name)
-        assignment.save()
+        # Otherwise build the archive on the fly
+        response = StreamingHttpResponse(
+            stream_zip(assignment_files(assignment)),
+            content_type="application/zip")
+        response["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(f'{assignment.coursework}_{assignment}.zip')}"
+        return response
 
-    # Delete zip file after add to assignment
-    os.remove(zip_file_name)
+    # Showing error message & redirect to index
+    else:
+        messages.error(request, "Something went wrong!")
+        return HttpResponseRedirect(reverse("index"))
 
 
 @login_required
@@ -581,34 +1068,29 @@ def assignment_result(request):
     if request.user.status != "Student" and request.method == "POST":
         # For use later
         assignment = Assignment.objects.get(pk=request.POST["assignment-id"])
-        assignment_status = AssignmentStatus.objects.filter(
-            assignment=assignment)
-        files = UploadFile.objects.filter(assignment__in=assignment_status)
+        result = build_assignment_result(assignment)
 
-        # Create result zip file if doesn't exist
-        if files and assignment.result_zip_file == "":
-            create_zip_file(assignment)
-
-        # Get the list of students who have submited the memo
-        student_who_submit_memo = []
-        for submitted in assignment_status:
-            if submitted.memo:
-                student_who_submit_memo.append(submitted.student)
-
-        # Get the list of students who have uploaded file
-        student_who_upload_file = []
-        for file in files:
-            student_who_upload_file.append(file.assignment.student)
+        # Refresh the result zip file with the changed submissions, once they are final
+        if assignment.is_expired and (result["uploads"] or assignment.result_zip_file):
+            sync_result_archive(assignment)
 
         # Render page
         return render(request, "coursework/assignment_result.html", {
-            "coursework": Coursework.objects.get(pk=request.POST["coursework-id"]),
             "assignments": assignment,
-            "assignment_status": assignment_status,
-            "student_who_submit_memo": student_who_submit_memo,
-            "student_who_upload_file": student_who_upload_file})
+            "result_rows": result["rows"],
+            "submitted_memos": result["memos"],
+            "submitted_files": result["uploads"]})
 
     # Showing error message & redirect to index
     else:
         messages.error(request, "Something went wrong!")
         return HttpResponseRedirect(reverse("index"))
+
+
+# API
+def metrics(request):
+    # Scraped from the allowed addresses, or looked at by staff
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")